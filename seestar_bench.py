@@ -0,0 +1,1179 @@
+"""Benchmarks for the hot paths of the SeeStar tools.
+
+SIMBAD and the telescope are replaced by local stand-ins: targets are
+resolved from a pre-filled offline SimbadResolver and commands go to a
+seestar_emul.SeestarEmulator, so every benchmark runs without a network.
+
+Run a benchmark by name, or all of them, for example:
+    python seestar_bench.py frames --capture seestar_capture.dat
+    python seestar_bench.py --save baseline.json all
+    python seestar_bench.py --baseline baseline.json --tolerance 0.25 all
+
+--save writes the results as JSON. --baseline compares the results with a
+saved run, reports every metric that got worse by more than the tolerance
+and exits with status 1 if there was any.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import csv
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+import seestar_run
+import seestar_slew
+import seestar_timing
+
+# the site of demo_targets.dat
+LATITUDE = "-35:36:00"
+LONGITUDE = "149:01:45"
+OBS_PARAMS = {
+    "Latitude": LATITUDE,
+    "Longitude": LONGITUDE,
+    "Elevation": "600",
+    "Timezone": "Australia/Sydney",
+}
+# a short and a long night at the site
+NIGHTS = {
+    "summer": datetime.date(2026, 12, 21),
+    "winter": datetime.date(2026, 6, 21),
+}
+
+# the metrics of this run, by name: {"value": float, "better": "lower" or "higher"}
+results = {}
+
+
+def record(name, value, better="lower"):
+    """Keep a metric of this run for --save and --baseline."""
+    results[name] = {"value": float(value), "better": better}
+
+
+def timed(fn, *args, runs=1, **kwargs):
+    """
+    Returns:
+        tuple: The result of the last of the runs and the best time in seconds.
+    """
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def make_frames(count=200, payload_size=1024 * 60):
+    """
+    Make a stream of large SeeStar messages like the comet data replies,
+    with multi-byte characters so that reads split them.
+    Returns:
+        bytes: The messages, each ending with CRLF.
+    """
+    frames = []
+    for i in range(count):
+        message = {
+            "jsonrpc": "2.0",
+            "Timestamp": f"{i}.0",
+            "method": "get_comet_data",
+            "result": {"names": "Hale–Bopp °" * (payload_size // 14)},
+            "code": 0,
+            "id": i,
+        }
+        frames.append(json.dumps(message, ensure_ascii=False))
+        frames.append(json.dumps({"Event": "PiStatus", "temp": 35.2}))
+    return ("\r\n".join(frames) + "\r\n").encode("utf-8")
+
+
+def split_string_stream(stream, read_size):
+    """The framing used before FrameBuffer: decode each read and re-slice a str."""
+    count = 0
+    msg_remainder = ""
+    for i in range(0, len(stream), read_size):
+        msg_remainder += stream[i : i + read_size].decode("utf-8", "replace")
+        first_index = msg_remainder.find("\r\n")
+        while first_index >= 0:
+            json.loads(msg_remainder[0:first_index])
+            msg_remainder = msg_remainder[first_index + 2 :]
+            count += 1
+            first_index = msg_remainder.find("\r\n")
+    return count
+
+
+def split_frame_buffer(stream, read_size):
+    count = 0
+    framer = seestar_run.FrameBuffer()
+    view = memoryview(stream)
+    for i in range(0, len(stream), read_size):
+        framer.feed(view[i : i + read_size])
+        for frame in framer.frames():
+            json.loads(frame)
+            count += 1
+    return count
+
+
+def bench_frames(args):
+    """Replay a captured (or generated) event stream through both framers."""
+    if args.capture:
+        with open(args.capture, "rb") as f:
+            stream = f.read()
+    else:
+        stream = make_frames(args.count)
+    megabytes = len(stream) / 1024 / 1024
+    print(f"Replaying {megabytes:.1f} MB in {args.read_size} byte reads")
+    for name, fn in (
+        ("str_remainder", split_string_stream),
+        ("frame_buffer", split_frame_buffer),
+    ):
+        count, elapsed = timed(fn, stream, args.read_size, runs=3)
+        record(f"frames.{name}.mb_per_s", megabytes / elapsed, "higher")
+        print(
+            f"  {name:15s} {count:6d} frames {elapsed:8.3f} s {megabytes / elapsed:8.1f} MB/s"
+        )
+
+
+def bench_coords(args):
+    """Time the sexagesimal RA and Dec conversions of seestar_run."""
+    ras = [
+        f"{h:02d}:{m:02d}:{s:04.1f}"
+        for h in range(24)
+        for m in range(60)
+        for s in (0, 30.5)
+    ]
+    decs = [
+        f"{d:+03d}:{m:02d}:{s:04.1f}"
+        for d in range(-89, 90, 3)
+        for m in range(60)
+        for s in (0, 30.5)
+    ]
+    for name, fn, values in (
+        ("parse_ra_to_float", seestar_run.parse_ra_to_float, ras),
+        ("parse_dec_to_float", seestar_run.parse_dec_to_float, decs),
+    ):
+        _, elapsed = timed(lambda: [fn(v) for v in values], runs=5)
+        per_call = elapsed / len(values)
+        record(f"coords.{name}.s_per_call", per_call)
+        print(f"  {name:20s} {per_call * 1e6:8.3f} us per call")
+
+
+def random_targets(count, seed=1):
+    """Uniformly spread targets on the sky, in degrees."""
+    rng = np.random.default_rng(seed)
+    ra = rng.uniform(0, 360, count)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, count)))
+    return ra, dec
+
+
+def write_manifest(path, count, seed=1, repeat=False):
+    """
+    Write a synthetic manifest in the demo_targets.dat format, and cache the
+    coordinates of its targets in an offline resolver next to it.
+    Returns:
+        SimbadResolver: The resolver that knows every target of the manifest.
+    """
+    import seestar_resolver
+
+    ra, dec = random_targets(count, seed)
+    rng = np.random.default_rng(seed)
+    exposures = rng.choice([300, 600, 1200, 1800, 3600], count)
+    names = [f"BENCH {i}" for i in range(count)]
+    with open(path, "w") as f:
+        f.write("Observatory\n")
+        for key, value in OBS_PARAMS.items():
+            f.write(f"{key}:    {value}\n")
+        f.write("\nConfig\n")
+        f.write("Wait_For_Twilight:    False\n")
+        f.write("Start_Up_Sequence:    False\n")
+        f.write(f"Repeat_Targets:       {repeat}\n")
+        f.write("\nTargets\nName, ExpTime, TotalExp, Pause\n")
+        for name, exposure in zip(names, exposures):
+            f.write(f"{name},   10,  {exposure},  30\n")
+    resolver = seestar_resolver.SimbadResolver(
+        os.path.join(os.path.dirname(path), "simbad_cache.db"), offline=True
+    )
+    resolver.store({name: (r, d) for name, r, d in zip(names, ra, dec)})
+    return resolver
+
+
+@contextlib.contextmanager
+def scratch_directory():
+    """Run in a temporary directory, where the tools write their output files."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(cwd)
+
+
+def bench_manifest(args):
+    """Time manifest parsing and read_targets, SIMBAD answered from the cache."""
+    import seestar_manifest
+    import seestar_schedule
+
+    with scratch_directory() as directory:
+        for count in args.counts:
+            path = os.path.join(directory, f"targets_{count}.dat")
+            resolver = write_manifest(path, count)
+            _, parse = timed(seestar_manifest.read_manifest, path, runs=3)
+            _, elapsed = timed(seestar_schedule.read_targets, path, resolver, runs=3)
+            resolver.close()
+            record(f"manifest.{count}.read_manifest_s", parse)
+            record(f"manifest.{count}.read_targets_s", elapsed)
+            print(
+                f"  {count:6d} targets read_manifest {parse:8.3f} s "
+                f"read_targets {elapsed:8.3f} s"
+            )
+
+
+def bench_schedule(args):
+    """Time create_schedule by target count on a short and a long night."""
+    import seestar_schedule
+
+    with scratch_directory() as directory:
+        for count in args.counts:
+            path = os.path.join(directory, f"targets_{count}.dat")
+            resolver = write_manifest(path, count)
+            for night_name, night in NIGHTS.items():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    _, elapsed = timed(
+                        seestar_schedule.create_schedule,
+                        path,
+                        resolver,
+                        night=night,
+                    )
+                with open("schedule.json") as f:
+                    items = len(json.load(f)["list"])
+                record(f"schedule.{count}.{night_name}.create_schedule_s", elapsed)
+                print(
+                    f"  {count:6d} targets {night_name} night {items:5d} items "
+                    f"create_schedule {elapsed:8.3f} s"
+                )
+            resolver.close()
+
+
+def schedule_items(path):
+    """The items of a schedule file without their random ids."""
+    with open(path) as f:
+        items = json.load(f)["list"]
+    for item in items:
+        item.pop("schedule_item_id")
+    return items
+
+
+def bench_campaign(args):
+    """
+    Time planning a run of nights in one process and in the process pool,
+    checking that both write the same schedules.
+    """
+    import seestar_campaign
+
+    first_night = NIGHTS["winter"]
+    with scratch_directory() as directory:
+        for count in args.counts:
+            path = os.path.join(directory, f"targets_{count}.dat")
+            resolver = write_manifest(path, count, repeat=True)
+            elapsed = {}
+            for name, workers in (("serial", 1), ("pool", args.workers)):
+                _, elapsed[name] = timed(
+                    seestar_campaign.plan_campaign,
+                    path,
+                    first_night,
+                    args.nights,
+                    resolver,
+                    directory=name,
+                    workers=workers,
+                    compact=True,
+                    runs=1,
+                )
+                record(f"campaign.{count}.{name}_s", elapsed[name])
+            resolver.close()
+            for night in os.listdir("serial"):
+                if night.startswith("schedule_"):
+                    serial, pool = (
+                        schedule_items(os.path.join(name, night))
+                        for name in ("serial", "pool")
+                    )
+                    if serial != pool:
+                        raise RuntimeError(f"{night} differs between serial and pool")
+            print(
+                f"  {count:6d} targets {args.nights:3d} nights serial "
+                f"{elapsed['serial']:7.2f} s, pool {elapsed['pool']:7.2f} s "
+                f"({elapsed['serial'] / elapsed['pool']:4.1f}x)"
+            )
+
+
+def bench_export(args):
+    """
+    Time the schedule.json export of a ScheduleTable against the nested dicts
+    and json.dumps it replaced, checking that both write the same text.
+    """
+    import pytz
+    import seestar_schedule_table
+
+    tz = pytz.timezone(OBS_PARAMS["Timezone"])
+    start = datetime.datetime(2026, 6, 1, 8, 0, tzinfo=datetime.timezone.utc)
+    for count in args.counts:
+        names = np.array([f"BENCH {i}" for i in range(count)], dtype=object)
+        coords = np.array(["12:34:56.7"] * count, dtype=object)
+        table = seestar_schedule_table.ScheduleTable(
+            names,
+            coords,
+            coords,
+            np.full(count, 10),
+            np.full(count, 600),
+            np.full(count, 30),
+            tz,
+        )
+        table.append("wait_until", start=start.timestamp())
+        table.append("start_up_sequence", start=start.timestamp())
+        for i in range(count):
+            table.add_target(i, start.timestamp() + 630 * i)
+        ids = [f"item-{i}" for i in range(len(table))]
+
+        def nested_dicts():
+            schedule = {
+                "version": 1.0,
+                "Event": "Scheduler",
+                "schedule_id": "schedule",
+                "list": [
+                    table.item_dict(row, item_id)
+                    for row, item_id in zip(table.items, ids)
+                ],
+                "state": "stopped",
+                "is_stacking_paused": False,
+                "is_stacking": False,
+                "is_skip_requested": False,
+                "current_item_id": "",
+                "item_number": 0,
+            }
+            return schedule
+
+        for compact in (False, True):
+            mode = "compact" if compact else "indent"
+            if compact:
+                dumps = lambda schedule: json.dumps(schedule, separators=(",", ":"))
+            else:
+                dumps = lambda schedule: json.dumps(schedule, indent=4)
+            expected, dicts = timed(lambda: dumps(nested_dicts()), runs=3)
+
+            def export():
+                f = io.StringIO()
+                table.write_json(f, compact, "schedule", iter(ids))
+                return f.getvalue()
+
+            text, streamed = timed(export, runs=3)
+            if text != expected:
+                raise RuntimeError(f"{mode} export of {count} targets differs")
+            # peak memory of writing to a file, where nothing has to be kept
+            with open(os.devnull, "w") as f:
+                tracemalloc.start()
+                table.write_json(f, compact, "schedule", iter(ids))
+                streamed_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                tracemalloc.start()
+                f.write(dumps(nested_dicts()))
+                dicts_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            record(f"export.{count}.{mode}.write_json_s", streamed)
+            record(f"export.{count}.{mode}.write_json_peak_mb", streamed_peak / 1e6)
+            print(
+                f"  {count:6d} targets {mode:7s} {len(text) / 1e6:7.2f} MB: "
+                f"write_json {streamed:7.3f} s {streamed_peak / 1e6:7.2f} MB peak, "
+                f"dicts and json.dumps {dicts:7.3f} s {dicts_peak / 1e6:7.2f} MB peak"
+            )
+
+
+def bench_visibility(args):
+    """Time the whole-night visibility grid against one pyephem lookup per target."""
+    import ephem
+    import seestar_visibility
+
+    start = datetime.datetime(2026, 6, 1, 8, 0, tzinfo=datetime.timezone.utc)
+    end = start + datetime.timedelta(hours=args.hours)
+    for count in args.counts:
+        ra, dec = random_targets(count)
+        grid, build = timed(
+            seestar_visibility.VisibilityGrid,
+            ra,
+            dec,
+            LATITUDE,
+            LONGITUDE,
+            start,
+            end,
+            args.step,
+        )
+        t0 = time.perf_counter()
+        for i in range(count):
+            grid.altaz(i, start)
+        lookup = time.perf_counter() - t0
+
+        # the old way: an observer and a body for every target lookup
+        sample = min(count, 1000)
+        t0 = time.perf_counter()
+        for i in range(sample):
+            obs = ephem.Observer()
+            obs.lat = LATITUDE
+            obs.long = LONGITUDE
+            obs.date = start
+            target = ephem.FixedBody()
+            target._ra = np.radians(ra[i])
+            target._dec = np.radians(dec[i])
+            target.compute(obs)
+        pyephem = (time.perf_counter() - t0) * count / sample
+        record(f"visibility.{count}.grid_s", build)
+        record(f"visibility.{count}.lookups_s", lookup)
+        print(
+            f"  {count:6d} targets x {len(grid.times):4d} times: grid {build:7.3f} s, "
+            f"{count} lookups {lookup:7.3f} s, pyephem one pass {pyephem:7.3f} s"
+        )
+
+
+def bench_planner(args):
+    """Compare the scheduled science time and solve time of the solvers."""
+    import seestar_planner
+    import seestar_visibility
+
+    start = datetime.datetime(2026, 6, 1, 8, 0, tzinfo=datetime.timezone.utc)
+    end = start + datetime.timedelta(hours=args.hours)
+    rng = np.random.default_rng(2)
+    for count in args.counts:
+        ra, dec = random_targets(count)
+        exposures = rng.choice([300, 600, 1200, 1800, 3600], count).astype(float)
+        pauses = np.full(count, 30.0)
+        grid = seestar_visibility.VisibilityGrid(
+            ra, dec, LATITUDE, LONGITUDE, start, end
+        )
+        for name, solver in seestar_planner.SOLVERS.items():
+            plan, elapsed = timed(solver, grid, exposures, pauses, repeat=args.repeat)
+            total = seestar_planner.science_time(plan, exposures)
+            useful = seestar_planner.science_time(plan, exposures, grid)
+            # replanning half way through the night after half the visits
+            replanner = seestar_planner.Replanner(
+                grid, exposures, pauses, repeat=args.repeat, solver=name
+            )
+            for target, _ in plan[: len(plan) // 2]:
+                replanner.completed(target)
+            _, replan = timed(
+                replanner.replan, grid.times[len(grid.times) // 2], runs=3
+            )
+            record(f"planner.{count}.{name}.solve_s", elapsed)
+            record(f"planner.{count}.{name}.replan_s", replan)
+            record(f"planner.{count}.{name}.useful_h", useful / 3600, "higher")
+            slew = seestar_slew.plan_slew_time(plan, ra, dec)
+            record(f"planner.{count}.{name}.slew_min", slew / 60)
+            print(
+                f"  {count:6d} targets {name:7s} {len(plan):4d} visits "
+                f"{total / 3600:6.2f} h open, {useful / 3600:6.2f} h above "
+                f"{seestar_planner.MIN_ALTITUDE} deg, {slew / 60:5.1f} min slewing, "
+                f"solve {elapsed:7.3f} s, replan {replan:7.3f} s"
+            )
+
+
+def bench_cadence(args):
+    """
+    Plan a night of variables wanted at different cadences with the cadence
+    dispatcher and with repeat slot planning, and compare how often each
+    target came back with how often it was wanted.
+    """
+    import seestar_planner
+    import seestar_visibility
+
+    start = datetime.datetime(2026, 6, 1, 8, 0, tzinfo=datetime.timezone.utc)
+    end = start + datetime.timedelta(hours=args.hours)
+    rng = np.random.default_rng(5)
+    ra, dec = random_targets(args.targets)
+    grid = seestar_visibility.VisibilityGrid(ra, dec, LATITUDE, LONGITUDE, start, end)
+    exposures = rng.choice([120.0, 300.0, 600.0], args.targets)
+    pauses = np.full(args.targets, 30.0)
+    cadences = rng.choice([20.0, 60.0, 120.0, np.nan], args.targets) * 60
+    cadences = np.where(np.isnan(cadences), seestar_planner.NIGHTLY, cadences)
+    priorities = rng.integers(0, 3, args.targets)
+    for name, solver, options in (
+        ("slot", seestar_planner.slot_plan, {}),
+        ("cadence", seestar_planner.cadence_plan, {"cadences": cadences}),
+    ):
+        plan, elapsed = timed(
+            solver, grid, exposures, pauses, priorities, True, **options
+        )
+        times = [[] for _ in range(args.targets)]
+        for target, when in plan:
+            times[target].append(when)
+        rows = seestar_planner.cadence_report(range(args.targets), times, cadences)
+        on_time = np.nanmean([row["on_time"] for row in rows])
+        # a nightly target seen more than once took time from the others
+        extra = sum(
+            row["visits"] - 1
+            for row, cadence in zip(rows, cadences)
+            if cadence >= seestar_planner.NIGHTLY and row["visits"] > 1
+        )
+        record(f"cadence.{name}.on_time", on_time, "higher")
+        record(f"cadence.{name}.solve_ms", elapsed * 1000)
+        print(
+            f"  {args.targets} targets {name:8s} {len(plan):4d} visits, "
+            f"{on_time:4.0%} of revisits on time, {extra:3d} extra nightly visits, "
+            f"{elapsed / max(len(plan), 1) * 1e6:6.0f} us per visit"
+        )
+
+
+def bench_slew(args):
+    """
+    Time the nearest neighbour and 2-opt ordering of large target lists and
+    the slew time it saves against the manifest order.
+    """
+    model = seestar_slew.SlewModel()
+    for count in args.counts:
+        ra, dec = random_targets(count)
+        order, elapsed = timed(seestar_slew.order_targets, ra, dec)
+        angles = seestar_slew.separation_matrix(ra, dec)
+        manifest = seestar_slew.path_length(np.arange(count), angles)
+        ordered = seestar_slew.path_length(order, angles)
+        if sorted(order) != list(range(count)):
+            raise RuntimeError(f"The order of {count} targets is not a permutation")
+        # the overhead of each goto is the same in either order
+        saved = (manifest - ordered) / model.rate
+        record(f"slew.{count}.order_s", elapsed)
+        record(f"slew.{count}.saved_h", saved / 3600, "higher")
+        print(
+            f"  {count:6d} targets ordered in {elapsed:7.3f} s, "
+            f"{manifest:9.0f} deg in manifest order, {ordered:8.0f} deg ordered, "
+            f"{saved / 3600:6.2f} h of slewing saved"
+        )
+
+
+@contextlib.contextmanager
+def emulated_seestar(**kwargs):
+    """Serve a SeestarEmulator from a background thread for the duration."""
+    import seestar_emul
+
+    loop = asyncio.new_event_loop()
+    emulator = seestar_emul.SeestarEmulator(port=0, **kwargs)
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(emulator.start(), loop).result()
+    try:
+        yield emulator
+    finally:
+        asyncio.run_coroutine_threadsafe(emulator.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def bench_commands(args):
+    """Time the per-target command overhead against the emulator, without waits."""
+    settle_time = seestar_run.SETTLE_TIME
+    seestar_run.SETTLE_TIME = 0
+    try:
+        with emulated_seestar(
+            slew_time=0, settle_time=0
+        ) as emulator, scratch_directory():
+            # a new connection for every target, as the subprocess mode does
+            def connect_and_close():
+                session = seestar_run.SeestarSession("127.0.0.1", emulator.port)
+                session.connect()
+                session.close()
+
+            _, connect = timed(connect_and_close, runs=args.count)
+            record("commands.connect_s", connect)
+            print(f"  connect and close        {connect * 1000:8.2f} ms")
+
+            with seestar_run.SeestarSession("127.0.0.1", emulator.port) as session:
+                _, observe = timed(
+                    session.observe, "BENCH", 10.0, -20.0, 10, 0, runs=args.count
+                )
+                _, coord = timed(session.get_equ_coord, runs=args.count)
+                link = session.health.stats()
+            record("commands.observe_s", observe)
+            record("commands.get_equ_coord_s", coord)
+            record("commands.rtt_p50_s", link["p50"])
+            record("commands.rtt_p99_s", link["p99"])
+            print(f"  observe over one session {observe * 1000:8.2f} ms")
+            print(f"  get_equ_coord round trip {coord * 1000:8.2f} ms")
+            print(
+                f"  matched reply rtt        {link['p50'] * 1000:8.2f} ms p50 "
+                f"{link['p99'] * 1000:8.2f} ms p99 over {link['count']} replies"
+            )
+    finally:
+        seestar_run.SETTLE_TIME = settle_time
+
+    # the interpreter start and imports paid by every seestar_run.py subprocess
+    _, spawn = timed(
+        subprocess.run,
+        [sys.executable, "-c", "import seestar_run"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        check=True,
+        runs=3,
+    )
+    record("commands.subprocess_start_s", spawn)
+    print(f"  seestar_run subprocess   {spawn * 1000:8.2f} ms")
+
+
+def bench_reconnect(args):
+    """
+    Observe targets on an emulator that drops the connection at random and
+    time how long each reconnect and resync takes. Every target must still
+    be observed.
+    """
+    saved = seestar_run.SETTLE_TIME, seestar_run.RECONNECT_BASE
+    seestar_run.SETTLE_TIME = 0
+    seestar_run.RECONNECT_BASE = 0.05
+    try:
+        with emulated_seestar(
+            slew_time=0.2,
+            settle_time=0.1,
+            disconnect_rate=args.disconnect_rate,
+            seed=1,
+        ) as emulator, scratch_directory():
+            session = seestar_run.SeestarSession(
+                "127.0.0.1", emulator.port, idle_interval=0.2, stall_timeout=5
+            )
+            session.connect()
+            failed = 0
+            start = time.perf_counter()
+            try:
+                for i in range(args.count):
+                    try:
+                        session.observe(f"BENCH {i}", 10.0 + i, -20.0, 1, 1)
+                    except Exception:
+                        failed += 1
+            finally:
+                session.close()
+            elapsed = time.perf_counter() - start
+    finally:
+        seestar_run.SETTLE_TIME, seestar_run.RECONNECT_BASE = saved
+    recoveries = sorted(session.recovery_times) or [0.0]
+    p50 = recoveries[len(recoveries) // 2]
+    record("reconnect.recovery_p50_s", p50)
+    record("reconnect.recovery_max_s", recoveries[-1])
+    # the share of the run spent stacking, from the spans of every target
+    summary = seestar_timing.night_summary(session.timing.spans)
+    record("reconnect.open_shutter_efficiency", summary["efficiency"])
+    print(
+        f"  {args.count} targets in {elapsed:6.2f} s, {len(session.recovery_times)} "
+        f"reconnects, recovery p50 {p50 * 1000:7.1f} ms max "
+        f"{recoveries[-1] * 1000:7.1f} ms, {failed} failed, open-shutter "
+        f"efficiency {summary['efficiency']:.1%}"
+    )
+    if failed:
+        raise RuntimeError(f"{failed} targets failed over a dropping link")
+
+
+def bench_retrieval(args):
+    """
+    Copy frames from the HTTP stand-in with the worker pool, then check that
+    an interrupted copy resumes, that a corrupt copy is caught, and that the
+    bandwidth limit holds.
+    """
+    import seestar_frames
+
+    size = args.frame_kb * 1024
+    with scratch_directory() as directory:
+        source = os.path.join(directory, "unit", "BENCH_sub")
+        os.makedirs(source)
+        rng = np.random.default_rng(1)
+        for i in range(args.count):
+            with open(os.path.join(source, f"Light_BENCH_{i:04d}.fit"), "wb") as f:
+                f.write(rng.bytes(size))
+        server = seestar_frames.FrameServer(os.path.join(directory, "unit"))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            http = seestar_frames.HttpSource(server.url)
+            for workers in args.workers:
+                destination = f"copy_{workers}"
+                with seestar_frames.FrameRetriever(
+                    http, destination, workers, bandwidth=None
+                ) as retriever:
+                    start = time.perf_counter()
+                    retriever.retrieve("BENCH")
+                    retriever.wait()
+                    elapsed = time.perf_counter() - start
+                rate = args.count * size / elapsed
+                record(f"retrieval.{workers}_workers_mb_s", rate / 1e6, "higher")
+                print(
+                    f"  {args.count} frames of {args.frame_kb} kB, {workers} workers "
+                    f"{rate / 1e6:8.1f} MB/s"
+                )
+
+            # a copy cut short resumes from its .part, a corrupt one is redone
+            destination = os.path.join("copy_1", "BENCH_sub")
+            first, second = sorted(os.listdir(source))[:2]
+            with open(os.path.join(source, first), "rb") as f:
+                head = f.read(size // 2)
+            os.remove(os.path.join(destination, first))
+            with open(os.path.join(destination, first + ".part"), "wb") as f:
+                f.write(head)
+            os.remove(os.path.join(destination, second))
+            with open(os.path.join(destination, second + ".part"), "wb") as f:
+                f.write(b"\0" * (size // 2))
+            with seestar_frames.FrameRetriever(http, "copy_1") as retriever:
+                retriever.retrieve("BENCH")
+            stats = retriever.stats()
+            for name in (first, second):
+                if seestar_frames.file_sha256(
+                    os.path.join(destination, name)
+                ) != seestar_frames.file_sha256(os.path.join(source, name)):
+                    raise RuntimeError(f"{name} differs after resuming")
+            # half of the first, then half and all of the corrupt second
+            if stats["copied"] != 2 or stats["failed"] or stats["bytes"] > 2 * size:
+                raise RuntimeError(f"Resume copied more than it had to: {stats}")
+            print(
+                f"  resumed a cut and a corrupt frame with "
+                f"{stats['bytes'] / 1024:.0f} kB"
+            )
+
+            # the limit holds over all workers together
+            limit = args.bandwidth_kb * 1024
+            with seestar_frames.FrameRetriever(
+                http, "limited", max(args.workers), bandwidth=limit
+            ) as retriever:
+                start = time.perf_counter()
+                retriever.retrieve("BENCH")
+            rate = retriever.stats()["bytes"] / (time.perf_counter() - start)
+            record("retrieval.limited_rate_ratio", rate / limit)
+            print(f"  limited to {limit / 1e6:.2f} MB/s, got {rate / 1e6:.2f} MB/s")
+            if rate > 1.1 * limit:
+                raise RuntimeError("The bandwidth limit was exceeded")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def synthetic_field(rng, stars, x, y, jitter, height=1920, width=1080, sky=500.0):
+    """
+    A sub with Gaussian stars of the given instrumental magnitudes on a noisy
+    sky, stored as unsigned 16-bit like the S50 subs.
+    """
+    data = rng.normal(sky, 10.0, (height, width))
+    rows, cols = np.mgrid[-12:13, -12:13]
+    for mag, cx, cy in zip(stars, x + jitter[0], y + jitter[1]):
+        flux = 10 ** (-0.4 * (mag - 25.0))
+        r0, c0 = int(cy), int(cx)
+        profile = np.exp(
+            -((rows + r0 - cy) ** 2 + (cols + c0 - cx) ** 2) / (2 * 1.8**2)
+        )
+        data[r0 - 12 : r0 + 13, c0 - 12 : c0 + 13] += flux * profile / profile.sum()
+    return np.clip(data, 0, 65535).astype(np.uint16)
+
+
+def bench_photometry(args):
+    """
+    Measure synthetic subs with and without a WCS as they are added, then
+    check the light curve against the magnitudes the target was given.
+    """
+    from astropy.io import fits
+    from astropy.wcs import WCS
+
+    import seestar_photometry
+
+    rng = np.random.default_rng(2)
+    wcs = WCS(naxis=2)
+    wcs.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+    wcs.wcs.crval = [150.0, -30.0]
+    wcs.wcs.crpix = [540.0, 960.0]
+    wcs.wcs.cdelt = [-2.4 / 3600, 2.4 / 3600]
+    x = np.array([540.0, 300.0, 800.0, 200.0, 900.0, 600.0])
+    y = np.array([960.0, 400.0, 500.0, 1500.0, 1400.0, 1700.0])
+    ra, dec = wcs.all_pix2world(x, y, 0)
+    roles = ["target", "check", "comp", "comp", "comp", "comp"]
+    catalogue = np.array([np.nan, 11.0, 10.5, 11.5, 12.0, 10.8])
+    stars = seestar_photometry.StarSet(ra, dec, catalogue, roles, x=x, y=y)
+    truth = 11.0 + 0.5 * np.sin(np.arange(args.count) / 3)
+    with scratch_directory() as directory:
+        for name, header in (("wcs", wcs.to_header()), ("tracked", fits.Header())):
+            folder = os.path.join(directory, name)
+            os.makedirs(folder)
+            pipeline = seestar_photometry.PhotometryPipeline({name: stars}, "lc")
+            elapsed = 0.0
+            for i in range(args.count):
+                mags = np.append(truth[i], catalogue[1:])
+                jitter = rng.normal(0, 1.5, 2)
+                frame = fits.PrimaryHDU(
+                    synthetic_field(rng, mags, x, y, jitter), header=header.copy()
+                )
+                frame.header["DATE-OBS"] = (
+                    f"2026-10-17T12:{i // 6:02d}:{i % 6 * 10:02d}"
+                )
+                frame.header["EXPTIME"] = 10.0
+                path = os.path.join(folder, f"Light_{name}_{i:04d}.fit")
+                frame.writeto(path)
+                start = time.perf_counter()
+                pipeline.submit(name, path).result()
+                elapsed += time.perf_counter() - start
+            pipeline.close()
+            with open(pipeline.lightcurve_file(name)) as f:
+                rows = list(csv.DictReader(f))
+            mags = np.array([float(row["mag"]) for row in rows])
+            rms = np.sqrt(np.mean((mags - truth) ** 2))
+            record(f"photometry.{name}_ms_per_frame", elapsed / args.count * 1000)
+            record(f"photometry.{name}_rms_mag", rms)
+            print(
+                f"  {args.count} subs, {name:8s} {elapsed / args.count * 1000:6.1f} ms "
+                f"per sub, {rms:.4f} mag rms"
+            )
+            if len(rows) != args.count or rms > 0.02:
+                raise RuntimeError(f"The {name} light curve is off by {rms:.3f} mag")
+            # a restart measures nothing twice
+            again = seestar_photometry.PhotometryPipeline({name: stars}, "lc")
+            if again.process_folder(name, folder):
+                raise RuntimeError(
+                    "Frames already in the light curve were measured again"
+                )
+            again.close()
+
+
+def bench_catalog(args):
+    """
+    Ingest a random all-sky star list, then time single cone searches and
+    the cones of a manifest's worth of targets, checked by brute force.
+    """
+    import seestar_catalog
+
+    rng = np.random.default_rng(3)
+    ra = rng.uniform(0, 360, args.stars)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, args.stars)))
+    mag = rng.uniform(6, 16, args.stars)
+    with scratch_directory():
+        with open("stars.csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["AUID", "RAJ2000", "DEJ2000", "Vmag"])
+            writer.writerows(
+                zip(
+                    (f"BENCH-{i}" for i in range(args.stars)),
+                    np.round(ra, 6),
+                    np.round(dec, 6),
+                    np.round(mag, 3),
+                )
+            )
+        start = time.perf_counter()
+        seestar_catalog.ingest("stars.csv", "catalog")
+        elapsed = time.perf_counter() - start
+        record("catalog.ingest_s", elapsed)
+        print(f"  ingested {args.stars} stars in {elapsed:.2f} s")
+
+        start = time.perf_counter()
+        catalog = seestar_catalog.StarCatalog("catalog")
+        catalog.tree
+        elapsed = time.perf_counter() - start
+        record("catalog.open_s", elapsed)
+        print(f"  opened and indexed in {elapsed * 1000:.1f} ms")
+
+        centres_ra = rng.uniform(0, 360, args.targets)
+        centres_dec = np.degrees(np.arcsin(rng.uniform(-1, 1, args.targets)))
+        start = time.perf_counter()
+        found = [
+            catalog.cone(r, d, args.radius) for r, d in zip(centres_ra, centres_dec)
+        ]
+        single = (time.perf_counter() - start) / args.targets
+        start = time.perf_counter()
+        batch = catalog.cones(centres_ra, centres_dec, args.radius)
+        batched = (time.perf_counter() - start) / args.targets
+        record("catalog.cone_us", single * 1e6)
+        record("catalog.batch_cone_us", batched * 1e6)
+        stars = sum(len(cone) for cone in found) / args.targets
+        print(
+            f"  {args.radius} degree cones of {stars:.1f} stars: {single * 1e6:.1f} us "
+            f"each, {batched * 1e6:.1f} us batched over {args.targets} targets"
+        )
+        for i in range(0, args.targets, max(1, args.targets // 20)):
+            separation = seestar_slew.separation(
+                centres_ra[i], centres_dec[i], catalog.ra, catalog.dec
+            )
+            expected = set(np.flatnonzero(separation <= args.radius))
+            if set(found[i]) != expected or set(batch[i]) != expected:
+                raise RuntimeError(f"Cone {i} differs from the brute-force search")
+
+        start = time.perf_counter()
+        chosen = [
+            seestar_catalog.select_comparisons(catalog, r, d, cone)
+            for r, d, cone in zip(centres_ra, centres_dec, batch)
+        ]
+        elapsed = (time.perf_counter() - start) / args.targets
+        record("catalog.select_us", elapsed * 1e6)
+        comps = sum(len(c) for c, _ in chosen) / args.targets
+        print(f"  {comps:.1f} comparison stars chosen in {elapsed * 1e6:.1f} us")
+
+
+def bench_exposure(args):
+    """
+    Plan the exposures of many targets in one pass and check that no chosen
+    sub saturates and that the SNR goal is met wherever the time allows.
+    """
+    import seestar_exposure
+
+    rng = np.random.default_rng(4)
+    mags = rng.uniform(6, 16, args.targets)
+    max_total = rng.choice([600.0, 1800.0, 3600.0], args.targets)
+    seestar_exposure.exposure_table()
+    start = time.perf_counter()
+    plan = seestar_exposure.plan_exposures(mags, max_total)
+    elapsed = time.perf_counter() - start
+    record("exposure.plan_us_per_target", elapsed / args.targets * 1e6)
+    print(
+        f"  {args.targets} targets planned in {elapsed * 1000:.1f} ms, "
+        f"{elapsed / args.targets * 1e9:.0f} ns each"
+    )
+    peak = (
+        seestar_exposure.star_rate(mags - seestar_exposure.SATURATION_MARGIN)
+        * plan["exptime"]
+        * seestar_exposure.PEAK_FRACTION
+    )
+    ok = plan["status"] == "ok"
+    # the table is a 0.05 mag grid, so allow a rounding step of saturation
+    if np.any(peak[ok] > seestar_exposure.FULL_WELL * 10 ** (0.4 * 0.025)):
+        raise RuntimeError("A planned sub saturates")
+    if np.any(plan["snr"][ok] < seestar_exposure.GOAL_SNR * 0.95):
+        raise RuntimeError("A planned visit misses the SNR goal")
+    if np.any(plan["total"] > max_total):
+        raise RuntimeError("A planned visit is longer than its target allows")
+    counts = {
+        status: int(np.sum(plan["status"] == status)) for status in set(plan["status"])
+    }
+    print(f"  {counts}")
+
+
+def bench_startup(args):
+    """Time the cold start of each entry point in a fresh interpreter."""
+    import seestar_startup
+
+    for module in seestar_startup.ENTRY_POINTS:
+        elapsed = seestar_startup.cold_start(module)
+        record(f"startup.{module}.cold_start_s", elapsed)
+        print(f"  {module:20s} cold start {elapsed * 1000:8.1f} ms")
+
+
+BENCHMARKS = (
+    "frames",
+    "coords",
+    "manifest",
+    "schedule",
+    "campaign",
+    "export",
+    "visibility",
+    "planner",
+    "slew",
+    "cadence",
+    "commands",
+    "reconnect",
+    "retrieval",
+    "photometry",
+    "catalog",
+    "exposure",
+    "startup",
+)
+
+
+def bench_all(args):
+    for name in BENCHMARKS:
+        print(name)
+        defaults = setup_argparse().parse_args([name])
+        defaults.run(defaults)
+
+
+def compare(baseline_file, tolerance):
+    """
+    Report the metrics that got worse than the baseline by more than the tolerance.
+    Returns:
+        int: The number of regressions.
+    """
+    with open(baseline_file) as f:
+        baseline = json.load(f)["results"]
+    regressions = 0
+    for name, result in sorted(results.items()):
+        if name not in baseline or baseline[name]["value"] == 0:
+            continue
+        old = baseline[name]["value"]
+        new = result["value"]
+        change = (new - old) / abs(old)
+        if result["better"] == "higher":
+            change = -change
+        if change > tolerance:
+            regressions += 1
+            print(f"REGRESSION {name}: {old:.6g} -> {new:.6g} ({change:+.0%} worse)")
+    print(f"{regressions} regressions against {baseline_file}")
+    return regressions
+
+
+def setup_argparse():
+    parser = argparse.ArgumentParser(description="Seestar Benchmarks")
+    parser.add_argument("--save", type=str, help="Write the results to this JSON file")
+    parser.add_argument("--baseline", type=str, help="Compare with this results file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="The fraction a metric may get worse before it is a regression",
+    )
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    frames = subparsers.add_parser("frames", help="receive path framing throughput")
+    frames.add_argument(
+        "--capture", type=str, help="A captured SeeStar stream to replay"
+    )
+    frames.add_argument(
+        "--count", type=int, default=200, help="Large frames to generate"
+    )
+    frames.add_argument(
+        "--read-size", type=int, default=1024 * 60, help="Bytes per socket read"
+    )
+    frames.set_defaults(run=bench_frames)
+
+    coords = subparsers.add_parser("coords", help="RA and Dec string conversions")
+    coords.set_defaults(run=bench_coords)
+
+    manifest = subparsers.add_parser("manifest", help="read_targets manifest parsing")
+    manifest.add_argument(
+        "--counts", type=int, nargs="+", default=[10, 1000, 10000], help="Targets"
+    )
+    manifest.set_defaults(run=bench_manifest)
+
+    schedule = subparsers.add_parser("schedule", help="create_schedule scaling")
+    schedule.add_argument(
+        "--counts", type=int, nargs="+", default=[10, 100, 1000], help="Targets"
+    )
+    schedule.set_defaults(run=bench_schedule)
+
+    campaign = subparsers.add_parser(
+        "campaign", help="multi-night planning, serial and in a process pool"
+    )
+    campaign.add_argument(
+        "--counts", type=int, nargs="+", default=[100, 1000], help="Targets"
+    )
+    campaign.add_argument("--nights", type=int, default=30, help="Nights to plan")
+    campaign.add_argument(
+        "--workers", type=int, help="Worker processes, one per CPU if not given"
+    )
+    campaign.set_defaults(run=bench_campaign)
+
+    export = subparsers.add_parser(
+        "export", help="schedule.json export, checked against json.dumps"
+    )
+    export.add_argument(
+        "--counts", type=int, nargs="+", default=[100, 10000], help="Targets"
+    )
+    export.set_defaults(run=bench_export)
+
+    visibility = subparsers.add_parser(
+        "visibility", help="whole-night visibility grid build and lookup"
+    )
+    visibility.add_argument(
+        "--counts", type=int, nargs="+", default=[10, 1000, 10000], help="Targets"
+    )
+    visibility.add_argument(
+        "--hours", type=float, default=10, help="Length of the night"
+    )
+    visibility.add_argument(
+        "--step", type=float, default=300, help="Seconds between grid times"
+    )
+    visibility.set_defaults(run=bench_visibility)
+
+    planner = subparsers.add_parser("planner", help="scheduling engine comparison")
+    planner.add_argument(
+        "--counts", type=int, nargs="+", default=[100, 1000, 5000], help="Targets"
+    )
+    planner.add_argument("--hours", type=float, default=10, help="Length of the night")
+    planner.add_argument("--repeat", action="store_true", help="Allow repeat visits")
+    planner.set_defaults(run=bench_planner)
+
+    cadence = subparsers.add_parser(
+        "cadence", help="revisit cadence of the cadence and slot solvers"
+    )
+    cadence.add_argument("--targets", type=int, default=40, help="Targets")
+    cadence.add_argument("--hours", type=float, default=10, help="Length of the night")
+    cadence.set_defaults(run=bench_cadence)
+
+    slew = subparsers.add_parser("slew", help="slew-minimizing target ordering")
+    slew.add_argument(
+        "--counts", type=int, nargs="+", default=[100, 1000, 2000], help="Targets"
+    )
+    slew.set_defaults(run=bench_slew)
+
+    commands = subparsers.add_parser(
+        "commands", help="per-target command overhead against the emulator"
+    )
+    commands.add_argument("--count", type=int, default=10, help="Repetitions")
+    commands.set_defaults(run=bench_commands)
+
+    reconnect = subparsers.add_parser(
+        "reconnect", help="recovery time over a link that drops at random"
+    )
+    reconnect.add_argument("--count", type=int, default=10, help="Targets")
+    reconnect.add_argument(
+        "--disconnect-rate",
+        type=float,
+        default=0.1,
+        help="The chance the emulator drops the link on each request",
+    )
+    reconnect.set_defaults(run=bench_reconnect)
+
+    retrieval = subparsers.add_parser(
+        "retrieval", help="frame copying from the HTTP stand-in"
+    )
+    retrieval.add_argument("--count", type=int, default=40, help="Frames")
+    retrieval.add_argument("--frame-kb", type=int, default=512, help="Frame size")
+    retrieval.add_argument(
+        "--workers", type=int, nargs="+", default=[1, 4], help="Worker pool sizes"
+    )
+    retrieval.add_argument(
+        "--bandwidth-kb", type=int, default=4096, help="Limit of the last run, kB/s"
+    )
+    retrieval.set_defaults(run=bench_retrieval)
+
+    photometry = subparsers.add_parser(
+        "photometry", help="differential photometry of synthetic subs"
+    )
+    photometry.add_argument("--count", type=int, default=30, help="Subs to measure")
+    photometry.set_defaults(run=bench_photometry)
+
+    catalog = subparsers.add_parser(
+        "catalog", help="comparison catalogue cone searches"
+    )
+    catalog.add_argument(
+        "--stars", type=int, default=200000, help="Stars in the catalogue"
+    )
+    catalog.add_argument("--targets", type=int, default=1000, help="Cones to search")
+    catalog.add_argument(
+        "--radius", type=float, default=0.35, help="Cone radius in degrees"
+    )
+    catalog.set_defaults(run=bench_catalog)
+
+    exposure = subparsers.add_parser("exposure", help="magnitude-driven exposure plans")
+    exposure.add_argument("--targets", type=int, default=100000, help="Targets to plan")
+    exposure.set_defaults(run=bench_exposure)
+
+    startup = subparsers.add_parser("startup", help="cold start of the entry points")
+    startup.set_defaults(run=bench_startup)
+
+    everything = subparsers.add_parser("all", help="every benchmark with its defaults")
+    everything.set_defaults(run=bench_all)
+    return parser
+
+
+if __name__ == "__main__":
+    args = setup_argparse().parse_args()
+    args.run(args)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "python": sys.version.split()[0],
+                    "results": results,
+                },
+                f,
+                indent=4,
+            )
+        print(f"Results written to {args.save}")
+    if args.baseline and compare(args.baseline, args.tolerance):
+        sys.exit(1)
@@ -0,0 +1,211 @@
+"""Plan a run of nights at once, one schedule per night.
+
+The targets are resolved and the twilight of every night is looked up once,
+in this process. The nights are then planned independently in a process
+pool, each worker getting the shared targets once when it starts, and each
+night is written to its own schedule_YYYY-MM-DD.json. The visits of every
+target over the campaign are summed up into campaign_summary.json, so a
+target that is never or rarely planned stands out.
+
+Usage:
+    python seestar_schedule.py demo_targets.dat --nights 30
+    python seestar_schedule.py demo_targets.dat --start 2026-11-01 --nights 7 --workers 4
+"""
+
+import concurrent.futures
+import datetime
+import json
+import os
+
+import numpy as np
+import pytz
+
+import seestar_ephemeris
+import seestar_manifest
+import seestar_planner
+import seestar_schedule
+import seestar_slew
+
+SUMMARY_FILE = "campaign_summary.json"
+
+# the shared state of a worker process, set once by init_worker
+worker = {}
+
+
+def init_worker(targets, site, config, solver, slew_model, directory, compact):
+    """Keep what every night of the campaign shares in the worker process."""
+    worker.update(
+        targets=targets,
+        site=site,
+        config=config,
+        solver=solver,
+        slew_model=slew_model,
+        directory=directory,
+        compact=compact,
+    )
+
+
+def schedule_file(directory, night):
+    return os.path.join(directory, f"schedule_{night.isoformat()}.json")
+
+
+def plan_campaign_night(night, dusk, dawn):
+    """
+    Plan one night in a worker and write its schedule.
+    Args:
+        night (datetime.date): The local date of the evening.
+        dusk (datetime.datetime): The evening nautical twilight.
+        dawn (datetime.datetime): The morning nautical twilight.
+    Returns:
+        dict: The night, its schedule file, and the visits and open-shutter
+            seconds of each target.
+    """
+    targets = worker["targets"]
+    schedule, plan = seestar_schedule.plan_night(
+        targets,
+        worker["site"],
+        worker["config"],
+        dusk,
+        dawn,
+        worker["solver"],
+        worker["slew_model"],
+        verbose=False,
+    )
+    path = schedule_file(worker["directory"], night)
+    with open(path, "w") as f:
+        schedule.write_json(f, compact=worker["compact"])
+    exposures = targets["TotalExp"].astype(float)
+    visits = np.zeros(len(exposures), dtype=int)
+    for i, _ in plan:
+        visits[i] += 1
+    return {
+        "night": night.isoformat(),
+        "schedule": path,
+        "dusk": dusk.isoformat(),
+        "dawn": dawn.isoformat(),
+        "observations": len(plan),
+        "open_shutter_h": seestar_planner.science_time(plan, exposures) / 3600,
+        "visits": visits.tolist(),
+        "seconds": (visits * exposures).tolist(),
+    }
+
+
+def coverage(names, nights):
+    """
+    Sum the visits of each target over the nights of a campaign.
+    Args:
+        names (array): The target names.
+        nights (list): The results of plan_campaign_night, in night order.
+    Returns:
+        list: Per target, its nights planned, visits, hours and first and last night.
+    """
+    visits = np.array([night["visits"] for night in nights]).reshape(
+        len(nights), len(names)
+    )
+    seconds = np.array([night["seconds"] for night in nights]).reshape(visits.shape)
+    rows = []
+    for i, name in enumerate(names):
+        planned = np.flatnonzero(visits[:, i])
+        rows.append(
+            {
+                "name": str(name),
+                "nights": len(planned),
+                "visits": int(visits[:, i].sum()),
+                "hours": float(seconds[:, i].sum() / 3600),
+                "first_night": nights[planned[0]]["night"] if len(planned) else None,
+                "last_night": nights[planned[-1]]["night"] if len(planned) else None,
+            }
+        )
+    return rows
+
+
+def plan_campaign(
+    manifest,
+    first_night,
+    count,
+    resolver=None,
+    solver=seestar_planner.DEFAULT_SOLVER,
+    directory="schedules",
+    workers=None,
+    compact=False,
+    slew_model=None,
+):
+    """
+    Plan a run of nights, one schedule file per night.
+    Args:
+        manifest (Manifest or str): The manifest, or the file to read it from.
+        first_night (datetime.date): The local date of the first evening.
+        count (int): The number of nights.
+        resolver (SimbadResolver): Looks up the target coordinates.
+        solver (str): The name of the scheduling engine in seestar_planner.SOLVERS.
+        directory (str): Where the schedules and the summary are written.
+        workers (int): The worker processes, one per CPU if None, none if 1.
+        compact (bool): Write the schedules without indentation.
+        slew_model (seestar_slew.SlewModel): The slew times, fitted to
+            seestar_timing.jsonl if None.
+    Returns:
+        dict: The summary written to campaign_summary.json.
+    """
+    if not isinstance(manifest, seestar_manifest.Manifest):
+        manifest = seestar_manifest.read_manifest(manifest)
+    site = manifest.site
+    # the coordinates and the twilight of every night are looked up once here
+    targets = seestar_schedule.read_targets(manifest, resolver)
+    table = seestar_ephemeris.EphemerisTable(
+        site["Latitude"], site["Longitude"], site["Elevation"]
+    )
+    table.precompute(first_night, count)
+    local_tz = pytz.timezone(site["Timezone"])
+    nights = [first_night + datetime.timedelta(days=i) for i in range(count)]
+    twilights = [table.twilight(night, "nautical", local_tz) for night in nights]
+    table.close()
+    if slew_model is None:
+        slew_model = seestar_slew.load_model()
+    os.makedirs(directory, exist_ok=True)
+    shared = (targets, site, manifest.config, solver, slew_model, directory, compact)
+    dusks, dawns = zip(*twilights)
+    if workers == 1:
+        init_worker(*shared)
+        results = list(map(plan_campaign_night, nights, dusks, dawns))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker, initargs=shared
+        ) as executor:
+            results = list(executor.map(plan_campaign_night, nights, dusks, dawns))
+    summary = {
+        "manifest": manifest.path,
+        "solver": solver,
+        "first_night": first_night.isoformat(),
+        "nights": [
+            {
+                key: value
+                for key, value in result.items()
+                if key not in ("visits", "seconds")
+            }
+            for result in results
+        ],
+        "targets": coverage(targets["Name"], results),
+    }
+    with open(os.path.join(directory, SUMMARY_FILE), "w") as f:
+        json.dump(summary, f, indent=4)
+    return summary
+
+
+def print_summary(summary):
+    """Print the nights of a campaign and the coverage of each target."""
+    for night in summary["nights"]:
+        print(
+            f"{night['night']}  {night['observations']:4d} observations "
+            f"{night['open_shutter_h']:6.2f} h  {night['schedule']}"
+        )
+    count = len(summary["nights"])
+    print(f"{'target':24s} {'nights':>7s} {'visits':>7s} {'hours':>7s}  first - last")
+    for target in summary["targets"]:
+        if target["nights"] == 0:
+            span = "never planned"
+        else:
+            span = f"{target['first_night']} - {target['last_night']}"
+        print(
+            f"{target['name']:24s} {target['nights']:3d}/{count:<3d} "
+            f"{target['visits']:7d} {target['hours']:7.2f}  {span}"
+        )
@@ -0,0 +1,407 @@
+"""A local catalogue of comparison stars, searched without a network.
+
+A star list, such as an APASS, AAVSO VSP or Gaia export, is ingested once
+into a folder of .npy arrays: the unit vector, position, magnitude and name
+of every star, sorted by declination zone and right ascension so that the
+stars of one field sit together on disk. A StarCatalog maps the arrays
+rather than reading them, and builds a KD-tree over the unit vectors when it
+is first searched, so a cone search is a chord-length ball query that takes
+microseconds and the cones of a whole manifest are one query.
+
+select_comparisons() picks the comparison and check stars of a target from
+its cone: stars in the magnitude range the subs measure well, away from the
+target and without a bright neighbour in their aperture, nearest first.
+manifest_comparisons() does this for every target of a manifest, resolved
+from the local SIMBAD cache, and writes the comparison file
+seestar_photometry.py reads.
+
+Usage:
+    python seestar_catalog.py ingest apass_fields.csv
+    python seestar_catalog.py cone 325.68 43.59 --radius 0.3
+    python seestar_catalog.py manifest demo_targets.dat --output comparisons.csv
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+import seestar_slew
+
+CATALOG_DIR = "comparison_catalog"
+META_FILE = "catalog.json"
+ARRAYS = ("xyz", "ra", "dec", "mag", "mag_err", "name")
+ZONE_HEIGHT = 1.0  # degrees of declination stored together
+FIELD_RADIUS = 0.35  # degrees, inside the short side of the S50 field
+BRIGHT_LIMIT = 9.0  # magnitudes, brighter stars saturate the subs
+FAINT_LIMIT = 13.5  # magnitudes, fainter stars are too noisy to compare with
+TARGET_CLEARANCE = 30.0  # arcseconds kept clear of the target
+NEIGHBOUR_RADIUS = 20.0  # arcseconds, about the aperture and its sky annulus
+NEIGHBOUR_DELTA = 2.5  # magnitudes, how much fainter a neighbour may be ignored
+# the header names each column is recognised by, compared in lower case
+COLUMNS = {
+    "name": ("name", "star", "id", "auid", "source_id", "recno"),
+    "ra": ("ra", "raj2000", "_raj2000", "ra_deg", "ra_icrs"),
+    "dec": ("dec", "dej2000", "_dej2000", "dec_deg", "de", "de_icrs"),
+    "mag": ("mag", "vmag", "v", "gmag", "phot_g_mean_mag"),
+    "mag_err": ("mag_err", "e_vmag", "e_v", "err", "e_gmag"),
+}
+
+
+def chord(radius):
+    """The straight-line distance between unit vectors an angle in degrees apart."""
+    return 2 * np.sin(np.radians(np.asarray(radius, dtype=float)) / 2)
+
+
+def find_column(header, kind, given=None):
+    """
+    The index of a column in a header row.
+    Args:
+        header (list): The column names.
+        kind (str): A key of COLUMNS.
+        given (str): The name to look for instead of the usual ones.
+    Returns:
+        int: The column index, or None if there is no such column.
+    """
+    names = [column.strip().lower() for column in header]
+    for candidate in (given.lower(),) if given else COLUMNS[kind]:
+        if candidate in names:
+            return names.index(candidate)
+    return None
+
+
+def parse_angles(values, hours=False):
+    """
+    Args:
+        values (array): Decimal degrees, or sexagesimal strings.
+        hours (bool): Sexagesimal values are hours, as for a right ascension.
+    Returns:
+        numpy.ndarray: The angles in degrees.
+    """
+    values = np.asarray(values)
+    try:
+        return values.astype(float)
+    except ValueError:
+        pass
+    angles = np.empty(len(values))
+    for i, value in enumerate(values):
+        parts = value.replace(":", " ").split()
+        angle = sum(abs(float(part)) / 60**k for k, part in enumerate(parts))
+        sign = -1.0 if value.strip().startswith("-") else 1.0
+        angles[i] = sign * angle * (15.0 if hours and len(parts) > 1 else 1.0)
+    return angles
+
+
+def ingest(source, directory=CATALOG_DIR, columns=None):
+    """
+    Read a CSV star list once into the arrays of a catalogue folder.
+    Args:
+        source (str): The CSV file, with a header row.
+        directory (str): The catalogue folder, replaced if it holds one already.
+        columns (dict): Header names for any of the COLUMNS kinds that the file
+            names differently.
+    Returns:
+        int: The number of stars stored.
+    Raises:
+        ValueError: The file has no RA, Dec or magnitude column.
+    """
+    columns = columns or {}
+    with open(source, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        index = {kind: find_column(header, kind, columns.get(kind)) for kind in COLUMNS}
+        for kind in ("ra", "dec", "mag"):
+            if index[kind] is None:
+                raise ValueError(f"{source} has no {kind} column")
+        rows = [row for row in reader if row and row[index["mag"]].strip()]
+    table = np.array(rows, dtype=str).reshape(len(rows), len(header))
+    ra = parse_angles(table[:, index["ra"]], hours=True) % 360
+    dec = parse_angles(table[:, index["dec"]])
+    mag = table[:, index["mag"]].astype(float)
+    if index["mag_err"] is not None:
+        errors = table[:, index["mag_err"]]
+        mag_err = np.where(errors == "", "nan", errors).astype(float)
+    else:
+        mag_err = np.full(len(rows), np.nan)
+    if index["name"] is not None:
+        name = np.char.strip(table[:, index["name"]])
+    else:
+        name = np.char.add("CAT-", np.arange(len(rows)).astype(str))
+    # the stars of a field are stored together, so a search touches few pages
+    zone = np.floor((dec + 90) / ZONE_HEIGHT)
+    order = np.lexsort((ra, zone))
+    arrays = {
+        "xyz": seestar_slew.unit_vectors(ra[order], dec[order]),
+        "ra": ra[order],
+        "dec": dec[order],
+        "mag": mag[order].astype(np.float32),
+        "mag_err": mag_err[order].astype(np.float32),
+        "name": np.char.encode(name[order], "utf-8"),
+    }
+    os.makedirs(directory, exist_ok=True)
+    for key, array in arrays.items():
+        np.save(os.path.join(directory, f"{key}.npy"), array)
+    meta = {
+        "source": os.path.abspath(source),
+        "stars": len(rows),
+        "ingested": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    with open(os.path.join(directory, META_FILE), "w") as f:
+        json.dump(meta, f, indent=4)
+    return len(rows)
+
+
+class StarCatalog:
+    """The memory-mapped arrays of an ingested catalogue and their KD-tree."""
+
+    def __init__(self, directory=CATALOG_DIR):
+        """
+        Args:
+            directory (str): The folder written by ingest.
+        Raises:
+            FileNotFoundError: Nothing was ingested into the folder.
+        """
+        with open(os.path.join(directory, META_FILE)) as f:
+            self.meta = json.load(f)
+        for key in ARRAYS:
+            array = np.load(os.path.join(directory, f"{key}.npy"), mmap_mode="r")
+            setattr(self, key, array)
+        self._tree = None
+
+    def __len__(self):
+        return len(self.ra)
+
+    @property
+    def tree(self):
+        """The KD-tree over the unit vectors, built on the first search."""
+        if self._tree is None:
+            self._tree = cKDTree(self.xyz, balanced_tree=False, compact_nodes=False)
+        return self._tree
+
+    def cone(self, ra, dec, radius=FIELD_RADIUS):
+        """
+        Args:
+            ra (float): The centre right ascension in degrees.
+            dec (float): The centre declination in degrees.
+            radius (float): The cone radius in degrees.
+        Returns:
+            numpy.ndarray: The indices of the stars in the cone, nearest first.
+        """
+        centre = seestar_slew.unit_vectors(ra, dec)
+        found = np.array(self.tree.query_ball_point(centre, chord(radius)), dtype=int)
+        distance = np.linalg.norm(self.xyz[found] - centre, axis=1)
+        return found[np.argsort(distance, kind="stable")]
+
+    def cones(self, ra, dec, radius=FIELD_RADIUS):
+        """
+        The cones around many positions in one query.
+        Args:
+            ra (array): The centre right ascensions in degrees.
+            dec (array): The centre declinations in degrees.
+            radius (float): The cone radius in degrees.
+        Returns:
+            list: The indices of the stars in each cone, in no order.
+        """
+        centres = seestar_slew.unit_vectors(np.atleast_1d(ra), np.atleast_1d(dec))
+        found = self.tree.query_ball_point(centres, chord(radius))
+        return [np.array(indices, dtype=int) for indices in found]
+
+    def names(self, indices):
+        return [name.decode("utf-8") for name in self.name[indices]]
+
+
+def select_comparisons(
+    catalog,
+    ra,
+    dec,
+    indices=None,
+    count=5,
+    bright=BRIGHT_LIMIT,
+    faint=FAINT_LIMIT,
+    radius=FIELD_RADIUS,
+):
+    """
+    Pick the comparison and check stars of a target from its cone.
+    Args:
+        catalog (StarCatalog): The catalogue.
+        ra (float): The target right ascension in degrees.
+        dec (float): The target declination in degrees.
+        indices (array): The stars of the cone, searched for if None.
+        count (int): The comparison stars wanted, the next one is the check star.
+        bright (float): The brightest magnitude used.
+        faint (float): The faintest magnitude used.
+        radius (float): The cone radius in degrees.
+    Returns:
+        tuple: The indices of the comparison stars, nearest first, and of the
+            check star, or None if the cone held too few.
+    """
+    if indices is None:
+        indices = catalog.cone(ra, dec, radius)
+    indices = np.asarray(indices, dtype=int)
+    if len(indices) == 0:
+        return indices, None
+    centre = seestar_slew.unit_vectors(ra, dec)
+    distance = np.linalg.norm(catalog.xyz[indices] - centre, axis=1)
+    order = np.argsort(distance, kind="stable")
+    indices = indices[order]
+    distance = distance[order]
+    mag = catalog.mag[indices]
+    usable = (mag >= bright) & (mag <= faint)
+    usable &= distance > chord(TARGET_CLEARANCE / 3600)
+    candidates = indices[usable]
+    if len(candidates) == 0:
+        return candidates, None
+    # a neighbour within the aperture that is not much fainter spoils a star
+    neighbours = catalog.tree.query_ball_point(
+        catalog.xyz[candidates], chord(NEIGHBOUR_RADIUS / 3600)
+    )
+    isolated = np.array(
+        [
+            not np.any(
+                catalog.mag[[i for i in near if i != star]]
+                < catalog.mag[star] + NEIGHBOUR_DELTA
+            )
+            for star, near in zip(candidates, neighbours)
+        ]
+    )
+    candidates = candidates[isolated]
+    check = candidates[count] if len(candidates) > count else None
+    return candidates[:count], check
+
+
+def comparison_rows(catalog, target, ra, dec, comps, check):
+    """The rows of the comparison file for one target, as seestar_photometry reads it."""
+    rows = [[target, target, f"{ra:.6f}", f"{dec:.6f}", "", "target"]]
+    stars = [(i, "comp") for i in comps]
+    if check is not None:
+        stars.append((check, "check"))
+    for i, role in stars:
+        rows.append(
+            [
+                target,
+                catalog.names([i])[0],
+                f"{catalog.ra[i]:.6f}",
+                f"{catalog.dec[i]:.6f}",
+                f"{catalog.mag[i]:.3f}",
+                role,
+            ]
+        )
+    return rows
+
+
+def manifest_comparisons(
+    manifest, catalog, output, resolver=None, count=5, radius=FIELD_RADIUS
+):
+    """
+    Choose the comparison stars of every target of a manifest with no network
+    access and write them to a comparison file.
+    Args:
+        manifest (Manifest or str): The manifest, or the file to read it from.
+        catalog (StarCatalog): The catalogue.
+        output (str): The comparison file to write.
+        resolver (SimbadResolver): Looks up the targets, the local SIMBAD cache
+            only if None.
+        count (int): The comparison stars wanted per target.
+        radius (float): The cone radius in degrees.
+    Returns:
+        dict: The number of comparison stars found for each target.
+    """
+    # the planning modules are only needed here, not for cone searches
+    import seestar_resolver
+    import seestar_schedule
+
+    if resolver is None:
+        resolver = seestar_resolver.SimbadResolver(offline=True)
+    targets = seestar_schedule.read_targets(manifest, resolver)
+    ra = targets["ra_deg"].astype(float)
+    dec = targets["dec_deg"].astype(float)
+    cones = catalog.cones(ra, dec, radius)
+    found = {}
+    with open(output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Target", "Star", "RA", "Dec", "Mag", "Role"])
+        for name, ra_deg, dec_deg, cone in zip(targets["Name"], ra, dec, cones):
+            comps, check = select_comparisons(
+                catalog, ra_deg, dec_deg, cone, count, radius=radius
+            )
+            writer.writerows(
+                comparison_rows(catalog, str(name), ra_deg, dec_deg, comps, check)
+            )
+            found[str(name)] = len(comps)
+    return found
+
+
+def setup_argparse():
+    parser = argparse.ArgumentParser(description="Seestar Comparison Catalogue")
+    parser.add_argument(
+        "--directory",
+        type=str,
+        default=CATALOG_DIR,
+        help="The catalogue folder",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser(
+        "ingest", help="Store a CSV star list as a catalogue"
+    )
+    ingest_parser.add_argument("source", type=str, help="The CSV star list")
+    for kind in COLUMNS:
+        ingest_parser.add_argument(
+            f"--{kind.replace('_', '-')}-column",
+            type=str,
+            help=f"The header of the {kind} column if not a usual one",
+        )
+    cone = subparsers.add_parser("cone", help="List the stars around a position")
+    cone.add_argument("ra", type=float, help="Right ascension in degrees")
+    cone.add_argument("dec", type=float, help="Declination in degrees")
+    cone.add_argument(
+        "--radius", type=float, default=FIELD_RADIUS, help="Radius in degrees"
+    )
+    manifest = subparsers.add_parser(
+        "manifest", help="Choose the comparison stars of every manifest target"
+    )
+    manifest.add_argument("manifest", type=str, help="The target list file")
+    manifest.add_argument(
+        "--output",
+        type=str,
+        default="comparisons.csv",
+        help="The comparison file to write",
+    )
+    manifest.add_argument(
+        "--count", type=int, default=5, help="Comparison stars per target"
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    args = setup_argparse().parse_args()
+    if args.command == "ingest":
+        columns = {
+            kind: getattr(args, f"{kind}_column")
+            for kind in COLUMNS
+            if getattr(args, f"{kind}_column")
+        }
+        count = ingest(args.source, args.directory, columns)
+        print(f"Stored {count} stars in {args.directory}")
+    elif args.command == "cone":
+        catalog = StarCatalog(args.directory)
+        found = catalog.cone(args.ra, args.dec, args.radius)
+        separations = seestar_slew.separation(
+            args.ra, args.dec, catalog.ra[found], catalog.dec[found]
+        )
+        for name, i, separation in zip(catalog.names(found), found, separations):
+            print(
+                f"{name:24s} {catalog.ra[i]:10.5f} {catalog.dec[i]:+10.5f} "
+                f"{catalog.mag[i]:6.2f} {separation * 60:6.2f}'"
+            )
+    else:
+        catalog = StarCatalog(args.directory)
+        found = manifest_comparisons(
+            args.manifest, catalog, args.output, count=args.count
+        )
+        for name, count in found.items():
+            print(f"{name:24s} {count} comparison stars")
+        print(f"Wrote {args.output}")
@@ -3,9 +3,20 @@ The class has a method that emulates the seestar_run_runner method of the SEESTA
 The method takes the same arguments as the seestar_run_runner method and prints the arguments
 to the console. The method returns 0 if the arguments are valid and 1 if the arguments are invalid.
 The class can be used to test the seestar_run_runner method without running the SEESTAR_run module.
+
+The module also provides SeestarEmulator, a local server that speaks the SeeStar JSON-RPC
+protocol over TCP, so the socket, framing and event handling of seestar_run can be tested
+and benchmarked without a telescope. It answers the methods the project sends and emits
+AutoGoto and Stack events with configurable latencies, large payloads, failures and
+disconnects. Any number of units can be served at once on consecutive ports:
+    python seestar_emul.py --serve --port 4700 --units 3 --slew-time 5
 """
 
+import argparse
+import asyncio
+import json
 import random
+import time
 
 
 def seestar_run_runner(targetName, coords, exptime, totaltime):
@@ -51,11 +62,264 @@ def seestar_run_runner(targetName, coords, exptime, totaltime):
     return 0
 
 
+class SeestarEmulator:
+    """A local server that behaves like one SeeStar unit."""
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=4700,
+        slew_time=2.0,
+        settle_time=1.0,
+        goto_fail_rate=0.0,
+        disconnect_rate=0.0,
+        payload_size=0,
+        time_scale=1.0,
+        seed=None,
+        reply_delay=0.0,
+    ):
+        """
+        Args:
+            host (str): The address to listen on.
+            port (int): The port to listen on, 0 for any free port.
+            slew_time (float): Seconds from iscope_start_view to the end of the slew.
+            settle_time (float): Seconds after the slew before AutoGoto completes.
+            goto_fail_rate (float): The fraction of gotos that end with state "fail".
+            disconnect_rate (float): The chance of dropping the connection on each request.
+            payload_size (int): When > 0, send a PiStatus event of this many bytes
+                every second, like the large comet data messages.
+            time_scale (float): Multiplies every latency, e.g. 0.01 for fast tests.
+            seed (int): Seed for the injected failures.
+            reply_delay (float): Seconds before each reply, like a slow network.
+        """
+        self.host = host
+        self.port = port
+        self.slew_time = slew_time
+        self.settle_time = settle_time
+        self.goto_fail_rate = goto_fail_rate
+        self.disconnect_rate = disconnect_rate
+        self.payload_size = payload_size
+        self.time_scale = time_scale
+        self.random = random.Random(seed)
+        self.reply_delay = reply_delay
+        self.server = None
+        self.connections = set()
+        self.ra = 0.0
+        self.dec = 0.0
+        self.exp_ms = 10000
+        self.requests = 0
+        self.gotos = 0
+
+    async def start(self):
+        # comet data is >50kb, so allow for large messages
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, limit=1024 * 1024
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for connection in list(self.connections):
+            connection.close()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        connection = EmulatorConnection(self, writer)
+        self.connections.add(connection)
+        try:
+            while True:
+                line = await reader.readuntil(b"\r\n")
+                request = json.loads(line)
+                self.requests += 1
+                if self.random.random() < self.disconnect_rate:
+                    # an injected Wi-Fi drop
+                    break
+                await connection.handle_request(request)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            connection.close()
+            self.connections.discard(connection)
+
+
+class EmulatorConnection:
+    """One client connection to an emulated SeeStar and its running operations."""
+
+    def __init__(self, emulator, writer):
+        self.emulator = emulator
+        self.writer = writer
+        self.tasks = set()
+        self.stack_task = None
+        if emulator.payload_size > 0:
+            self.start_task(self.send_payloads())
+
+    def start_task(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def close(self):
+        for task in list(self.tasks):
+            task.cancel()
+        self.writer.close()
+
+    async def send(self, message):
+        if self.writer.is_closing():
+            return
+        message.setdefault("Timestamp", f"{time.monotonic():.6f}")
+        self.writer.write((json.dumps(message) + "\r\n").encode())
+        await self.writer.drain()
+
+    async def reply(self, request, result=0, code=0, error=None):
+        if self.emulator.reply_delay > 0:
+            await asyncio.sleep(self.emulator.reply_delay * self.emulator.time_scale)
+        message = {"jsonrpc": "2.0", "method": request.get("method")}
+        if error is not None:
+            message["error"] = error
+        else:
+            message["result"] = result
+        message["code"] = code
+        message["id"] = request.get("id")
+        await self.send(message)
+
+    async def handle_request(self, request):
+        emulator = self.emulator
+        method = request.get("method")
+        params = request.get("params", {})
+        if method in ("test_connection", "set_stack_setting"):
+            await self.reply(request)
+        elif method == "set_setting":
+            exp_ms = params.get("exp_ms", {}).get("stack_l")
+            if exp_ms:
+                emulator.exp_ms = exp_ms
+            await self.reply(request)
+        elif method == "scope_get_equ_coord":
+            await self.reply(request, {"ra": emulator.ra, "dec": emulator.dec})
+        elif method == "iscope_start_view":
+            await self.reply(request)
+            self.start_task(self.goto(params))
+        elif method == "iscope_start_stack":
+            await self.reply(request)
+            if self.stack_task is not None:
+                self.stack_task.cancel()
+            self.stack_task = self.start_task(self.stack())
+        elif method == "iscope_stop_view":
+            await self.reply(request)
+            if self.stack_task is not None:
+                self.stack_task.cancel()
+                self.stack_task = None
+                await self.send({"Event": "Stack", "state": "cancel"})
+        elif method == "pi_shutdown":
+            await self.reply(request)
+            self.close()
+        else:
+            await self.reply(request, code=103, error="method not found")
+
+    async def goto(self, params):
+        emulator = self.emulator
+        emulator.gotos += 1
+        target_name = params.get("target_name", "")
+        await self.send({"Event": "AutoGoto", "state": "start", "lapse_ms": 0})
+        await asyncio.sleep(emulator.slew_time * emulator.time_scale)
+        await self.send(
+            {"Event": "AutoGoto", "state": "working", "target": target_name}
+        )
+        await asyncio.sleep(emulator.settle_time * emulator.time_scale)
+        if emulator.random.random() < emulator.goto_fail_rate:
+            await self.send(
+                {"Event": "AutoGoto", "state": "fail", "error": "fail to goto"}
+            )
+            return
+        emulator.ra, emulator.dec = params.get("target_ra_dec", [0.0, 0.0])
+        await self.send({"Event": "AutoGoto", "state": "complete"})
+
+    async def stack(self):
+        emulator = self.emulator
+        await self.send({"Event": "Stack", "state": "start"})
+        frame = 0
+        while True:
+            await asyncio.sleep(emulator.exp_ms / 1000 * emulator.time_scale)
+            frame += 1
+            await self.send(
+                {
+                    "Event": "Stack",
+                    "state": "frame_complete",
+                    "stacked_frame": frame,
+                    "dropped_frame": 0,
+                }
+            )
+
+    async def send_payloads(self):
+        padding = "x" * self.emulator.payload_size
+        while True:
+            await asyncio.sleep(1)
+            await self.send({"Event": "PiStatus", "temp": 35.0, "data": padding})
+
+
+async def serve_units(units, port, **kwargs):
+    """Serve a number of emulated units on consecutive ports until cancelled."""
+    emulators = [SeestarEmulator(port=port + i, **kwargs) for i in range(units)]
+    for emulator in emulators:
+        await emulator.start()
+        print(f"Emulated SeeStar listening on {emulator.host}:{emulator.port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for emulator in emulators:
+            await emulator.stop()
+
+
+def setup_argparse():
+    parser = argparse.ArgumentParser(description="Seestar Emulator")
+    parser.add_argument("--serve", action="store_true", help="Run the emulator server")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4700, help="Port of the first unit")
+    parser.add_argument("--units", type=int, default=1, help="Units to emulate")
+    parser.add_argument("--slew-time", type=float, default=2.0)
+    parser.add_argument("--settle-time", type=float, default=1.0)
+    parser.add_argument("--goto-fail-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    parser.add_argument("--payload-size", type=int, default=0)
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--reply-delay", type=float, default=0.0)
+    return parser
+
+
 if __name__ == "__main__":
-    # Test the seestar_run_runner method
-    # read arguments from the command line
     import sys
 
+    if "--serve" in sys.argv[1:]:
+        args = setup_argparse().parse_args()
+        try:
+            asyncio.run(
+                serve_units(
+                    args.units,
+                    args.port,
+                    host=args.host,
+                    slew_time=args.slew_time,
+                    settle_time=args.settle_time,
+                    goto_fail_rate=args.goto_fail_rate,
+                    disconnect_rate=args.disconnect_rate,
+                    payload_size=args.payload_size,
+                    time_scale=args.time_scale,
+                    seed=args.seed,
+                    reply_delay=args.reply_delay,
+                )
+            )
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    # Test the seestar_run_runner method
+    # read arguments from the command line
     targetName = sys.argv[1]
     coords = [float(sys.argv[2]), float(sys.argv[3])]
     exptime = float(sys.argv[4])
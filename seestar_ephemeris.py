@@ -0,0 +1,228 @@
+"""A cached table of the sun and moon events of each night at a site.
+
+Sunset and sunrise, civil, nautical and astronomical twilight, and moonrise
+and moonset are computed with pyephem once per site and night and kept in a
+small SQLite file, so the scheduler and the runner look them up instead of
+redoing the solar calculations on every call or for every planned night.
+
+A night is named by the local date of its evening, e.g. the night from the
+evening of 2026-10-17 to the morning of 2026-10-18 is "2026-10-17".
+
+Usage:
+    table = EphemerisTable("-35:17:00.6", "149:07:41.2", 500)
+    dusk, dawn = table.twilight(night_of(now, table.longitude), "nautical")
+"""
+
+import argparse
+import datetime
+import sqlite3
+
+import ephem
+
+import seestar_visibility
+
+DEFAULT_TABLE_FILE = "ephemeris.db"
+# nights computed ahead whenever a night is missing from the table
+DEFAULT_PREFETCH = 30
+
+# the sun altitude of each twilight
+TWILIGHT_HORIZONS = {
+    "civil": "-6",
+    "nautical": "-12",
+    "astronomical": "-18",
+}
+EVENTS = (
+    "sunset",
+    "sunrise",
+    "civil_dusk",
+    "civil_dawn",
+    "nautical_dusk",
+    "nautical_dawn",
+    "astronomical_dusk",
+    "astronomical_dawn",
+    "moonrise",
+    "moonset",
+)
+
+
+def night_of(when, longitude):
+    """
+    The night a moment belongs to, changing over at local mean noon.
+    Args:
+        when (datetime.datetime): A timezone aware time.
+        longitude (float): The site longitude in degrees, east positive.
+    Returns:
+        datetime.date: The local date of the evening of the night.
+    """
+    utc = when.astimezone(datetime.timezone.utc)
+    return (utc + datetime.timedelta(hours=longitude / 15 - 12)).date()
+
+
+class EphemerisTable:
+    """The sun and moon events of each night at one site."""
+
+    def __init__(
+        self,
+        latitude,
+        longitude,
+        elevation=0,
+        table_file=DEFAULT_TABLE_FILE,
+        prefetch=DEFAULT_PREFETCH,
+    ):
+        """
+        Args:
+            latitude (str or float): The site latitude, "dd:mm:ss" or degrees.
+            longitude (str or float): The site longitude, east positive.
+            elevation (float): The site elevation in metres.
+            table_file (str): The SQLite file holding the table.
+            prefetch (int): Nights computed at once when a night is missing.
+        """
+        self.latitude = seestar_visibility.parse_sexagesimal(latitude)
+        self.longitude = seestar_visibility.parse_sexagesimal(longitude)
+        self.elevation = float(elevation)
+        self.site = f"{self.latitude:.4f},{self.longitude:.4f},{self.elevation:.0f}"
+        self.prefetch = max(int(prefetch), 1)
+        self.nights = {}
+        self.db = sqlite3.connect(table_file)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS nights (site TEXT, night TEXT, %s, "
+            "PRIMARY KEY (site, night))" % ", ".join(f"{e} REAL" for e in EVENTS)
+        )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def observer(self, start):
+        obs = ephem.Observer()
+        obs.lat = str(self.latitude)
+        obs.lon = str(self.longitude)
+        obs.elevation = self.elevation
+        obs.date = start
+        return obs
+
+    def compute_night(self, night):
+        """
+        Compute the events of a night with pyephem.
+        Args:
+            night (datetime.date): The local date of the evening.
+        Returns:
+            dict: The unix time of each event, None if it does not happen.
+        """
+        # start from local mean noon so the evening events come first
+        noon = datetime.datetime.combine(
+            night, datetime.time(12), datetime.timezone.utc
+        ) - datetime.timedelta(hours=self.longitude / 15)
+        obs = self.observer(noon)
+        sun = ephem.Sun()
+        events = {}
+
+        def event(name, fn, body, **kwargs):
+            try:
+                when = fn(body, **kwargs).datetime()
+            except (ephem.AlwaysUpError, ephem.NeverUpError):
+                events[name] = None
+                return
+            events[name] = when.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+        event("sunset", obs.next_setting, sun)
+        event("sunrise", obs.next_rising, sun)
+        for kind, horizon in TWILIGHT_HORIZONS.items():
+            obs.horizon = horizon
+            event(f"{kind}_dusk", obs.next_setting, sun, use_center=True)
+            event(f"{kind}_dawn", obs.next_rising, sun, use_center=True)
+        obs.horizon = "0"
+        moon = ephem.Moon()
+        event("moonrise", obs.next_rising, moon)
+        event("moonset", obs.next_setting, moon)
+        return events
+
+    def precompute(self, first_night, count):
+        """Compute and store the nights from first_night that are not in the table."""
+        nights = [first_night + datetime.timedelta(days=i) for i in range(count)]
+        stored = self.load(nights)
+        rows = []
+        for night in nights:
+            if night in stored:
+                continue
+            events = self.compute_night(night)
+            self.nights[night] = events
+            rows.append([self.site, night.isoformat()] + [events[e] for e in EVENTS])
+        if rows:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO nights VALUES (%s)"
+                % ",".join("?" * (len(EVENTS) + 2)),
+                rows,
+            )
+            self.db.commit()
+
+    def load(self, nights):
+        """Read the stored nights into memory, returning the ones found."""
+        found = set()
+        rows = self.db.execute(
+            "SELECT night, %s FROM nights WHERE site = ? AND night >= ? AND night <= ?"
+            % ", ".join(EVENTS),
+            (self.site, min(nights).isoformat(), max(nights).isoformat()),
+        )
+        for row in rows:
+            night = datetime.date.fromisoformat(row[0])
+            self.nights[night] = dict(zip(EVENTS, row[1:]))
+            found.add(night)
+        return found
+
+    def night(self, night):
+        """
+        The events of a night, computed and stored first if need be.
+        Args:
+            night (datetime.date): The local date of the evening.
+        Returns:
+            dict: The time of each event as an aware UTC datetime, or None.
+        """
+        if night not in self.nights:
+            self.precompute(night, self.prefetch)
+        return {
+            name: (
+                None
+                if when is None
+                else datetime.datetime.fromtimestamp(when, datetime.timezone.utc)
+            )
+            for name, when in self.nights[night].items()
+        }
+
+    def twilight(self, night, kind="nautical", tz=None):
+        """
+        The evening and morning twilight of a night.
+        Args:
+            night (datetime.date): The local date of the evening.
+            kind (str): "civil", "nautical" or "astronomical".
+            tz (datetime.tzinfo): The timezone of the returned times, UTC if None.
+        Returns:
+            tuple: The dusk and dawn datetimes.
+        """
+        events = self.night(night)
+        dusk, dawn = events[f"{kind}_dusk"], events[f"{kind}_dawn"]
+        if dusk is None or dawn is None:
+            raise RuntimeError(f"No {kind} twilight on {night} at {self.site}")
+        if tz is not None:
+            dusk, dawn = dusk.astimezone(tz), dawn.astimezone(tz)
+        return dusk, dawn
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seestar Ephemeris")
+    parser.add_argument("latitude", type=str, help="Site latitude dd:mm:ss")
+    parser.add_argument("longitude", type=str, help="Site longitude dd:mm:ss, E +ve")
+    parser.add_argument("elevation", type=float, help="Site elevation in metres")
+    parser.add_argument("--start", type=str, help="First night YYYY-MM-DD")
+    parser.add_argument("--days", type=int, default=DEFAULT_PREFETCH)
+    args = parser.parse_args()
+    table = EphemerisTable(args.latitude, args.longitude, args.elevation)
+    if args.start:
+        start = datetime.date.fromisoformat(args.start)
+    else:
+        start = night_of(datetime.datetime.now(datetime.timezone.utc), table.longitude)
+    table.precompute(start, args.days)
+    for i in range(args.days):
+        night = start + datetime.timedelta(days=i)
+        dusk, dawn = table.twilight(night, "astronomical")
+        print(f"{night}  astronomical twilight {dusk:%H:%M} - {dawn:%H:%M} UTC")
@@ -0,0 +1,316 @@
+"""Sub exposures and total times set from the magnitude of each target.
+
+A fixed ExpTime saturates the bright targets (an S50 sub saturates at about
+8.5 mag in 10 s) and leaves the faint ones at a low SNR. The exposure of
+every target is instead looked up in a table computed once for the S50: the
+SNR of a star in one sub and whether its peak saturates, for a grid of
+magnitudes and the sub exposures the unit offers. For all targets at once:
+
+    the sub exposure is the longest that does not saturate the target at
+    its magnitude less a margin, as a variable may brighten;
+    the total time is enough subs for the stacked SNR goal, no less than
+    MIN_SUBS, and no more than the manifest's TotalExp, which is the most
+    time the target is given.
+
+The magnitude of a target is the last one measured in its light curve from
+seestar_photometry.py, else the Mag column of the manifest, else that of the
+nearest star of the local comparison catalogue within a few arcseconds.
+Targets with no magnitude keep the ExpTime and TotalExp of the manifest.
+
+Usage:
+    python seestar_exposure.py demo_targets.dat --catalog comparison_catalog
+    python seestar_exposure.py --table
+    python seestar_schedule.py demo_targets.dat --exposures --snr 50
+"""
+
+import argparse
+import csv
+import functools
+import os
+
+import numpy as np
+
+import seestar_manifest
+
+EXPOSURES = np.array([10.0, 20.0, 30.0, 60.0])  # the S50 sub exposures in seconds
+SATURATION_MAG = 8.5  # the magnitude that saturates a sub of REFERENCE_EXPOSURE
+REFERENCE_EXPOSURE = 10.0
+SATURATION_MARGIN = 0.5  # magnitudes a target may brighten by
+FULL_WELL = 11000.0  # electrons in the peak pixel at saturation
+PEAK_FRACTION = 0.1  # of the light of a star in its brightest pixel
+SKY_BRIGHTNESS = 20.0  # magnitudes per square arcsecond, a suburban sky
+PIXEL_SCALE = 2.4  # arcseconds per pixel
+READ_NOISE = 2.0  # electrons
+APERTURE = 6.0  # pixels, as seestar_photometry measures
+MAG_GRID = np.round(np.arange(4.0, 18.0001, 0.05), 2)
+MAG_STEP = 0.05
+GOAL_SNR = 100.0  # a hundredth of a magnitude from the stack of a visit
+MIN_SUBS = 3
+MATCH_RADIUS = 5.0  # arcseconds between a target and its catalogue star
+LIGHTCURVE_DIR = "photometry"
+
+
+def star_rate(mag):
+    """The electrons per second from a star of a magnitude, over all its pixels."""
+    saturating = FULL_WELL / (PEAK_FRACTION * REFERENCE_EXPOSURE)
+    return saturating * 10 ** (-0.4 * (np.asarray(mag, dtype=float) - SATURATION_MAG))
+
+
+def sub_snr(mag, exposure):
+    """
+    The CCD equation for a star in one sub, broadcasting like NumPy.
+    Args:
+        mag (array): The magnitudes.
+        exposure (array): The sub exposures in seconds.
+    Returns:
+        numpy.ndarray: The signal to noise ratio in an APERTURE radius.
+    """
+    signal = star_rate(mag) * exposure
+    sky = star_rate(SKY_BRIGHTNESS - 2.5 * np.log10(PIXEL_SCALE**2)) * exposure
+    pixels = np.pi * APERTURE**2
+    return signal / np.sqrt(signal + pixels * (sky + READ_NOISE**2))
+
+
+@functools.lru_cache(maxsize=None)
+def exposure_table():
+    """
+    The SNR and saturation of each grid magnitude at each sub exposure,
+    computed once.
+    Returns:
+        tuple: (magnitudes, exposures) arrays of the SNR and of whether the
+            peak pixel saturates.
+    """
+    mag = MAG_GRID[:, None]
+    snr = sub_snr(mag, EXPOSURES)
+    saturated = star_rate(mag) * EXPOSURES * PEAK_FRACTION >= FULL_WELL
+    snr.flags.writeable = False
+    saturated.flags.writeable = False
+    return snr, saturated
+
+
+def grid_rows(mags):
+    """The table row of each magnitude, clipped to the grid."""
+    rows = np.rint((np.asarray(mags, dtype=float) - MAG_GRID[0]) / MAG_STEP)
+    return np.clip(np.nan_to_num(rows), 0, len(MAG_GRID) - 1).astype(int)
+
+
+def plan_exposures(
+    mags,
+    max_total=None,
+    goal_snr=GOAL_SNR,
+    min_subs=MIN_SUBS,
+    margin=SATURATION_MARGIN,
+):
+    """
+    The sub exposure and total time of each target in one pass.
+    Args:
+        mags (array): The magnitude of each target, NaN if not known.
+        max_total (array): The most seconds each target may have, no limit if None.
+        goal_snr (float): The SNR wanted from the stacked subs of a visit.
+        min_subs (int): The fewest subs of a visit.
+        margin (float): The magnitudes a target may brighten without saturating.
+    Returns:
+        dict: Arrays of the exptime, total, subs, the expected stacked snr and
+            the status: "ok", "saturated" if even the shortest sub saturates,
+            "faint" if the goal needs more than max_total, or "unknown".
+    """
+    mags = np.asarray(mags, dtype=float)
+    snr_table, saturated_table = exposure_table()
+    usable = ~saturated_table[grid_rows(mags - margin)]
+    # the longest sub that is usable, the shortest one if none is
+    longest = len(EXPOSURES) - 1 - np.argmax(usable[:, ::-1], axis=1)
+    choice = np.where(usable.any(axis=1), longest, 0)
+    exptime = EXPOSURES[choice]
+    snr = snr_table[grid_rows(mags), choice]
+    subs = np.maximum(np.ceil((goal_snr / np.maximum(snr, 1e-3)) ** 2), min_subs)
+    faint = np.zeros(len(mags), dtype=bool)
+    if max_total is not None:
+        allowed = np.maximum(np.floor(np.asarray(max_total, float) / exptime), 1)
+        faint = subs > allowed
+        subs = np.minimum(subs, allowed)
+    status = np.where(faint, "faint", "ok").astype(object)
+    status[~usable.any(axis=1)] = "saturated"
+    status[np.isnan(mags)] = "unknown"
+    return {
+        "exptime": exptime,
+        "total": subs * exptime,
+        "subs": subs.astype(int),
+        "snr": snr * np.sqrt(subs),
+        "status": status,
+    }
+
+
+def latest_magnitude(path):
+    """The last magnitude measured in a seestar_photometry light curve, or NaN."""
+    if not os.path.exists(path):
+        return np.nan
+    with open(path, newline="") as f:
+        mags = [float(row["mag"]) for row in csv.DictReader(f) if row["mag"]]
+    finite = [mag for mag in mags if np.isfinite(mag)]
+    return finite[-1] if finite else np.nan
+
+
+def target_magnitudes(
+    names, manifest_mags=None, ra=None, dec=None, catalog=None, lightcurves=None
+):
+    """
+    The magnitude of each target from the best source that has one.
+    Args:
+        names (array): The target names.
+        manifest_mags (array): The Mag column of the manifest, if it has one.
+        ra (array): The target right ascensions in degrees, for the catalogue.
+        dec (array): The target declinations in degrees.
+        catalog (seestar_catalog.StarCatalog): The local comparison catalogue.
+        lightcurves (str): The folder of the seestar_photometry light curves.
+    Returns:
+        tuple: The magnitudes, NaN where none was found, and their sources.
+    """
+    count = len(names)
+    mags = np.full(count, np.nan)
+    sources = np.full(count, "none", dtype=object)
+
+    def fill(values, source):
+        values = np.asarray(values, dtype=float)
+        missing = np.isnan(mags) & np.isfinite(values)
+        mags[missing] = values[missing]
+        sources[missing] = source
+
+    if lightcurves is not None:
+        fill(
+            [
+                latest_magnitude(os.path.join(lightcurves, f"{name}.csv"))
+                for name in names
+            ],
+            "lightcurve",
+        )
+    if manifest_mags is not None:
+        text = np.asarray(manifest_mags, dtype=str)
+        fill(np.where(np.char.strip(text) == "", "nan", text), "manifest")
+    if catalog is not None and ra is not None:
+        import seestar_catalog
+        import seestar_slew
+
+        # the nearest star of every target in one query
+        distance, index = catalog.tree.query(
+            seestar_slew.unit_vectors(ra, dec),
+            distance_upper_bound=seestar_catalog.chord(MATCH_RADIUS / 3600),
+        )
+        found = np.isfinite(distance)
+        values = np.full(count, np.nan)
+        values[found] = catalog.mag[index[found]]
+        fill(values, "catalog")
+    return mags, sources
+
+
+def plan_manifest(
+    manifest,
+    resolver=None,
+    catalog=None,
+    lightcurves=LIGHTCURVE_DIR,
+    goal_snr=GOAL_SNR,
+):
+    """
+    Set the ExpTime and TotalExp of the targets of a manifest from their
+    magnitudes, with the manifest's TotalExp as the most time of each.
+    Args:
+        manifest (Manifest or str): The manifest, or the file to read it from.
+        resolver (SimbadResolver): Looks up the targets for the catalogue.
+        catalog (seestar_catalog.StarCatalog): The local comparison catalogue.
+        lightcurves (str): The folder of the light curves, None to ignore them.
+        goal_snr (float): The SNR wanted from the subs of a visit.
+    Returns:
+        tuple: The Manifest with the new columns and a Mag column, and the
+            plan of plan_exposures with the magnitudes and their sources.
+    """
+    if not isinstance(manifest, seestar_manifest.Manifest):
+        manifest = seestar_manifest.read_manifest(manifest)
+    targets = dict(manifest.targets)
+    names = targets["Name"]
+    ra = dec = None
+    if catalog is not None:
+        if resolver is None:
+            import seestar_resolver
+
+            resolver = seestar_resolver.SimbadResolver(offline=True)
+        ra, dec = resolver.resolve(list(names))
+    mags, sources = target_magnitudes(
+        names, targets.get("Mag"), ra, dec, catalog, lightcurves
+    )
+    max_total = targets["TotalExp"].astype(float)
+    plan = plan_exposures(mags, max_total, goal_snr)
+    known = np.isfinite(mags)
+    targets["ExpTime"] = np.where(known, plan["exptime"], targets["ExpTime"])
+    targets["TotalExp"] = np.where(known, plan["total"], max_total)
+    targets["Mag"] = mags
+    # the plan shows what the targets without a magnitude keep
+    plan["exptime"] = targets["ExpTime"].astype(float)
+    plan["total"] = targets["TotalExp"].astype(float)
+    plan["subs"] = np.floor(plan["total"] / plan["exptime"]).astype(int)
+    plan["snr"] = np.where(known, plan["snr"], np.nan)
+    plan["mag"] = mags
+    plan["source"] = sources
+    return (
+        seestar_manifest.Manifest(
+            manifest.site, manifest.config, targets, manifest.path
+        ),
+        plan,
+    )
+
+
+def print_plan(names, plan):
+    """Print the magnitude, sub exposure and total time chosen for each target."""
+    print(
+        f"{'target':24s} {'mag':>6s} {'source':>10s} {'exp':>5s} {'subs':>5s} "
+        f"{'total':>6s} {'snr':>6s}  status"
+    )
+    for i, name in enumerate(names):
+        print(
+            f"{str(name):24s} {plan['mag'][i]:6.2f} {plan['source'][i]:>10s} "
+            f"{plan['exptime'][i]:5.0f} {plan['subs'][i]:5d} {plan['total'][i]:6.0f} "
+            f"{plan['snr'][i]:6.0f}  {plan['status'][i]}"
+        )
+
+
+def print_table():
+    """Print the SNR of one sub, marking saturated subs with an asterisk."""
+    snr, saturated = exposure_table()
+    print("  mag " + "".join(f"{exposure:8.0f}s" for exposure in EXPOSURES))
+    for i in range(0, len(MAG_GRID), 10):
+        cells = "".join(
+            f"{snr[i, j]:8.0f}{'*' if saturated[i, j] else ' '}"
+            for j in range(len(EXPOSURES))
+        )
+        print(f"{MAG_GRID[i]:5.1f} {cells}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seestar Exposure Planner")
+    parser.add_argument("target_file", type=str, nargs="?", help="The target list file")
+    parser.add_argument(
+        "--catalog", type=str, help="Look magnitudes up in this catalogue folder"
+    )
+    parser.add_argument(
+        "--lightcurves",
+        type=str,
+        default=LIGHTCURVE_DIR,
+        help="Take the latest magnitudes from the light curves in this folder",
+    )
+    parser.add_argument(
+        "--snr", type=float, default=GOAL_SNR, help="The SNR wanted from each visit"
+    )
+    parser.add_argument(
+        "--table", action="store_true", help="Print the S50 lookup table and exit"
+    )
+    args = parser.parse_args()
+    if args.table or args.target_file is None:
+        print_table()
+    else:
+        catalog = None
+        if args.catalog:
+            import seestar_catalog
+
+            catalog = seestar_catalog.StarCatalog(args.catalog)
+        manifest, plan = plan_manifest(
+            args.target_file, None, catalog, args.lightcurves, args.snr
+        )
+        print_plan(manifest.targets["Name"], plan)
@@ -0,0 +1,303 @@
+"""Run the targets of one manifest on several SeeStar units at once.
+
+Each unit in the fleet configuration (seestar_varstar_params.fleet) gets a
+worker thread holding one long-lived SeestarSession. The workers take
+targets from a shared queue, so every target goes to whichever unit is free
+next. A target that fails on a unit goes back on the queue for another try
+(up to max_attempts), and a unit that keeps failing is retired so that its
+share of the work flows to the others. Given the visibility of the targets,
+a target that is not up for its whole exposure goes back on the queue until
+it is, or is dropped once it will not be up again tonight. All units log through the
+seestar_varstar logger and their results are gathered in one list.
+
+Usage:
+    dispatcher = FleetDispatcher(sp.fleet, logger)
+    results = dispatcher.run(target_names, ras, decs, exptimes, stack_times)
+"""
+
+import concurrent.futures
+import datetime
+import json
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+import seestar_planner
+import seestar_run
+import seestar_timing
+
+# seconds a unit waits when none of the queued targets is up
+DOWN_WAIT = 60
+
+
+def fleet_units(params):
+    """
+    The units of the fleet configuration, or the single unit of ip/port.
+    Args:
+        params (module): The seestar_varstar_params module.
+    Returns:
+        list: A dict with the name, ip and port of each unit.
+    """
+    units = getattr(params, "fleet", None)
+    if not units:
+        units = [{"name": "S50", "ip": params.ip, "port": params.port}]
+    return [
+        {
+            "name": unit.get("name", f"{unit['ip']}:{unit['port']}"),
+            "ip": unit["ip"],
+            "port": unit["port"],
+        }
+        for unit in units
+    ]
+
+
+class FleetDispatcher:
+    """Hand the targets of a manifest to whichever unit of the fleet is free."""
+
+    def __init__(
+        self,
+        units,
+        logger=None,
+        deadline=None,
+        repeat=False,
+        max_attempts=3,
+        max_unit_failures=3,
+        session_factory=None,
+        grid=None,
+        min_alt=seestar_planner.MIN_ALTITUDE,
+    ):
+        """
+        Args:
+            units (list): The name, ip and port of each unit, see fleet_units().
+            logger (logging.Logger): The combined log of all units.
+            deadline (datetime.datetime): Start no target after this aware time.
+            repeat (bool): Put each target back on the queue after it is observed.
+            max_attempts (int): The tries a target gets before it is given up.
+            max_unit_failures (int): Failures in a row before a unit is retired.
+            session_factory (callable): Makes the session of a unit from its dict,
+                a seestar_run.SeestarSession by default.
+            grid (seestar_visibility.VisibilityGrid): The visibility of the
+                targets tonight, None to hand them out whatever their altitude.
+            min_alt (float): Targets must stay above this for the whole exposure.
+        """
+        self.units = units
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.deadline = deadline
+        self.repeat = repeat
+        self.max_attempts = max_attempts
+        self.max_unit_failures = max_unit_failures
+        self.session_factory = (
+            session_factory if session_factory is not None else self.make_session
+        )
+        self.jobs = queue.Queue()
+        self.outstanding = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.results = []
+        self.retired = []
+        self.sessions = {}
+        self.grid = grid
+        self.up = None
+        if grid is not None:
+            self.up = seestar_planner.observable_cells(grid, min_alt)
+
+    def make_session(self, unit):
+        return seestar_run.SeestarSession(
+            unit["ip"],
+            unit["port"],
+            # a child of the dispatcher's logger, so every unit writes to its log
+            logger=self.logger.getChild(unit["name"]),
+            timing=seestar_timing.TimingRecorder(unit=unit["name"]),
+        )
+
+    def past_deadline(self):
+        return (
+            self.deadline is not None
+            and datetime.datetime.now(self.deadline.tzinfo) > self.deadline
+        )
+
+    def stop(self):
+        """Stop handing out targets and cancel the waits of every unit."""
+        self.stop_event.set()
+        with self.lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.cancel()
+
+    def finish(self, job):
+        """Account for a target that will not be queued again."""
+        with self.lock:
+            self.outstanding -= 1
+
+    def run(self, target_names, ras, decs, exptimes, stack_times):
+        """
+        Observe the targets on the fleet, returning when all are done, the
+        deadline has passed or every unit is retired.
+        Returns:
+            list: A dict per observation attempt with the target, unit, status,
+                start and end times.
+        """
+        for i in range(len(target_names)):
+            job = {
+                "index": i,
+                "target": str(target_names[i]),
+                "ra": float(ras[i]),
+                "dec": float(decs[i]),
+                "exptime": float(exptimes[i]),
+                "totaltime": float(stack_times[i]),
+                "attempts": 0,
+            }
+            self.jobs.put(job)
+            self.outstanding += 1
+        self.logger.info(
+            f"Dispatching {self.outstanding} targets to {len(self.units)} units"
+        )
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(self.units), thread_name_prefix="seestar_fleet"
+        ) as pool:
+            futures = [pool.submit(self.run_unit, unit) for unit in self.units]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+        unassigned = []
+        while not self.jobs.empty():
+            unassigned.append(self.jobs.get_nowait()["target"])
+        if unassigned:
+            self.logger.error(f"Targets not observed by any unit: {unassigned}")
+        self.logger.info(self.summary())
+        return self.results
+
+    def fits(self, job, begin):
+        """Whether a target stays up for its whole exposure from each begin time."""
+        begin = np.atleast_1d(np.asarray(begin, dtype=float))
+        return seestar_planner.fits_at(
+            self.up[np.full(len(begin), job["index"])],
+            self.grid,
+            begin,
+            np.full(len(begin), job["totaltime"]),
+        )
+
+    def next_job(self):
+        """The next target that is up, or None when this unit should stop."""
+        skipped = 0
+        while not self.stop_event.is_set() and not self.past_deadline():
+            with self.lock:
+                if self.outstanding == 0:
+                    return None
+            try:
+                job = self.jobs.get(timeout=1)
+            except queue.Empty:
+                continue
+            if self.grid is None:
+                return job
+            now = time.time()
+            if self.fits(job, now)[0]:
+                return job
+            later = self.grid.times[self.grid.times > now]
+            if not self.fits(job, later).any():
+                self.logger.warning(
+                    f"{job['target']} is not up again tonight, dropping it"
+                )
+                self.finish(job)
+                continue
+            # not up yet, put it back until it rises
+            self.jobs.put(job)
+            skipped += 1
+            if skipped > self.jobs.qsize():
+                self.stop_event.wait(DOWN_WAIT)
+                skipped = 0
+        return None
+
+    def run_unit(self, unit):
+        name = unit["name"]
+        session = None
+        failures = 0
+        try:
+            while failures < self.max_unit_failures:
+                job = self.next_job()
+                if job is None:
+                    break
+                job["attempts"] += 1
+                result = {
+                    "target": job["target"],
+                    "unit": name,
+                    "attempt": job["attempts"],
+                    "start": time.time(),
+                }
+                try:
+                    if session is None:
+                        session = self.session_factory(unit)
+                        with self.lock:
+                            self.sessions[name] = session
+                        session.connect()
+                    self.logger.info(f"[{name}] Run {job['target']}")
+                    session.observe(
+                        job["target"],
+                        job["ra"],
+                        job["dec"],
+                        job["exptime"],
+                        job["totaltime"],
+                        ra_unit="degrees",
+                    )
+                    result["status"] = "ok"
+                    failures = 0
+                except Exception as e:
+                    result["status"] = "failed"
+                    result["error"] = str(e)
+                    failures += 1
+                    self.logger.error(f"[{name}] {job['target']} failed - {e}")
+                    if isinstance(e, ConnectionError) and session is not None:
+                        # the link stalled, connect afresh for the next target
+                        session.close()
+                        session = None
+                    if session is not None and session.s is None:
+                        # the connection could not be made, try again next time
+                        session = None
+                result["end"] = time.time()
+                with self.lock:
+                    self.results.append(result)
+                if result["status"] == "ok" and self.repeat:
+                    job["attempts"] = 0
+                    self.jobs.put(job)
+                elif (
+                    result["status"] == "failed" and job["attempts"] < self.max_attempts
+                ):
+                    # let another unit have a go
+                    self.jobs.put(job)
+                else:
+                    self.finish(job)
+            if failures >= self.max_unit_failures:
+                self.logger.error(
+                    f"[{name}] retired after {failures} failures in a row"
+                )
+                with self.lock:
+                    self.retired.append(name)
+                    if len(self.retired) == len(self.units):
+                        self.stop_event.set()
+        finally:
+            if session is not None:
+                session.close()
+            with self.lock:
+                self.sessions.pop(name, None)
+
+    def summary(self):
+        """A table of the observations of each unit."""
+        lines = ["Fleet results:"]
+        for unit in self.units:
+            mine = [r for r in self.results if r["unit"] == unit["name"]]
+            ok = [r for r in mine if r["status"] == "ok"]
+            busy = sum(r["end"] - r["start"] for r in ok)
+            state = "retired" if unit["name"] in self.retired else "ok"
+            lines.append(
+                f"  {unit['name']:12s} {len(ok):4d} observed {len(mine) - len(ok):4d} "
+                f"failed {busy / 3600:6.2f} h busy ({state})"
+            )
+        return "\n".join(lines)
+
+    def write_results(self, path):
+        """Write the results as JSON lines."""
+        with open(path, "w") as f:
+            for result in self.results:
+                f.write(json.dumps(result) + "\n")
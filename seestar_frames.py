@@ -0,0 +1,537 @@
+"""Copy the subs a SeeStar saved for each target while it observes the next.
+
+set_stack_settings turns on save_discrete_frame, so the unit keeps every
+sub of a stack in a <target>_sub folder. FrameRetriever pulls the folder of
+a finished target in the background, with a small pool of worker threads,
+while the next target is slewing or stacking:
+
+    a transfer goes to <name>.part and resumes from its size after a drop
+    or a restart, so nothing already copied is fetched again;
+    a finished transfer is checked against a fresh size of the source
+    frame, so a sub the unit is still writing is resumed rather than kept
+    short, and against the SHA-256 when the source gives one; its hash is
+    added to the SHA256SUMS file of the folder before the .part is renamed;
+    the folder of a target is listed again on the next retrieve() and on
+    close(), so subs written after the first listing are copied too;
+    all workers share one token bucket, so the copy never takes more than
+    its bandwidth from the Wi-Fi link the commands go over.
+
+A source lists a folder and reads a frame from an offset. DirectorySource
+reads a local or mounted folder, such as the unit's share mounted over SMB.
+HttpSource reads from a FrameServer, the HTTP stand-in that serves a local
+folder with an index of sizes and hashes and byte ranges for resuming.
+
+Usage:
+    retriever = FrameRetriever(DirectorySource("/mnt/seestar/MyWorks"), "frames")
+    retriever.retrieve("M42")       # returns at once, copies in the background
+    retriever.close()               # waits for the copies to finish
+    python seestar_frames.py serve /data/MyWorks --port 8000
+    python seestar_frames.py fetch http://127.0.0.1:8000 M42 --destination frames
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import http.server
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+FOLDER_FORMAT = "{target}_sub"
+CHECKSUM_FILE = "SHA256SUMS"
+CHUNK_SIZE = 256 * 1024
+DEFAULT_WORKERS = 2
+# bytes per second, about a fifth of a good 2.4 GHz link
+DEFAULT_BANDWIDTH = 1_000_000
+
+
+class ChecksumMismatch(IOError):
+    """A copied frame does not match the size or hash of the source."""
+
+
+class RateLimiter:
+    """A token bucket shared by every transfer."""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        """
+        Args:
+            rate (float): Bytes per second, None for no limit.
+            burst (float): The bytes that may go at once, a quarter second's worth if None.
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else (rate or 0) / 4
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.last = clock()
+
+    def consume(self, nbytes):
+        """Wait until nbytes may be sent."""
+        if not self.rate:
+            return
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # go into debt, the next caller waits it off
+            self.tokens -= nbytes
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+def file_sha256(path, chunk_size=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DirectorySource:
+    """The frames of a local or mounted folder."""
+
+    def __init__(self, root, checksums=False):
+        """
+        Args:
+            root (str): The folder holding the <target>_sub folders.
+            checksums (bool): Hash the source frames too. Off by default, as
+                over a mounted share it reads every frame twice.
+        """
+        self.root = root
+        self.checksums = checksums
+
+    def list(self, folder):
+        """
+        Returns:
+            list: A dict with the name, size and, if checksums is set, the
+                sha256 of each frame, by name.
+        """
+        path = os.path.join(self.root, folder)
+        if not os.path.isdir(path):
+            return []
+        frames = []
+        for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+            if not entry.is_file():
+                continue
+            frame = {"name": entry.name, "size": entry.stat().st_size}
+            if self.checksums:
+                frame["sha256"] = file_sha256(entry.path)
+            frames.append(frame)
+        return frames
+
+    def open(self, folder, name, offset=0):
+        """A binary stream of a frame from an offset."""
+        f = open(os.path.join(self.root, folder, name), "rb")
+        f.seek(offset)
+        return f
+
+    def size(self, folder, name):
+        """The current size of a frame in bytes."""
+        return os.path.getsize(os.path.join(self.root, folder, name))
+
+
+class HttpSource:
+    """The frames served by a FrameServer."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def url(self, *parts):
+        return "/".join([self.base_url] + [urllib.parse.quote(part) for part in parts])
+
+    def list(self, folder):
+        try:
+            with urllib.request.urlopen(
+                self.url(folder) + "/", timeout=self.timeout
+            ) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return []
+            raise
+
+    def size(self, folder, name):
+        request = urllib.request.Request(self.url(folder, name), method="HEAD")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return int(response.headers["Content-Length"])
+
+    def open(self, folder, name, offset=0):
+        request = urllib.request.Request(self.url(folder, name))
+        if offset:
+            request.add_header("Range", f"bytes={offset}-")
+        response = urllib.request.urlopen(request, timeout=self.timeout)
+        if offset and response.status != 206:
+            # the server sent the whole frame, skip what we have
+            remaining = offset
+            while remaining:
+                skipped = len(response.read(min(remaining, CHUNK_SIZE)))
+                if not skipped:
+                    break
+                remaining -= skipped
+        return response
+
+
+def make_source(location, checksums=False):
+    """A HttpSource for an http(s) URL, a DirectorySource for anything else."""
+    if location.startswith(("http://", "https://")):
+        return HttpSource(location)
+    return DirectorySource(location, checksums)
+
+
+class FrameRetriever:
+    """Copy the frames of finished targets in the background."""
+
+    def __init__(
+        self,
+        source,
+        destination,
+        workers=DEFAULT_WORKERS,
+        bandwidth=DEFAULT_BANDWIDTH,
+        retries=3,
+        logger=None,
+        on_frame=None,
+    ):
+        """
+        Args:
+            source (DirectorySource or HttpSource): Where the frames are read from.
+            destination (str): The local folder the <target>_sub folders go in.
+            workers (int): The frames copied at once.
+            bandwidth (float): Bytes per second over all workers, None for no limit.
+            retries (int): Attempts at a frame before it is given up.
+            logger (logging.Logger): The logger to write to.
+            on_frame (callable): Called with the target and local path of each
+                frame once it is on disk, from a worker thread.
+        """
+        self.source = source
+        self.destination = destination
+        self.limiter = RateLimiter(bandwidth)
+        self.retries = retries
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.on_frame = on_frame
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="frames"
+        )
+        self.lock = threading.Lock()
+        self.futures = []
+        # the local paths being copied, and those given to on_frame already
+        self.queued = set()
+        self.handed_off = set()
+        # the targets listed once, to be listed again for late subs
+        self.unswept = []
+        self.copied = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def retrieve(self, target):
+        """
+        Queue the frames of a finished target, returning at once.
+        Args:
+            target (str): The target name, as given to goto_target.
+        Returns:
+            list: The futures of the queued frames, each giving the local path.
+        """
+        # the unit has long finished writing the subs of the earlier targets
+        self.sweep()
+        futures = self.queue(target)
+        with self.lock:
+            self.unswept.append(target)
+        self.logger.info(f"Retrieving {len(futures)} frames of {target}")
+        return futures
+
+    def sweep(self):
+        """
+        List the folders of the targets retrieved so far once more, queueing
+        the subs that were written after their first listing.
+        Returns:
+            list: The futures of the queued frames.
+        """
+        with self.lock:
+            targets, self.unswept = self.unswept, []
+        futures = []
+        for target in targets:
+            late = self.queue(target)
+            if late:
+                self.logger.info(f"Retrieving {len(late)} late frames of {target}")
+            futures.extend(late)
+        return futures
+
+    def queue(self, target):
+        """Queue the frames of a target that are not here or on their way."""
+        folder = FOLDER_FORMAT.format(target=target)
+        try:
+            frames = self.source.list(folder)
+        except OSError as e:
+            self.logger.error(f"Unable to list the frames of {target} - {e}")
+            return []
+        local = os.path.join(self.destination, folder)
+        if frames:
+            os.makedirs(local, exist_ok=True)
+        futures = []
+        for frame in frames:
+            path = os.path.join(local, frame["name"])
+            with self.lock:
+                if path in self.queued:
+                    continue
+                here = os.path.exists(path) and os.path.getsize(path) == frame["size"]
+                if here:
+                    if path in self.handed_off:
+                        continue
+                    self.skipped += 1
+                    self.handed_off.add(path)
+                else:
+                    self.queued.add(path)
+            if here:
+                if self.on_frame is not None:
+                    self.on_frame(target, path)
+                continue
+            futures.append(self.executor.submit(self.copy, folder, frame, path, target))
+        with self.lock:
+            self.futures.extend(futures)
+        return futures
+
+    def copy(self, folder, frame, path, target=None):
+        """Copy one frame, resuming and retrying as need be."""
+        try:
+            for attempt in range(1, self.retries + 1):
+                try:
+                    self.transfer(folder, frame, path)
+                    with self.lock:
+                        self.copied += 1
+                        self.handed_off.add(path)
+                    if self.on_frame is not None:
+                        self.on_frame(target, path)
+                    return path
+                except (OSError, ChecksumMismatch) as e:
+                    self.logger.warning(
+                        f"Frame {frame['name']} attempt {attempt} failed - {e}"
+                    )
+            with self.lock:
+                self.failed += 1
+            self.logger.error(f"Giving up on frame {frame['name']}")
+            return None
+        finally:
+            with self.lock:
+                self.queued.discard(path)
+
+    def transfer(self, folder, frame, path):
+        part = path + ".part"
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        if offset > frame["size"]:
+            # the source frame was replaced, start over
+            os.remove(part)
+            offset = 0
+        digest = hashlib.sha256()
+        if offset:
+            with open(part, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+        size = offset
+        with self.source.open(folder, frame["name"], offset) as stream, open(
+            part, "ab"
+        ) as out:
+            while size < frame["size"]:
+                nbytes = min(CHUNK_SIZE, frame["size"] - size)
+                self.limiter.consume(nbytes)
+                chunk = stream.read(nbytes)
+                if not chunk:
+                    break
+                out.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+                with self.lock:
+                    self.bytes += len(chunk)
+        if size != frame["size"]:
+            # keep the part, the next attempt resumes from it
+            raise ConnectionError(
+                f"{frame['name']}: got {size} of {frame['size']} bytes"
+            )
+        current = self.source.size(folder, frame["name"])
+        if current != size:
+            # the unit was still writing the sub when it was listed, the next
+            # attempt resumes up to its new size; the listed hash was of the
+            # part written then
+            frame["size"] = current
+            frame.pop("sha256", None)
+            raise ConnectionError(
+                f"{frame['name']}: grew from {size} to {current} bytes"
+            )
+        sha256 = digest.hexdigest()
+        if frame.get("sha256") and frame["sha256"] != sha256:
+            os.remove(part)
+            raise ChecksumMismatch(f"{frame['name']}: SHA-256 does not match")
+        with self.lock:
+            with open(os.path.join(os.path.dirname(path), CHECKSUM_FILE), "a") as sums:
+                sums.write(f"{sha256}  {frame['name']}\n")
+        os.replace(part, path)
+
+    def wait(self, timeout=None):
+        """Wait for the queued frames, returning False if some are still going."""
+        with self.lock:
+            futures = list(self.futures)
+        done, pending = concurrent.futures.wait(futures, timeout)
+        with self.lock:
+            self.futures = [future for future in self.futures if not future.done()]
+        return not pending
+
+    def close(self):
+        self.wait()
+        # the subs of the last target may have been written after its listing
+        self.sweep()
+        self.wait()
+        self.executor.shutdown()
+
+    def stats(self):
+        with self.lock:
+            elapsed = time.perf_counter() - self.started
+            return {
+                "copied": self.copied,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "pending": sum(not future.done() for future in self.futures),
+                "bytes": self.bytes,
+                "rate": self.bytes / elapsed if elapsed > 0 else 0.0,
+            }
+
+    def summary(self):
+        """The stats as one log line."""
+        stats = self.stats()
+        return (
+            f"Frames: {stats['copied']} copied, {stats['skipped']} already here, "
+            f"{stats['failed']} failed, {stats['pending']} pending, "
+            f"{stats['bytes'] / 1e6:.1f} MB at {stats['rate'] / 1e6:.2f} MB/s"
+        )
+
+
+class FrameRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serve a folder's index as JSON and its frames with byte ranges."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        root = self.server.root
+        parts = [
+            urllib.parse.unquote(part)
+            for part in urllib.parse.urlparse(self.path).path.split("/")
+            if part
+        ]
+        if not parts or any(part in (".", "..") for part in parts):
+            self.send_error(404)
+            return
+        path = os.path.join(root, *parts)
+        if self.path.endswith("/") and os.path.isdir(path):
+            self.send_index(path)
+        elif os.path.isfile(path):
+            self.send_frame(path, head)
+        else:
+            self.send_error(404)
+
+    def send_index(self, path):
+        frames = []
+        for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+            if entry.is_file():
+                frames.append(
+                    {
+                        "name": entry.name,
+                        "size": entry.stat().st_size,
+                        "sha256": file_sha256(entry.path),
+                    }
+                )
+        body = json.dumps(frames).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_frame(self, path, head=False):
+        size = os.path.getsize(path)
+        offset = 0
+        ranged = self.headers.get("Range", "")
+        if ranged.startswith("bytes=") and ranged.endswith("-"):
+            offset = min(int(ranged[len("bytes=") : -1]), size)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {offset}-{size - 1}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size - offset))
+        self.end_headers()
+        if head:
+            return
+        with open(path, "rb") as f:
+            f.seek(offset)
+            try:
+                shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+            except ConnectionError:
+                pass
+
+
+class FrameServer(http.server.ThreadingHTTPServer):
+    """The HTTP stand-in for a unit's frames, serving a local folder."""
+
+    daemon_threads = True
+
+    def __init__(self, root, host="127.0.0.1", port=0):
+        self.root = root
+        super().__init__((host, port), FrameRequestHandler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seestar Frame Retrieval")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="Serve a folder of frames over HTTP")
+    serve.add_argument("root", type=str, help="The folder of <target>_sub folders")
+    serve.add_argument("--host", type=str, default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    fetch = subparsers.add_parser("fetch", help="Copy the frames of targets")
+    fetch.add_argument("source", type=str, help="A folder or a FrameServer URL")
+    fetch.add_argument("targets", type=str, nargs="+", help="The target names")
+    fetch.add_argument("--destination", type=str, default="frames")
+    fetch.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    fetch.add_argument(
+        "--bandwidth",
+        type=float,
+        default=DEFAULT_BANDWIDTH,
+        help="Bytes per second, 0 for no limit",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "serve":
+        server = FrameServer(args.root, args.host, args.port)
+        print(f"Serving {args.root} at {server.url}")
+        server.serve_forever()
+    else:
+        with FrameRetriever(
+            make_source(args.source),
+            args.destination,
+            args.workers,
+            args.bandwidth or None,
+        ) as retriever:
+            for target in args.targets:
+                retriever.retrieve(target)
+        print(retriever.summary())
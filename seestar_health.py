@@ -0,0 +1,194 @@
+"""The health of the link to a SeeStar, from the traffic on it.
+
+LinkHealth is told about every request a session sends and every message it
+receives. From that it knows:
+
+    when the link has been idle long enough to need a keepalive, so a
+    test_connection is only sent when nothing else is going on;
+    the round-trip time of every request whose reply came back, matched
+    by id, with its p50, p99 and jitter over a recent window;
+    whether the link has stalled, that is a request has waited longer than
+    the stall deadline while nothing at all was received.
+
+A stalled link and a hung mount look the same from a wait on AutoGoto. With
+the replies to keepalives still arriving and their round-trip times normal,
+the link is fine and it is the mount that has gone quiet.
+
+Usage:
+    health = LinkHealth(idle_interval=5, stall_timeout=15)
+    health.sent(1001, "test_connection")
+    health.received({"id": 1001, "result": 0})
+    health.stats()["p50"]
+"""
+
+import collections
+import threading
+import time
+
+IDLE_INTERVAL = 5  # seconds of quiet before a keepalive
+STALL_TIMEOUT = 15  # seconds a request may wait with nothing received
+
+
+def percentile(values, q):
+    """
+    The q-th percentile of the values, interpolating between ranks as
+    numpy.percentile does, without loading numpy into seestar_run.
+    """
+    values = sorted(values)
+    rank = (len(values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+class LinkStalled(ConnectionError):
+    """Nothing was received for longer than the stall deadline."""
+
+
+class LinkHealth:
+    """Keepalive timing, round-trip times and stall detection of one link."""
+
+    def __init__(
+        self,
+        idle_interval=IDLE_INTERVAL,
+        stall_timeout=STALL_TIMEOUT,
+        window=256,
+        clock=time.monotonic,
+    ):
+        """
+        Args:
+            idle_interval (float): Seconds without traffic before a keepalive is due.
+            stall_timeout (float): Seconds a request may go unanswered with
+                nothing at all received before the link counts as stalled.
+            window (int): The recent round-trip times the stats are taken over.
+            clock (callable): The time source, in seconds.
+        """
+        self.idle_interval = idle_interval
+        self.stall_timeout = stall_timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.rtts = collections.deque(maxlen=window)
+        self.last_sent = self.last_received = clock()
+        self.replies = 0
+        self.lost = 0
+        self.stalls = 0
+        self.is_stalled = False
+
+    @property
+    def check_interval(self):
+        """How often a waiting session should call check(), in seconds."""
+        return min(self.idle_interval, self.stall_timeout) / 2
+
+    def reset(self):
+        """Forget the requests in flight, e.g. after a reconnect."""
+        with self.lock:
+            self.lost += len(self.pending)
+            self.pending.clear()
+            self.last_sent = self.last_received = self.clock()
+            self.is_stalled = False
+
+    def sent(self, cmdid, method):
+        with self.lock:
+            now = self.clock()
+            self.pending[cmdid] = (method, now)
+            self.last_sent = now
+
+    def received(self, message):
+        """
+        Args:
+            message (dict): A parsed message, a reply if it has an "id".
+        Returns:
+            float: The round-trip time if the message answered a request, else None.
+        """
+        with self.lock:
+            now = self.clock()
+            self.last_received = now
+            self.is_stalled = False
+            request = self.pending.pop(message.get("id"), None)
+            if request is None:
+                return None
+            rtt = now - request[1]
+            self.rtts.append(rtt)
+            self.replies += 1
+            return rtt
+
+    def idle(self):
+        """Seconds since anything was sent or received."""
+        return self.clock() - max(self.last_sent, self.last_received)
+
+    def keepalive_due(self):
+        return self.idle() >= self.idle_interval
+
+    def stalled(self):
+        """
+        True if a request has waited longer than the stall deadline and
+        nothing at all was received for as long.
+        """
+        with self.lock:
+            now = self.clock()
+            oldest = min((sent for _, sent in self.pending.values()), default=None)
+            stalled = (
+                oldest is not None
+                and now - oldest > self.stall_timeout
+                and now - self.last_received > self.stall_timeout
+            )
+            if stalled and not self.is_stalled:
+                self.stalls += 1
+            self.is_stalled = stalled
+            return stalled
+
+    def expire(self, max_age=None):
+        """Drop the requests that will not be answered now, counting them lost."""
+        max_age = 4 * self.stall_timeout if max_age is None else max_age
+        with self.lock:
+            now = self.clock()
+            old = [i for i, (_, sent) in self.pending.items() if now - sent > max_age]
+            for cmdid in old:
+                del self.pending[cmdid]
+            self.lost += len(old)
+
+    def stats(self):
+        """
+        Returns:
+            dict: The count, last, p50, p99 and mean round-trip time and the
+                jitter (mean change between successive round trips) in seconds,
+                with the replies, lost requests, stalls and seconds since
+                anything was received.
+        """
+        with self.lock:
+            rtts = list(self.rtts)
+            stats = {
+                "count": len(rtts),
+                "last": rtts[-1] if rtts else None,
+                "p50": percentile(rtts, 50) if rtts else None,
+                "p99": percentile(rtts, 99) if rtts else None,
+                "mean": sum(rtts) / len(rtts) if rtts else None,
+                "jitter": (
+                    sum(abs(b - a) for a, b in zip(rtts, rtts[1:])) / (len(rtts) - 1)
+                    if len(rtts) > 1
+                    else None
+                ),
+                "replies": self.replies,
+                "pending": len(self.pending),
+                "lost": self.lost,
+                "stalls": self.stalls,
+                "last_received_age": self.clock() - self.last_received,
+            }
+        return stats
+
+    def summary(self):
+        """The stats as one log line."""
+        stats = self.stats()
+        if stats["count"] == 0:
+            rtt = "no replies yet"
+        else:
+            jitter = stats["jitter"] or 0.0
+            rtt = (
+                f"rtt p50 {stats['p50'] * 1000:.1f} ms p99 {stats['p99'] * 1000:.1f} ms "
+                f"jitter {jitter * 1000:.1f} ms over {stats['count']}"
+            )
+        return (
+            f"Link: {rtt}, {stats['lost']} lost, {stats['stalls']} stalls, "
+            f"last received {stats['last_received_age']:.1f} s ago"
+        )
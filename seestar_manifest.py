@@ -0,0 +1,147 @@
+"""Read a target manifest in one pass into typed site, config and target columns.
+
+A manifest has up to three sections, as in demo_targets.dat:
+
+    Observatory
+    Latitude:       -35:36:00
+    ...
+    Config
+    Repeat_Targets:       True
+    ...
+    Targets
+    Name, ExpTime, TotalExp, Pause
+    M42,       20,     1200,    30
+
+A plain CSV with a header row and no sections, such as the seestar_varstar
+target lists or an AAVSO target tool export, is read as the Targets section.
+Config values become real booleans and numbers, and each target column
+becomes one NumPy array (int64 or float64 when every value is a number).
+
+Usage:
+    manifest = read_manifest("demo_targets.dat")
+    manifest.config["Repeat_Targets"]   # True
+    manifest.targets["TotalExp"]        # array([1200, 3600, 3600, 3600])
+"""
+
+import csv
+
+import numpy as np
+
+SECTIONS = ("Observatory", "Config", "Targets")
+
+
+def parse_value(value):
+    """
+    Type a config value.
+    Args:
+        value (str): The text after the colon.
+    Returns:
+        bool, int, float or str: True/False (any case) as bools, numbers as
+            numbers, anything else as the stripped text.
+    """
+    value = value.strip()
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+
+def column_array(values):
+    """The values of a column as an int64, float64 or str array."""
+    text = np.array(values, dtype=str)
+    for dtype in (np.int64, np.float64):
+        try:
+            return text.astype(dtype)
+        except ValueError:
+            pass
+    return text.astype(object)
+
+
+class Manifest:
+    """The site, config and target columns of a manifest."""
+
+    def __init__(self, site=None, config=None, targets=None, path=None):
+        """
+        Args:
+            site (dict): The Observatory section, e.g. {"Latitude": "-35:36:00"}.
+            config (dict): The Config section with typed values.
+            targets (dict): An array per target column, by column name.
+            path (str): The file it was read from.
+        """
+        self.site = site if site is not None else {}
+        self.config = config if config is not None else {}
+        self.targets = targets if targets is not None else {}
+        self.path = path
+
+    def __len__(self):
+        return len(self.targets["Name"]) if "Name" in self.targets else 0
+
+    def select(self, rows):
+        """
+        A manifest with some of the targets.
+        Args:
+            rows (array): A boolean mask or the indices of the targets to keep.
+        """
+        targets = {name: column[rows] for name, column in self.targets.items()}
+        return Manifest(self.site, self.config, targets, self.path)
+
+
+def read_manifest(path):
+    """
+    Read a manifest file.
+    Args:
+        path (str): The manifest, with sections or as a plain CSV target list.
+    Returns:
+        Manifest: The typed contents of the file.
+    """
+    site = {}
+    config = {}
+    header = None
+    rows = []
+    section = None
+    with open(path, "r", newline="") as f:
+        for number, line in enumerate(f, 1):
+            stripped = line.strip()
+            if section == "Targets" and header is not None:
+                if stripped:
+                    rows.append(line)
+                continue
+            if not stripped:
+                continue
+            if stripped in SECTIONS:
+                section = stripped
+                continue
+            if section is None or section == "Targets":
+                # a target list header, with or without the Targets line
+                section = "Targets"
+                header = [name.replace(" ", "") for name in next(csv.reader([line]))]
+                continue
+            if ":" not in line:
+                raise ValueError(f"{path}:{number}: expected 'key: value' in {section}")
+            key, value = line.split(":", 1)
+            if section == "Observatory":
+                site[key.strip()] = value.strip()
+            else:
+                config[key.strip()] = parse_value(value)
+    targets = {}
+    if header is not None:
+        # the rows in one go, keeping quoted names such as "R Car, 2" whole
+        fields = [[value.strip() for value in row] for row in csv.reader(rows) if row]
+        for number, row in enumerate(fields):
+            if len(row) != len(header):
+                raise ValueError(
+                    f"{path}: target row {number + 1} has {len(row)} values, "
+                    f"expected {len(header)}"
+                )
+        columns = zip(*fields) if fields else [[] for _ in header]
+        for name, values in zip(header, columns):
+            if name == "Name":
+                # names stay text, even when they look like numbers
+                targets[name] = np.array(values, dtype=object)
+            else:
+                targets[name] = column_array(values)
+    return Manifest(site, config, targets, path)
@@ -0,0 +1,597 @@
+"""Differential photometry of the subs as they come off the unit.
+
+Each sub is measured on its own as soon as it is on disk, and one row per
+sub is appended to the light curve of its target, photometry/<target>.csv,
+so the light curves grow through the night rather than after it.
+
+A frame is opened memory-mapped and only the small stamps around the stars
+are read from it. The stamps of the target, the check star and the
+comparison stars are cut out as one (stars, n, n) array, so centring, the
+sky annulus and the aperture sums are each one NumPy step for all stars:
+
+    the stars are placed from the WCS of the frame when it has one, or else
+    from where they were centred on the previous sub of the target, or else
+    from the pixel positions given in the comparison file;
+    the sky is the median of an annulus and the flux the aperture sum less
+    the sky, with the CCD equation for its error;
+    the zero point of the sub is the weighted mean over the comparison stars
+    that are neither saturated nor off the frame, so the target and check
+    magnitudes are on the scale of the comparison magnitudes, or relative to
+    the comparison ensemble where no magnitudes were given.
+
+The S50 subs are raw Bayer frames, so the apertures sum all four colours and
+the magnitudes are unfiltered.
+
+The comparison file is a CSV with one row per star:
+
+    Target,Star,RA,Dec,Mag,Role,X,Y
+    SS Cyg,SS Cyg,21:42:42.8,+43:35:10,,target,,
+    SS Cyg,000-BCP-306,325.59,43.53,10.45,comp,,
+    SS Cyg,000-BCP-310,325.81,43.72,11.13,check,,
+
+RA and Dec are decimal degrees, or sexagesimal hours and degrees. Mag is
+blank for the target, Role is target, comp or check, and X and Y are
+optional pixel positions for frames without a WCS.
+
+Usage:
+    python seestar_photometry.py process frames/SS_Cyg_sub comps.csv
+    python seestar_photometry.py watch frames comps.csv
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import datetime
+import glob
+import logging
+import os
+import threading
+import time
+import warnings
+
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS, FITSFixedWarning
+
+import seestar_frames
+
+LIGHTCURVE_DIR = "photometry"
+APERTURE = 6.0  # pixels
+ANNULUS = (10.0, 15.0)  # inner and outer sky radii in pixels
+SATURATION = 60000.0  # ADU, near the top of the 16-bit subs
+GAIN = 1.0  # electrons per ADU when the header gives none
+FRAME_PATTERNS = ("*.fit", "*.fits")
+FIELDS = (
+    "file",
+    "time",
+    "jd",
+    "exptime",
+    "mag",
+    "err",
+    "check_mag",
+    "check_err",
+    "comps",
+    "flux",
+    "peak",
+    "flags",
+)
+ROLES = ("target", "check", "comp")
+
+
+def parse_angle(value, hours=False):
+    """
+    Args:
+        value (str): Decimal degrees, or sexagesimal "dd:mm:ss" or "dd mm ss".
+        hours (bool): Sexagesimal values are hours, as for a right ascension.
+    Returns:
+        float: The angle in degrees.
+    """
+    value = value.strip()
+    parts = value.replace(":", " ").split()
+    if len(parts) == 1:
+        return float(value)
+    sign = -1.0 if value.startswith("-") else 1.0
+    angle = sum(abs(float(part)) / 60**i for i, part in enumerate(parts))
+    return sign * angle * (15.0 if hours else 1.0)
+
+
+class StarSet:
+    """The target, check and comparison stars of one field, target first."""
+
+    def __init__(self, ra, dec, mag, role, names=None, x=None, y=None):
+        """
+        Args:
+            ra (array): The right ascensions in degrees.
+            dec (array): The declinations in degrees.
+            mag (array): The catalogue magnitudes, NaN where there is none.
+            role (array): "target", "check" or "comp" for each star.
+            names (array): The star names.
+            x (array): Pixel positions for frames without a WCS, NaN if unknown.
+            y (array): As x.
+        """
+        order = np.argsort([ROLES.index(r) for r in role], kind="stable")
+        self.ra = np.asarray(ra, dtype=float)[order]
+        self.dec = np.asarray(dec, dtype=float)[order]
+        self.mag = np.asarray(mag, dtype=float)[order]
+        self.role = np.asarray(role)[order]
+        self.names = np.asarray(names if names is not None else role)[order]
+        count = len(order)
+        self.x = np.full(count, np.nan) if x is None else np.asarray(x, float)[order]
+        self.y = np.full(count, np.nan) if y is None else np.asarray(y, float)[order]
+        if count == 0 or self.role[0] != "target":
+            raise ValueError("A star set needs its target")
+        self.comps = self.role == "comp"
+        self.check = np.flatnonzero(self.role == "check")[:1]
+
+    def __len__(self):
+        return len(self.ra)
+
+
+def read_comparisons(path):
+    """
+    Read a comparison file.
+    Args:
+        path (str): The CSV file, with the columns described in the module docstring.
+    Returns:
+        dict: A StarSet for each target name.
+    Raises:
+        ValueError: A row has an unknown role or a target has no target row.
+    """
+    rows = {}
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            row = {key.strip(): (value or "").strip() for key, value in row.items()}
+            role = row.get("Role", "comp").lower() or "comp"
+            if role not in ROLES:
+                raise ValueError(f"Unknown role {role} for {row['Star']}")
+            rows.setdefault(row["Target"], []).append(
+                (
+                    row["Star"],
+                    parse_angle(row["RA"], hours=True),
+                    parse_angle(row["Dec"]),
+                    float(row.get("Mag") or "nan"),
+                    role,
+                    float(row.get("X") or "nan"),
+                    float(row.get("Y") or "nan"),
+                )
+            )
+    stars = {}
+    for target, columns in rows.items():
+        names, ra, dec, mag, role, x, y = zip(*columns)
+        stars[target] = StarSet(ra, dec, mag, role, names, x, y)
+    return stars
+
+
+def cut_stamps(data, x, y, half):
+    """
+    Cut a square stamp around each position in one fancy-indexing step, which
+    reads only those pixels of a memory-mapped frame.
+    Args:
+        data (numpy.ndarray): The frame, or the planes of a colour frame.
+        x (array): The column of each star.
+        y (array): The row of each star.
+        half (int): Half the stamp width, so stamps are 2 * half + 1 across.
+    Returns:
+        tuple: The (stars, n, n) stamps, their (stars, n) rows and columns, and
+            whether each stamp runs off the frame.
+    """
+    offsets = np.arange(-half, half + 1)
+    rows = np.rint(y).astype(int)[:, None] + offsets
+    cols = np.rint(x).astype(int)[:, None] + offsets
+    height, width = data.shape[-2:]
+    edge = (
+        (rows[:, 0] < 0)
+        | (rows[:, -1] >= height)
+        | (cols[:, 0] < 0)
+        | (cols[:, -1] >= width)
+    )
+    rows = np.clip(rows, 0, height - 1)
+    cols = np.clip(cols, 0, width - 1)
+    # the leading axis of a colour frame is kept, as (planes, stars, n, n)
+    stamps = data[..., rows[:, :, None], cols[:, None, :]]
+    return stamps, rows, cols, edge
+
+
+def measure(
+    data,
+    x,
+    y,
+    aperture=APERTURE,
+    annulus=ANNULUS,
+    gain=GAIN,
+    scale=(1.0, 0.0),
+    centre=True,
+):
+    """
+    Aperture photometry of all stars of a frame at once.
+    Args:
+        data (numpy.ndarray): The frame, as stored if scale is given.
+        x (array): The approximate column of each star.
+        y (array): The approximate row of each star.
+        aperture (float): The aperture radius in pixels.
+        annulus (tuple): The inner and outer sky radii in pixels.
+        gain (float): Electrons per ADU.
+        scale (tuple): The BSCALE and BZERO to apply to the stamps.
+        centre (bool): Centre the apertures on the light in them first.
+    Returns:
+        dict: Arrays of x, y, flux, flux_err, sky, peak and edge, one per star.
+    """
+    x = np.array(x, dtype=float)
+    y = np.array(y, dtype=float)
+    half = int(np.ceil(annulus[1]))
+    bscale, bzero = scale
+    for step in range(2 if centre else 1):
+        stamps, rows, cols, edge = cut_stamps(data, x, y, half)
+        stamps = stamps.astype(float) * bscale + bzero
+        if stamps.ndim == 4:
+            stamps = stamps.sum(axis=0)
+        dy = rows - y[:, None]
+        dx = cols - x[:, None]
+        r2 = dy[:, :, None] ** 2 + dx[:, None, :] ** 2
+        inside = r2 <= aperture**2
+        ring = (r2 >= annulus[0] ** 2) & (r2 <= annulus[1] ** 2) & ~edge[:, None, None]
+        sky_pixels = np.where(ring, stamps, np.nan).reshape(len(x), -1)
+        with np.errstate(all="ignore"):
+            sky = np.nanmedian(sky_pixels, axis=1)
+        if step == 0 and centre:
+            # one centre-of-light step, kept only when it stays in the aperture
+            light = np.where(inside, np.clip(stamps - sky[:, None, None], 0, None), 0)
+            total = light.sum(axis=(1, 2))
+            with np.errstate(all="ignore"):
+                cy = (light.sum(axis=2) * rows).sum(axis=1) / total
+                cx = (light.sum(axis=1) * cols).sum(axis=1) / total
+            moved = np.hypot(cx - x, cy - y)
+            keep = (total > 0) & (moved < aperture)
+            x = np.where(keep, cx, x)
+            y = np.where(keep, cy, y)
+    npix = inside.sum(axis=(1, 2))
+    nsky = ring.sum(axis=(1, 2))
+    with np.errstate(all="ignore"):
+        sky_var = np.nanvar(sky_pixels, axis=1)
+        flux = np.where(inside, stamps, 0).sum(axis=(1, 2)) - sky * npix
+        variance = np.clip(flux, 0, None) / gain + npix * sky_var * (1 + npix / nsky)
+    peak = np.where(inside, stamps, -np.inf).max(axis=(1, 2))
+    return {
+        "x": x,
+        "y": y,
+        "flux": flux,
+        "flux_err": np.sqrt(variance),
+        "sky": sky,
+        "peak": peak,
+        "edge": edge | (nsky == 0),
+    }
+
+
+def differential(stars, photometry, exptime, saturation=SATURATION):
+    """
+    The target and check magnitudes of a frame against its comparison stars.
+    Args:
+        stars (StarSet): The stars measured.
+        photometry (dict): As returned by measure, in the order of stars.
+        exptime (float): The exposure of the frame in seconds.
+        saturation (float): The ADU at which a star is saturated.
+    Returns:
+        dict: mag, err, check_mag, check_err, the comparison stars used and flags.
+    """
+    flux = photometry["flux"]
+    with np.errstate(all="ignore"):
+        inst = -2.5 * np.log10(flux / exptime)
+        inst_err = 2.5 / np.log(10) * photometry["flux_err"] / flux
+    saturated = photometry["peak"] >= saturation
+    good = (flux > 0) & ~saturated & ~photometry["edge"] & np.isfinite(inst_err)
+    use = stars.comps & good
+    flags = []
+    if saturated[0]:
+        flags.append("saturated")
+    if photometry["edge"][0]:
+        flags.append("edge")
+    if not use.any():
+        flags.append("no_comps")
+        return {
+            "mag": np.nan,
+            "err": np.nan,
+            "check_mag": np.nan,
+            "check_err": np.nan,
+            "comps": 0,
+            "flags": flags,
+        }
+    # the comparison stars with catalogue magnitudes set the zero point, and
+    # without any it is that of the ensemble
+    known = use & np.isfinite(stars.mag)
+    if known.any():
+        use = known
+    catalogue = np.nan_to_num(stars.mag, nan=0.0)
+    weights = 1 / inst_err[use] ** 2
+    zero_point = np.sum(weights * (catalogue[use] - inst[use])) / weights.sum()
+    zero_point_err = np.sqrt(1 / weights.sum())
+    mag = inst + zero_point
+    err = np.hypot(inst_err, zero_point_err)
+    check = stars.check
+    return {
+        "mag": mag[0],
+        "err": err[0],
+        "check_mag": mag[check[0]] if len(check) and good[check[0]] else np.nan,
+        "check_err": err[check[0]] if len(check) and good[check[0]] else np.nan,
+        "comps": int(use.sum()),
+        "flags": flags,
+    }
+
+
+def frame_time(header, path):
+    """
+    The mid-exposure time of a frame, from DATE-OBS or else the file time.
+    Returns:
+        tuple: The UTC datetime and the exposure in seconds.
+    """
+    exptime = float(header.get("EXPTIME", header.get("EXPOSURE", 10.0)))
+    start = header.get("DATE-OBS")
+    if start:
+        start = datetime.datetime.fromisoformat(start.rstrip("Z")).replace(
+            tzinfo=datetime.timezone.utc
+        )
+    else:
+        # the file was written when the exposure ended
+        start = datetime.datetime.fromtimestamp(
+            os.path.getmtime(path), datetime.timezone.utc
+        ) - datetime.timedelta(seconds=exptime)
+    return start + datetime.timedelta(seconds=exptime / 2), exptime
+
+
+def julian_date(moment):
+    return moment.timestamp() / 86400 + 2440587.5
+
+
+class PhotometryPipeline:
+    """Measure the subs of each target as they arrive and extend its light curve."""
+
+    def __init__(
+        self,
+        stars,
+        directory=LIGHTCURVE_DIR,
+        aperture=APERTURE,
+        annulus=ANNULUS,
+        saturation=SATURATION,
+        logger=None,
+    ):
+        """
+        Args:
+            stars (dict): A StarSet for each target name, see read_comparisons.
+            directory (str): Where the <target>.csv light curves are written.
+            aperture (float): The aperture radius in pixels.
+            annulus (tuple): The inner and outer sky radii in pixels.
+            saturation (float): The ADU at which a star is saturated.
+            logger (logging.Logger): The logger to write to.
+        """
+        self.stars = stars
+        self.directory = directory
+        self.aperture = aperture
+        self.annulus = annulus
+        self.saturation = saturation
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        # one thread, so the rows of a light curve are appended one at a time
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="photometry"
+        )
+        self.lock = threading.Lock()
+        self.done = {}
+        self.positions = {}
+        self.measured = 0
+        self.skipped = 0
+        self.seconds = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def lightcurve_file(self, target):
+        return os.path.join(self.directory, f"{target}.csv")
+
+    def processed(self, target):
+        """The frames already in the light curve of a target, read once."""
+        if target not in self.done:
+            done = set()
+            path = self.lightcurve_file(target)
+            if os.path.exists(path):
+                with open(path, newline="") as f:
+                    done = {row["file"] for row in csv.DictReader(f)}
+            self.done[target] = done
+        return self.done[target]
+
+    def submit(self, target, path):
+        """
+        Queue a frame, returning at once; fits FrameRetriever's on_frame.
+        Returns:
+            concurrent.futures.Future: Gives the light curve row, or None.
+        """
+        return self.executor.submit(self.process, target, path)
+
+    def positions_for(self, target, stars, header):
+        """The pixel positions of the stars on a frame, or None if unknown."""
+        if "CTYPE1" in header:
+            with warnings.catch_warnings():
+                # the non-standard keywords of the subs are fixed up quietly
+                warnings.simplefilter("ignore", FITSFixedWarning)
+                wcs = WCS(header)
+            if wcs.has_celestial:
+                x, y = wcs.celestial.all_world2pix(stars.ra, stars.dec, 0)
+                return x, y
+        if target in self.positions:
+            return self.positions[target]
+        if np.isfinite(stars.x).all() and np.isfinite(stars.y).all():
+            return stars.x, stars.y
+        return None
+
+    def process(self, target, path):
+        """
+        Measure one frame and append its row to the light curve of the target.
+        Args:
+            target (str): The target name, as in the comparison file.
+            path (str): The FITS frame.
+        Returns:
+            dict: The light curve row, or None if the frame was skipped.
+        """
+        name = os.path.basename(path)
+        stars = self.stars.get(target)
+        if stars is None or name in self.processed(target):
+            self.skipped += 1
+            return None
+        start = time.perf_counter()
+        try:
+            with fits.open(path, memmap=True, do_not_scale_image_data=True) as hdul:
+                header = hdul[0].header
+                data = hdul[0].data
+                positions = self.positions_for(target, stars, header)
+                if data is None or positions is None:
+                    self.logger.warning(
+                        f"Unable to place the stars of {target} on {name}"
+                    )
+                    self.skipped += 1
+                    return None
+                photometry = measure(
+                    data,
+                    *positions,
+                    aperture=self.aperture,
+                    annulus=self.annulus,
+                    gain=float(header.get("EGAIN", GAIN)),
+                    scale=(header.get("BSCALE", 1.0), header.get("BZERO", 0.0)),
+                )
+            moment, exptime = frame_time(header, path)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Unable to measure {name} - {e}")
+            self.skipped += 1
+            return None
+        self.positions[target] = (photometry["x"], photometry["y"])
+        result = differential(stars, photometry, exptime, self.saturation)
+        row = {
+            "file": name,
+            "time": moment.isoformat(timespec="milliseconds"),
+            "jd": f"{julian_date(moment):.6f}",
+            "exptime": exptime,
+            "mag": f"{result['mag']:.4f}",
+            "err": f"{result['err']:.4f}",
+            "check_mag": f"{result['check_mag']:.4f}",
+            "check_err": f"{result['check_err']:.4f}",
+            "comps": result["comps"],
+            "flux": f"{photometry['flux'][0]:.1f}",
+            "peak": f"{photometry['peak'][0]:.0f}",
+            "flags": " ".join(result["flags"]),
+        }
+        self.append(target, row)
+        self.processed(target).add(name)
+        self.measured += 1
+        self.seconds += time.perf_counter() - start
+        return row
+
+    def append(self, target, row):
+        """Append a row to a light curve, writing the header to a new file."""
+        path = self.lightcurve_file(target)
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            new = not os.path.exists(path)
+            with open(path, "a", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=FIELDS)
+                if new:
+                    writer.writeheader()
+                writer.writerow(row)
+
+    def process_folder(self, target, folder):
+        """Measure the frames of a folder not yet in the light curve, in name order."""
+        frames = sorted(
+            path
+            for pattern in FRAME_PATTERNS
+            for path in glob.glob(os.path.join(folder, pattern))
+        )
+        rows = [self.process(target, path) for path in frames]
+        return [row for row in rows if row is not None]
+
+    def watch(self, root, interval=10.0, stop=None):
+        """
+        Measure the frames that appear in the <target>_sub folders under root
+        until stop is set, e.g. a share the unit writes to directly.
+        Args:
+            root (str): The folder holding the <target>_sub folders.
+            interval (float): Seconds between looks.
+            stop (threading.Event): Ends the watch, which runs forever if None.
+        """
+        stop = stop if stop is not None else threading.Event()
+        while True:
+            for target in self.stars:
+                folder = os.path.join(
+                    root, seestar_frames.FOLDER_FORMAT.format(target=target)
+                )
+                if os.path.isdir(folder):
+                    for row in self.process_folder(target, folder):
+                        self.logger.info(f"{target} {row['file']} {row['mag']}")
+            if stop.wait(interval):
+                return
+
+    def wait(self):
+        """Wait for the queued frames to be measured."""
+        self.executor.submit(lambda: None).result()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def summary(self):
+        per_frame = self.seconds / self.measured if self.measured else 0.0
+        return (
+            f"Measured {self.measured} frames, skipped {self.skipped}, "
+            f"{per_frame * 1000:.1f} ms per frame"
+        )
+
+
+def setup_argparse():
+    parser = argparse.ArgumentParser(description="Seestar Photometry")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    process = subparsers.add_parser(
+        "process", help="Measure the frames of one <target>_sub folder"
+    )
+    process.add_argument("folder", type=str, help="The <target>_sub folder")
+    process.add_argument("comparisons", type=str, help="The comparison star file")
+    process.add_argument(
+        "--target", type=str, help="The target name, from the folder name if not given"
+    )
+    watch = subparsers.add_parser(
+        "watch", help="Measure new frames under a folder as they appear"
+    )
+    watch.add_argument("root", type=str, help="The folder of the <target>_sub folders")
+    watch.add_argument("comparisons", type=str, help="The comparison star file")
+    watch.add_argument(
+        "--interval", type=float, default=10.0, help="Seconds between looks"
+    )
+    for command in (process, watch):
+        command.add_argument(
+            "--output-dir",
+            type=str,
+            default=LIGHTCURVE_DIR,
+            help="Where the light curves are written",
+        )
+        command.add_argument(
+            "--aperture", type=float, default=APERTURE, help="Aperture radius in pixels"
+        )
+    return parser
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    args = setup_argparse().parse_args()
+    pipeline = PhotometryPipeline(
+        read_comparisons(args.comparisons), args.output_dir, args.aperture
+    )
+    if args.command == "process":
+        target = args.target
+        if target is None:
+            suffix = seestar_frames.FOLDER_FORMAT.format(target="")
+            target = os.path.basename(os.path.normpath(args.folder))
+            target = target[: -len(suffix)] if target.endswith(suffix) else target
+        for row in pipeline.process_folder(target, args.folder):
+            print(f"{row['time']}  {row['mag']} +/- {row['err']}  {row['flags']}")
+    else:
+        try:
+            pipeline.watch(args.root, args.interval)
+        except KeyboardInterrupt:
+            pass
+    pipeline.close()
+    print(pipeline.summary())
@@ -0,0 +1,764 @@
+"""Scheduling engines that turn a night's visibility into an observing plan.
+
+A solver takes the VisibilityGrid of the night, the exposure (TotalExp) and
+pause of each target and optionally their priorities, and returns the plan
+as a list of (target index, start unix time) pairs. create_schedule writes
+the plan out as schedule.json items, whichever solver made it.
+
+    greedy  the original manifest walk: targets in file order, skipped when
+            low in the west, and the plan ends at the first target that
+            would overrun morning twilight.
+    slot    at each free moment, start the target that stays above the
+            minimum altitude for its whole exposure, preferring the fewest
+            visits, the highest priority, and then the target with the least
+            visibility left tonight. When nothing fits, wait for the next
+            grid time rather than giving up.
+    slew    as slot, but among the targets that fit take the one nearest the
+            last, unless one is about to set, then shorten the path further
+            with 2-opt wherever the reordered targets still fit. Each start
+            includes the predicted slew to the target.
+    cadence at each free moment, start the due target that is most overdue
+            for its revisit interval, weighted by priority, taken from a
+            heap of due times. Targets with no interval come once a night.
+
+Replanner runs a solver again during a session, from the current time and
+over only the targets still wanted, so the plan follows what really happened.
+"""
+
+import heapq
+
+import numpy as np
+
+import seestar_slew
+
+MIN_ALTITUDE = 30  # degrees
+NIGHTLY = 86400.0  # seconds, the cadence of a target wanted once a night
+LATE_FACTOR = 1.5  # a revisit later than this many cadences is late
+EARLY_FACTOR = 0.75  # a revisit may be taken early once this many cadences passed
+
+
+def greedy_plan(
+    grid,
+    exposures,
+    pauses,
+    priorities=None,
+    repeat=False,
+    min_alt=MIN_ALTITUDE,
+    start=None,
+    visits=None,
+    position=None,
+):
+    """
+    Walk the manifest in order, as create_schedule always has.
+    Args:
+        grid (VisibilityGrid): The visibility of the targets tonight.
+        exposures (array): The stacking time of each target in seconds.
+        pauses (array): The wait after each target in seconds.
+        priorities (array): Ignored, the manifest order is the priority.
+        repeat (bool): Cycle through the list until morning twilight.
+        min_alt (float): Targets below this in the west are skipped.
+        start (float): The unix time to plan from, the start of the grid if None.
+        visits (array): The observations of each target so far. The first
+            cycle takes the least observed targets first, so that a repeat
+            plan resumes where it left off.
+        position (tuple): Ignored, the manifest order does not depend on slews.
+    Returns:
+        list: The (target index, start unix time) of each observation.
+    """
+    if start is None:
+        start = grid.times[0]
+    end = grid.end_time
+    order = range(len(exposures))
+    if visits is not None:
+        order = np.argsort(visits, kind="stable")
+    plan = []
+    elapsed_time = 0
+    irepeat = True
+    while irepeat:
+        ixgt2 = 0
+        for i in order:
+            alt, az = grid.altaz(i, start + int(elapsed_time))
+            # skip targets that have set below min_alt in the west
+            if alt < min_alt and az > 180:
+                ixgt2 += 1
+                continue
+            # stop if the observation would take us past morning twilight
+            if start + int(elapsed_time) + int(exposures[i]) > end:
+                irepeat = False
+                break
+            plan.append((int(i), start + elapsed_time))
+            elapsed_time += exposures[i] + max(pauses[i], 0)
+        if not repeat or ixgt2 == len(exposures):
+            irepeat = False
+        order = range(len(exposures))
+    return plan
+
+
+def observable_cells(grid, min_alt=MIN_ALTITUDE):
+    """
+    The cumulative count of grid cells each target is above min_alt, so a
+    target is up for cells i..j when up[t, j + 1] - up[t, i] == j + 1 - i.
+    """
+    up = np.zeros((len(grid.alt), len(grid.times) + 1), dtype=np.int32)
+    np.cumsum(grid.alt >= min_alt, axis=1, out=up[:, 1:])
+    return up
+
+
+def slot_plan(
+    grid,
+    exposures,
+    pauses,
+    priorities=None,
+    repeat=False,
+    min_alt=MIN_ALTITUDE,
+    start=None,
+    visits=None,
+    position=None,
+):
+    """
+    Fill the night by starting the most urgent target that fits at each free moment.
+    Args:
+        grid (VisibilityGrid): The visibility of the targets tonight.
+        exposures (array): The stacking time of each target in seconds.
+        pauses (array): The wait after each target in seconds.
+        priorities (array): Higher values are observed first, all equal if None.
+        repeat (bool): Targets may be observed more than once.
+        min_alt (float): Targets must stay above this for the whole exposure.
+        start (float): The unix time to plan from, the start of the grid if None.
+        visits (array): The observations of each target so far.
+        position (tuple): Ignored, slews are not modelled.
+    Returns:
+        list: The (target index, start unix time) of each observation.
+    """
+    exposures = np.asarray(exposures, dtype=float)
+    pauses = np.maximum(np.asarray(pauses, dtype=float), 0)
+    count = len(exposures)
+    if priorities is None:
+        priorities = np.zeros(count)
+    priorities = np.asarray(priorities, dtype=float)
+    t0 = grid.times[0]
+    ncells = len(grid.times)
+    up = observable_cells(grid, min_alt)
+    rows = np.arange(count)
+    if visits is None:
+        visits = np.zeros(count, dtype=int)
+    visits = np.array(visits, dtype=int)
+    plan = []
+    t = t0 if start is None else max(float(start), t0)
+    while True:
+        first = int((t - t0) // grid.step)
+        if first >= ncells:
+            break
+        last = np.ceil((t + exposures - t0) / grid.step).astype(int)
+        fits = (last < ncells) & (t + exposures <= grid.end_time)
+        last = np.minimum(last, ncells - 1)
+        visible = (up[rows, last + 1] - up[:, first]) == (last + 1 - first)
+        candidates = np.flatnonzero(fits & visible & (repeat | (visits == 0)))
+        if len(candidates) == 0:
+            # nothing fits now, try again at the next grid time
+            t = t0 + (first + 1) * grid.step
+            continue
+        remaining = up[candidates, ncells] - up[candidates, first]
+        order = np.lexsort(
+            (
+                -exposures[candidates],
+                remaining,
+                -priorities[candidates],
+                visits[candidates],
+            )
+        )
+        target = candidates[order[0]]
+        plan.append((int(target), float(t)))
+        visits[target] += 1
+        t += exposures[target] + pauses[target]
+    return plan
+
+
+def slew_plan(
+    grid,
+    exposures,
+    pauses,
+    priorities=None,
+    repeat=False,
+    min_alt=MIN_ALTITUDE,
+    start=None,
+    visits=None,
+    position=None,
+    model=None,
+):
+    """
+    Fill the night going to the nearest target that fits at each free moment,
+    then shorten the path with 2-opt.
+    Args:
+        grid (VisibilityGrid): The visibility of the targets tonight.
+        exposures (array): The stacking time of each target in seconds.
+        pauses (array): The wait after each target in seconds.
+        priorities (array): Higher values are observed first, all equal if None.
+        repeat (bool): Targets may be observed more than once.
+        min_alt (float): Targets must stay above this for the whole exposure.
+        start (float): The unix time to plan from, the start of the grid if None.
+        visits (array): The observations of each target so far.
+        position (tuple): The (ra, dec) in degrees the telescope points at,
+            unknown if None so that the first slew is not counted.
+        model (seestar_slew.SlewModel): The slew times, the default model if None.
+    Returns:
+        list: The (target index, start unix time) of each observation, each
+            starting with the slew to the target.
+    """
+    model = seestar_slew.SlewModel() if model is None else model
+    exposures = np.asarray(exposures, dtype=float)
+    pauses = np.maximum(np.asarray(pauses, dtype=float), 0)
+    count = len(exposures)
+    if priorities is None:
+        priorities = np.zeros(count)
+    priorities = np.asarray(priorities, dtype=float)
+    if visits is None:
+        visits = np.zeros(count, dtype=int)
+    visits = np.array(visits, dtype=int)
+    t0 = grid.times[0]
+    up = observable_cells(grid, min_alt)
+    if position is None:
+        slews = np.zeros(count)
+    else:
+        slews = model(seestar_slew.separation(*position, grid.ra, grid.dec))
+    plan = []
+    breaks = []
+    t = t0 if start is None else max(float(start), t0)
+    while t < grid.end_time:
+        begin = t + slews
+        candidates = np.flatnonzero(
+            fits_at(up, grid, begin, exposures) & (repeat | (visits == 0))
+        )
+        if len(candidates) == 0:
+            # nothing fits now, try again at the next grid time
+            t = t0 + (int((t - t0) // grid.step) + 1) * grid.step
+            if plan and (not breaks or breaks[-1] != len(plan)):
+                breaks.append(len(plan))
+            continue
+        # the cells left tonight once the exposure is over
+        first = np.ceil((begin[candidates] + exposures[candidates] - t0) / grid.step)
+        remaining = up[candidates, -1] - up[candidates, first.astype(int)]
+        # a target that could not wait for one more observation goes first
+        setting = remaining * grid.step < exposures[candidates] + pauses[candidates]
+        order = np.lexsort(
+            (
+                slews[candidates],
+                ~setting,
+                -priorities[candidates],
+                visits[candidates],
+            )
+        )
+        target = candidates[order[0]]
+        plan.append((int(target), float(t)))
+        visits[target] += 1
+        t = begin[target] + exposures[target] + pauses[target]
+        slews = model(
+            seestar_slew.separation(
+                grid.ra[target], grid.dec[target], grid.ra, grid.dec
+            )
+        )
+    return shorten_slews(plan, breaks, grid, up, exposures, pauses, position, model)
+
+
+def fits_at(up, grid, begin, exposures):
+    """
+    Whether observations stay above the minimum altitude for their whole
+    exposure and finish within the night.
+    Args:
+        up (numpy.ndarray): The observable_cells row of each observation's target.
+        grid (VisibilityGrid): The visibility of the targets tonight.
+        begin (array): The unix time each exposure would begin.
+        exposures (array): The stacking time of each observation in seconds.
+    """
+    ncells = len(grid.times)
+    first = ((begin - grid.times[0]) // grid.step).astype(int)
+    last = np.ceil((begin + exposures - grid.times[0]) / grid.step).astype(int)
+    inside = (first >= 0) & (last < ncells) & (begin + exposures <= grid.end_time)
+    first = np.clip(first, 0, ncells - 1)
+    last = np.clip(last, 0, ncells - 1)
+    rows = np.arange(len(up))
+    visible = (up[rows, last + 1] - up[rows, first]) == (last + 1 - first)
+    return inside & visible
+
+
+def run_times(order, start, into, angles, targets, exposures, pauses, model):
+    """
+    The start and exposure begin times of a run of back to back observations.
+    Args:
+        order (array): The observations of the run, as indices into targets.
+        start (float): The unix time the run starts.
+        into (array): The angle from the observation before the run to each
+            observation, None if the position before the run is unknown.
+        angles (numpy.ndarray): The angle between every pair of observations.
+        targets (array): The target of each observation.
+        exposures (array): The stacking time of each target in seconds.
+        pauses (array): The wait after each target in seconds.
+        model (seestar_slew.SlewModel): The slew times.
+    Returns:
+        tuple: Arrays of the start and exposure begin unix times.
+    """
+    first = model(into[order[0]]) if into is not None else 0.0
+    slews = np.concatenate([[first], model(angles[order[:-1], order[1:]])])
+    durations = slews + exposures[targets[order]] + pauses[targets[order]]
+    starts = start + np.concatenate([[0.0], np.cumsum(durations[:-1])])
+    return starts, starts + slews
+
+
+def shorten_slews(
+    plan, breaks, grid, up, exposures, pauses, position, model, max_passes=20
+):
+    """
+    Reverse stretches of a plan that slew less the other way round, as long
+    as every reordered observation still fits where it lands. The plan is
+    improved one run of back to back observations at a time, so the waits
+    between runs stay where they are.
+    Args:
+        plan (list): The (target index, start unix time) of each observation.
+        breaks (list): The observations the plan waited before, each starting a run.
+    """
+    if len(plan) < 3:
+        return plan
+    targets = np.array([target for target, _ in plan], dtype=int)
+    starts = np.array([start for _, start in plan], dtype=float)
+    # the observations are the nodes, so repeat visits are separate nodes
+    angles = seestar_slew.separation_matrix(grid.ra[targets], grid.dec[targets])
+    angles = angles.astype(float)
+    np.fill_diagonal(angles, 0)
+    before = None
+    if position is not None:
+        before = seestar_slew.separation(*position, grid.ra[targets], grid.dec[targets])
+    runs = np.split(np.arange(len(plan)), breaks)
+    for number, run in enumerate(runs):
+        if len(run) < 3:
+            continue
+        # the slew into the next run is from the last observation of this
+        # one, so that observation stays last unless this run is the last
+        is_last = number == len(runs) - 1
+        into = angles[run[0] - 1] if run[0] > 0 else before
+        order = run.copy()
+        for _ in range(max_passes):
+            improved = False
+            for i in range(len(order) - 1):
+                # reverse order[i..j], replacing the edges (a, b) and (c, d)
+                # with (a, c) and (b, d), where a may be before the run and d
+                # past its end
+                b = order[i]
+                c = order[i + 1 :]
+                d = order[i + 2 :]
+                old = np.append(angles[c[:-1], d], 0)
+                new = np.append(angles[b, d], 0)
+                a = angles[order[i - 1]] if i > 0 else into
+                if a is not None:
+                    old = old + a[b]
+                    new = new + a[c]
+                gains = old - new
+                if not is_last:
+                    gains[len(order) - 2 - i :] = -np.inf
+                for j in np.argsort(-gains):
+                    if gains[j] <= 1e-6:
+                        break
+                    trial = order.copy()
+                    trial[i : i + j + 2] = trial[i : i + j + 2][::-1]
+                    _, begin = run_times(
+                        trial,
+                        starts[run[0]],
+                        into,
+                        angles,
+                        targets,
+                        exposures,
+                        pauses,
+                        model,
+                    )
+                    if fits_at(
+                        up[targets[trial]], grid, begin, exposures[targets[trial]]
+                    ).all():
+                        order = trial
+                        improved = True
+                        break
+            if not improved:
+                break
+        new_starts, _ = run_times(
+            order, starts[run[0]], into, angles, targets, exposures, pauses, model
+        )
+        for node, k, start in zip(run, order, new_starts):
+            plan[node] = (int(targets[k]), float(start))
+    return plan
+
+
+def cadence_seconds(minutes):
+    """
+    The revisit interval of each target in seconds from a manifest Cadence
+    column in minutes, once a night where it is blank or not positive.
+    """
+    text = np.char.strip(np.asarray(minutes, dtype=str))
+    minutes = np.where(text == "", "nan", text).astype(float)
+    return np.where(np.isfinite(minutes) & (minutes > 0), minutes * 60, NIGHTLY)
+
+
+class CadenceDispatcher:
+    """
+    Pick the next target by how overdue it is against its revisit interval.
+
+    Each target waits in a heap keyed by when it is next due, its last visit
+    plus its cadence, so the targets due now are popped in due order without
+    looking at the others. Of the due targets that stay up for their whole
+    exposure, the most overdue for its cadence, weighted by its priority, is
+    observed. When nothing due is up, the visible target due soonest tonight
+    is taken early, but only once early_factor of its cadence has passed
+    since its last visit. Otherwise the telescope waits for the next target
+    to fall due rather than revisiting one back to back.
+
+    Usage:
+        dispatcher = CadenceDispatcher(grid, exposures, cadences)
+        target, start = dispatcher.next(time.time())
+        ...observe the target, or wait until start if target is None...
+        dispatcher.completed(target, start)
+    """
+
+    def __init__(
+        self,
+        grid,
+        exposures,
+        cadences=None,
+        priorities=None,
+        min_alt=MIN_ALTITUDE,
+        max_attempts=2,
+        start=None,
+        early_factor=EARLY_FACTOR,
+    ):
+        """
+        Args:
+            grid (VisibilityGrid): The visibility of the targets tonight.
+            exposures (array): The stacking time of each target in seconds.
+            cadences (array): The wanted seconds between visits of each
+                target, once a night for any that is NaN or if None.
+            priorities (array): Higher values are observed first, all equal if None.
+            min_alt (float): Targets must stay above this for the whole exposure.
+            max_attempts (int): Failures in a row before a target is dropped.
+            start (float): The unix time the first visits are due, the start of
+                the grid if None.
+            early_factor (float): The share of its cadence that must have
+                passed since a target's last visit before it is taken early.
+        """
+        self.grid = grid
+        self.exposures = np.asarray(exposures, dtype=float)
+        count = len(self.exposures)
+        if cadences is None:
+            cadences = np.full(count, NIGHTLY)
+        cadences = np.asarray(cadences, dtype=float)
+        self.cadences = np.where(np.isfinite(cadences), cadences, NIGHTLY)
+        if priorities is None:
+            priorities = np.zeros(count)
+        self.weights = 1 + np.maximum(np.asarray(priorities, dtype=float), 0)
+        self.max_attempts = max_attempts
+        self.early_factor = early_factor
+        self.up = observable_cells(grid, min_alt)
+        self.start = grid.times[0] if start is None else float(start)
+        self.due = np.full(count, self.start)
+        self.failures = np.zeros(count, dtype=int)
+        self.times = [[] for _ in range(count)]
+        self.heap = [(self.start, i) for i in range(count)]
+        heapq.heapify(self.heap)
+
+    def fits(self, targets, when):
+        """Whether each target stays up from when for its whole exposure."""
+        targets = np.asarray(targets, dtype=int)
+        begin = np.full(len(targets), float(when))
+        return fits_at(self.up[targets], self.grid, begin, self.exposures[targets])
+
+    def next(self, now):
+        """
+        The target to observe next. It is taken out of the heap until
+        completed or failed is called for it.
+        Args:
+            now (float): The current unix time.
+        Returns:
+            tuple: The target and now, or None and the time to ask again when
+                no target is up, or None when nothing more is due tonight.
+        """
+        end = self.grid.end_time
+        if now >= end:
+            return None
+        popped = []
+        while self.heap and self.heap[0][0] <= now:
+            popped.append(heapq.heappop(self.heap))
+        chosen = None
+        if popped:
+            targets = np.array([target for _, target in popped])
+            lateness = 1 + (now - self.due[targets]) / self.cadences[targets]
+            score = np.where(
+                self.fits(targets, now), lateness * self.weights[targets], -np.inf
+            )
+            if np.isfinite(score).any():
+                chosen = int(targets[np.argmax(score)])
+        while chosen is None and self.heap and self.heap[0][0] < end:
+            # nothing due is up, try the others in the order they fall due,
+            # each once enough of its cadence has passed since its last visit
+            entry = heapq.heappop(self.heap)
+            popped.append(entry)
+            due, target = entry
+            early = due - (1 - self.early_factor) * self.cadences[target]
+            if now >= early and self.fits([target], now)[0]:
+                chosen = target
+        for entry in popped:
+            if entry[1] != chosen:
+                heapq.heappush(self.heap, entry)
+        if chosen is not None:
+            return chosen, now
+        if not self.heap or self.heap[0][0] >= end:
+            return None
+        t0 = self.grid.times[0]
+        return None, t0 + (int((now - t0) // self.grid.step) + 1) * self.grid.step
+
+    def completed(self, target, when):
+        """A target was observed from when, its next visit is due a cadence later."""
+        self.times[target].append(float(when))
+        self.failures[target] = 0
+        self.due[target] = when + self.cadences[target]
+        heapq.heappush(self.heap, (self.due[target], target))
+
+    def failed(self, target):
+        """A target could not be observed, it stays due until it fails too often."""
+        self.failures[target] += 1
+        if self.failures[target] < self.max_attempts:
+            heapq.heappush(self.heap, (self.due[target], target))
+
+    def report(self, names):
+        """The achieved cadence of each target, see cadence_report."""
+        return cadence_report(names, self.times, self.cadences)
+
+
+def cadence_plan(
+    grid,
+    exposures,
+    pauses,
+    priorities=None,
+    repeat=False,
+    min_alt=MIN_ALTITUDE,
+    start=None,
+    visits=None,
+    position=None,
+    cadences=None,
+):
+    """
+    Fill the night with CadenceDispatcher, each target coming back once its
+    cadence has passed.
+    Args:
+        grid (VisibilityGrid): The visibility of the targets tonight.
+        exposures (array): The stacking time of each target in seconds.
+        pauses (array): The wait after each target in seconds.
+        priorities (array): Higher values are observed first, all equal if None.
+        repeat (bool): Targets come back after their cadence, else once only.
+        min_alt (float): Targets must stay above this for the whole exposure.
+        start (float): The unix time to plan from, the start of the grid if None.
+        visits (array): Ignored, the dispatcher keeps the times of the visits.
+        position (tuple): Ignored, slews are not modelled.
+        cadences (array): The wanted seconds between visits, once a night if None.
+    Returns:
+        list: The (target index, start unix time) of each observation.
+    """
+    pauses = np.maximum(np.asarray(pauses, dtype=float), 0)
+    dispatcher = CadenceDispatcher(
+        grid,
+        exposures,
+        cadences if repeat else None,
+        priorities,
+        min_alt,
+        start=start,
+    )
+    plan = []
+    t = dispatcher.start
+    while True:
+        step = dispatcher.next(t)
+        if step is None:
+            break
+        target, when = step
+        if target is None:
+            t = when
+            continue
+        plan.append((target, float(t)))
+        dispatcher.completed(target, t)
+        t += dispatcher.exposures[target] + pauses[target]
+    return plan
+
+
+def cadence_report(names, times, cadences):
+    """
+    Compare the achieved intervals between visits with the wanted ones.
+    Args:
+        names (array): The target names.
+        times (list): The unix start times of the visits of each target.
+        cadences (array): The wanted seconds between visits.
+    Returns:
+        list: Per target, its visits, the wanted and median achieved minutes
+            between them, the longest gap, and the fraction of gaps no longer
+            than LATE_FACTOR times the cadence, NaN for fewer than two visits.
+    """
+    rows = []
+    for name, visits, cadence in zip(names, times, cadences):
+        gaps = np.diff(np.sort(visits))
+        rows.append(
+            {
+                "name": str(name),
+                "visits": len(visits),
+                "requested_min": float(cadence) / 60,
+                "median_min": float(np.median(gaps)) / 60 if len(gaps) else np.nan,
+                "max_gap_min": float(gaps.max()) / 60 if len(gaps) else np.nan,
+                "on_time": (
+                    float(np.mean(gaps <= LATE_FACTOR * cadence))
+                    if len(gaps)
+                    else np.nan
+                ),
+            }
+        )
+    return rows
+
+
+def format_cadence_report(rows):
+    """The lines of a cadence report, one per target."""
+    lines = [
+        f"{'target':24s} {'visits':>6s} {'wanted':>8s} {'median':>8s} "
+        f"{'max gap':>8s} {'on time':>8s}"
+    ]
+    for row in rows:
+        wanted = (
+            "nightly"
+            if row["requested_min"] * 60 >= NIGHTLY
+            else f"{row['requested_min']:.0f}"
+        )
+        # the intervals are blank for targets seen fewer than twice
+        gaps = [
+            f"{row[key]:{spec}}" if np.isfinite(row[key]) else "-"
+            for key, spec in (
+                ("median_min", ".1f"),
+                ("max_gap_min", ".1f"),
+                ("on_time", ".0%"),
+            )
+        ]
+        lines.append(
+            f"{row['name']:24s} {row['visits']:6d} {wanted:>8s} "
+            + " ".join(f"{gap:>8s}" for gap in gaps)
+        )
+    return lines
+
+
+SOLVERS = {
+    "greedy": greedy_plan,
+    "slot": slot_plan,
+    "slew": slew_plan,
+    "cadence": cadence_plan,
+}
+DEFAULT_SOLVER = "slot"
+
+
+def science_time(plan, exposures, grid=None, min_alt=MIN_ALTITUDE):
+    """
+    The total open-shutter seconds of a plan.
+    Args:
+        plan (list): The (target index, start unix time) of each observation.
+        exposures (array): The stacking time of each target in seconds.
+        grid (VisibilityGrid): If given, only count time with the target above min_alt.
+        min_alt (float): The lowest useful altitude in degrees.
+    """
+    total = 0.0
+    for target, start in plan:
+        if grid is None:
+            total += exposures[target]
+            continue
+        first = grid.index(start)
+        last = grid.index(start + exposures[target])
+        useful = grid.alt[target, first : last + 1] >= min_alt
+        total += exposures[target] * useful.mean()
+    return float(total)
+
+
+class Replanner:
+    """
+    Recompute the rest of a night's plan as a session goes along.
+
+    The visibility grid of the whole night is computed once. Each replan()
+    plans only the targets that are still wanted, from the current time, so
+    a failed goto, an overrun or a cloudy spell is absorbed by the next call.
+
+    Usage:
+        replanner = Replanner(grid, exposures, pauses, repeat=True)
+        target, start = replanner.replan(time.time())[0]
+        ...observe the target...
+        replanner.completed(target)
+    """
+
+    def __init__(
+        self,
+        grid,
+        exposures,
+        pauses,
+        priorities=None,
+        repeat=False,
+        solver=DEFAULT_SOLVER,
+        max_attempts=2,
+        min_alt=MIN_ALTITUDE,
+    ):
+        """
+        Args:
+            grid (VisibilityGrid): The visibility of the targets tonight.
+            exposures (array): The stacking time of each target in seconds.
+            pauses (array): The wait after each target in seconds.
+            priorities (array): Higher values are observed first, all equal if None.
+            repeat (bool): Targets may be observed more than once.
+            solver (str or callable): The name of the scheduling engine in
+                SOLVERS, or a solver, e.g. slew_plan with its model bound.
+            max_attempts (int): Failures in a row before a target is dropped.
+            min_alt (float): The lowest useful altitude in degrees.
+        """
+        self.grid = grid
+        self.exposures = np.asarray(exposures, dtype=float)
+        self.pauses = np.asarray(pauses, dtype=float)
+        self.priorities = None if priorities is None else np.asarray(priorities)
+        self.repeat = repeat
+        self.solver = SOLVERS[solver] if isinstance(solver, str) else solver
+        self.max_attempts = max_attempts
+        self.min_alt = min_alt
+        self.visits = np.zeros(len(self.exposures), dtype=int)
+        self.failures = np.zeros(len(self.exposures), dtype=int)
+        # where the telescope points, unknown until a target is observed
+        self.position = None
+
+    def completed(self, target):
+        self.visits[target] += 1
+        self.failures[target] = 0
+        self.position = (self.grid.ra[target], self.grid.dec[target])
+
+    def failed(self, target):
+        self.failures[target] += 1
+
+    def remaining(self):
+        """The indices of the targets that may still be planned."""
+        wanted = self.failures < self.max_attempts
+        if not self.repeat:
+            wanted &= self.visits == 0
+        return np.flatnonzero(wanted)
+
+    def replan(self, now):
+        """
+        Plan the rest of the night.
+        Args:
+            now (float): The current unix time.
+        Returns:
+            list: The (target index, start unix time) of each observation
+                left, empty when nothing more can be observed tonight.
+        """
+        targets = self.remaining()
+        if len(targets) == 0 or now >= self.grid.end_time:
+            return []
+        plan = self.solver(
+            self.grid.subset(targets),
+            self.exposures[targets],
+            self.pauses[targets],
+            None if self.priorities is None else self.priorities[targets],
+            self.repeat,
+            self.min_alt,
+            start=now,
+            visits=self.visits[targets],
+            position=self.position,
+        )
+        return [(int(targets[i]), start) for i, start in plan]
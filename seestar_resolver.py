@@ -0,0 +1,166 @@
+"""A persistent local cache of SIMBAD name resolutions.
+
+Resolved coordinates are kept in a small SQLite file keyed by the normalised
+object name, so a planning run or session start only asks SIMBAD for the
+names it has not seen (in one batched query) and a warm run, or a night at a
+dark site without a network, does not need SIMBAD at all.
+
+Usage:
+    resolver = SimbadResolver()
+    ras, decs = resolver.resolve(["M42", "eta Car"])  # degrees, NaN if unknown
+"""
+
+import logging
+import sqlite3
+import time
+
+import numpy as np
+
+DEFAULT_CACHE_FILE = "simbad_cache.db"
+DEFAULT_TTL_DAYS = 90
+# keep well under the SQLite limit on query parameters
+LOOKUP_CHUNK = 500
+
+
+def normalize_name(name):
+    """The cache key of an object name: case and spacing do not matter to SIMBAD."""
+    return " ".join(str(name).split()).casefold()
+
+
+class SimbadResolver:
+    """Resolve object names to J2000 coordinates through an on-disk cache."""
+
+    def __init__(
+        self,
+        cache_file=DEFAULT_CACHE_FILE,
+        ttl_days=DEFAULT_TTL_DAYS,
+        offline=False,
+        logger=None,
+    ):
+        """
+        Args:
+            cache_file (str): The SQLite file holding the cache.
+            ttl_days (float): Entries older than this are looked up again.
+            offline (bool): Never query SIMBAD, use cached entries of any age.
+            logger (logging.Logger): The logger to write to.
+        """
+        self.cache_file = cache_file
+        self.ttl = ttl_days * 86400
+        self.offline = offline
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.db = sqlite3.connect(cache_file)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            "name TEXT PRIMARY KEY, ra REAL, dec REAL, fetched REAL)"
+        )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def lookup(self, names):
+        """
+        Get the cached coordinates of the names that are in the cache and fresh.
+        Args:
+            names (list): The object names.
+        Returns:
+            dict: The (ra, dec) in degrees of each cached normalised name.
+        """
+        keys = list({normalize_name(name) for name in names})
+        oldest = 0 if self.offline else time.time() - self.ttl
+        found = {}
+        for i in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[i : i + LOOKUP_CHUNK]
+            rows = self.db.execute(
+                "SELECT name, ra, dec FROM objects WHERE fetched >= ? AND name IN (%s)"
+                % ",".join("?" * len(chunk)),
+                [oldest] + chunk,
+            )
+            for key, ra, dec in rows:
+                found[key] = (ra, dec)
+        return found
+
+    def store(self, coords):
+        """Add the (ra, dec) in degrees of each name to the cache."""
+        now = time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO objects (name, ra, dec, fetched) VALUES (?, ?, ?, ?)",
+            [
+                (normalize_name(name), float(ra), float(dec), now)
+                for name, (ra, dec) in coords.items()
+            ],
+        )
+        self.db.commit()
+
+    def resolve(self, names):
+        """
+        Get the coordinates of the names, asking SIMBAD once for all cache misses.
+        Args:
+            names (list): The object names.
+        Returns:
+            tuple: Numpy arrays of the right ascension and declination in degrees,
+                NaN for the names that could not be resolved.
+        """
+        found = self.lookup(names)
+        missing = []
+        seen = set(found)
+        for name in names:
+            key = normalize_name(name)
+            if key not in seen:
+                seen.add(key)
+                missing.append(name)
+        if missing:
+            if self.offline:
+                self.logger.warning(f"Offline, not resolving {missing}")
+            else:
+                self.logger.debug(f"Resolving {len(missing)} names with SIMBAD")
+                resolved = query_simbad(missing)
+                self.store(resolved)
+                found.update(
+                    (normalize_name(name), coord) for name, coord in resolved.items()
+                )
+        ra = np.full(len(names), np.nan)
+        dec = np.full(len(names), np.nan)
+        for i, name in enumerate(names):
+            coord = found.get(normalize_name(name))
+            if coord is not None:
+                ra[i], dec[i] = coord
+        return ra, dec
+
+
+def query_simbad(names):
+    """
+    Resolve names with one SIMBAD query.
+    Args:
+        names (list): The object names.
+    Returns:
+        dict: The (ra, dec) in degrees of each name SIMBAD knows.
+    """
+    from astroquery.simbad import Simbad
+    from astropy.coordinates import SkyCoord
+    from astropy import units as u
+
+    table = Simbad.query_objects(list(names))
+    if table is None or len(table) == 0:
+        return {}
+    columns = {name.lower(): name for name in table.colnames}
+    ra = table[columns["ra"]]
+    dec = table[columns["dec"]]
+    mask = np.ma.getmaskarray(ra) | np.ma.getmaskarray(dec)
+    if ra.dtype.kind in "SU":
+        # older astroquery returns sexagesimal strings with RA in hours
+        ra = np.where(mask, "0 0 0", np.asarray(ra, dtype=str))
+        dec = np.where(mask, "0 0 0", np.asarray(dec, dtype=str))
+        coord = SkyCoord(ra, dec, unit=(u.hourangle, u.deg))
+    else:
+        coord = SkyCoord(np.ma.filled(ra, 0), np.ma.filled(dec, 0), unit=u.deg)
+    if "user_specified_id" in columns:
+        ids = [str(i) for i in table[columns["user_specified_id"]]]
+    else:
+        # one row per name, in order
+        ids = list(names)
+    return {
+        name: (coord.ra.deg[i], coord.dec.deg[i])
+        for i, name in enumerate(ids)
+        if not mask[i]
+    }
@@ -1,21 +1,56 @@
 import socket
 import json
+import random
 import time
 from datetime import datetime
 import threading
+import queue
 import sys
 import argparse
 import seestar_varstar_params as sp
 import logging
+import seestar_health
+import seestar_timing
 
 # declare the logger globally
 logger = None
 
+# seconds of quiet on the link before a test_connection keepalive is sent
+HEARTBEAT_INTERVAL = seestar_health.IDLE_INTERVAL
+# seconds a request may go unanswered, with nothing received, before the
+# link is taken to have stalled
+STALL_TIMEOUT = seestar_health.STALL_TIMEOUT
+# reconnect after a drop with exponential backoff: the n-th try waits a random
+# time between half and all of min(RECONNECT_BASE * 2**n, RECONNECT_MAX)
+RECONNECT_BASE = 0.5
+RECONNECT_MAX = 30
+RECONNECT_ATTEMPTS = 12
+# the commands that are sent again when the link drops before their reply,
+# because doing them twice leaves the SeeStar in the same state
+IDEMPOTENT_METHODS = (
+    "test_connection",
+    "scope_get_equ_coord",
+    "set_setting",
+    "set_stack_setting",
+    "iscope_stop_view",
+)
+# the settings re-applied on every new connection, before anything is replayed
+SETTINGS_METHODS = ("set_stack_setting", "set_setting")
+# seconds to let the mount settle after a goto before stacking
+SETTLE_TIME = 3
+# seconds a goto, with its plate solves, may take before it counts as failed
+GOTO_TIMEOUT = 300
+# seconds to wait for the reply to a command before counting it as lost
+REPLY_TIMEOUT = 10
+
 
 def CreateLogger():
     # Create a custom logger
     logger = logging.getLogger("seestar_run")
     logger.setLevel(logging.DEBUG)
+    # a long-lived session may ask for the logger more than once
+    if logger.handlers:
+        return logger
 
     # Create handlers
     # console_handler = logging.StreamHandler(sys.stdout)
@@ -40,209 +75,836 @@ def CreateLogger():
     return logger
 
 
-def heartbeat():  # I noticed a lot of pairs of test_connection followed by a get if nothing was going on
-    #    json_message("test_connection")
-    json_message("scope_get_equ_coord", 413)
+class FrameBuffer:
+    """
+    Splits the SeeStar byte stream into its CRLF terminated messages.
 
+    Bytes are received straight into one reusable bytearray and only complete
+    frames are decoded, so a multi-byte character split across two reads is
+    decoded correctly and large messages are not copied on every read. A frame
+    longer than max_frame bytes is dropped rather than buffered without bound.
+    """
 
-def json_message2(data, logger):
-    if data:
-        json_data = json.dumps(data)
-        logger.debug("Sending2 %s" % json_data)
-        resp = send_message(json_data + "\r\n")
-        logger.debug("Response2: %s" % resp)
-        return resp
-    else:
-        return None
+    def __init__(self, size=1024 * 64, max_frame=1024 * 1024, min_read=1024 * 4):
+        """
+        Args:
+            size (int): The starting size of the buffer in bytes.
+            max_frame (int): The longest frame kept, longer frames are dropped.
+            min_read (int): The least free space offered to a single read.
+        """
+        self.max_frame = max_frame
+        self.min_read = min_read
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # the first byte not yet returned in a frame
+        self.end = 0  # the end of the received bytes
+        self.scan = 0  # where the search for the next CRLF resumes
+        self.discarding = False
+        self.dropped = 0
+
+    def reset(self):
+        """Forget any partial frame, e.g. after a reconnect."""
+        self.start = self.end = self.scan = 0
+        self.discarding = False
+
+    def make_room(self, nbytes):
+        """Make sure at least nbytes are free at the end of the buffer."""
+        if len(self.buffer) - self.end >= nbytes:
+            return
+        pending = self.end - self.start
+        if pending > self.max_frame:
+            # the partial frame is already too long, drop it along with the
+            # rest of it up to the next CRLF
+            self.dropped += 1
+            self.start = self.end = self.scan = 0
+            self.discarding = True
+            pending = 0
+        if len(self.buffer) - pending >= nbytes:
+            # move the partial frame to the front of the buffer
+            self.view[:pending] = self.view[self.start : self.end]
+        else:
+            buffer = bytearray(max(2 * len(self.buffer), pending + nbytes))
+            buffer[:pending] = self.view[self.start : self.end]
+            self.view.release()
+            self.buffer = buffer
+            self.view = memoryview(self.buffer)
+        self.scan = max(self.scan - self.start, 0)
+        self.start = 0
+        self.end = pending
+
+    def recv_into(self, sock):
+        """
+        Read from the socket into the buffer.
+        Returns:
+            int: The number of bytes read, 0 when the peer closed the connection.
+        """
+        self.make_room(self.min_read)
+        nbytes = sock.recv_into(self.view[self.end :])
+        self.end += nbytes
+        return nbytes
+
+    def feed(self, data):
+        """Add bytes that were read elsewhere, e.g. a captured stream."""
+        self.make_room(len(data))
+        self.view[self.end : self.end + len(data)] = data
+        self.end += len(data)
+
+    def frames(self):
+        """
+        Yield the complete frames received so far.
+        Returns:
+            str: Each decoded frame, without the CRLF.
+        """
+        while True:
+            index = self.buffer.find(b"\r\n", self.scan, self.end)
+            if index < 0:
+                # a CR at the very end may be the first half of a CRLF
+                self.scan = max(self.start, self.end - 1)
+                break
+            if self.discarding:
+                self.discarding = False
+            elif index - self.start > self.max_frame:
+                self.dropped += 1
+            else:
+                yield str(self.view[self.start : index], "utf-8", "replace")
+            self.start = self.scan = index + 2
+        if self.start == self.end:
+            self.start = self.end = self.scan = 0
+
+
+class EventWaitCancelled(Exception):
+    """The wait for a SeeStar event was cancelled."""
+
+
+class EventSubscription:
+    """
+    The SeeStar events of one name, queued as the receive thread sees them.
 
+    Made with SeestarSession.subscribe(). Subscribe before sending the command
+    that triggers the event so an early event is not missed.
+    """
 
-def shutdown_seestar(logger, cmdid):
+    def __init__(self, session, event_name, predicate=None):
+        """
+        Args:
+            session (SeestarSession): The session delivering the events.
+            event_name (str): The "Event" field to listen for, e.g. "AutoGoto".
+            predicate (callable): Only queue the events for which this returns True.
+        """
+        self.session = session
+        self.event_name = event_name
+        self.predicate = predicate
+        self.events = queue.Queue()
+        self.cancelled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cancel()
+
+    def put(self, event):
+        if self.predicate is None or self.predicate(event):
+            self.events.put(event)
+
+    def wait(self, timeout=None):
+        """
+        Wait for the next event.
+        Args:
+            timeout (float): Seconds to wait, or None to wait until an event arrives.
+        Returns:
+            dict: The event, or None if the timeout passed first.
+        Raises:
+            EventWaitCancelled: The subscription was cancelled.
+        """
+        if self.cancelled:
+            raise EventWaitCancelled(f"Wait for {self.event_name} cancelled")
+        try:
+            event = self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if event is None:
+            raise EventWaitCancelled(f"Wait for {self.event_name} cancelled")
+        return event
+
+    def cancel(self):
+        """Stop listening and wake any thread waiting on this subscription."""
+        if not self.cancelled:
+            self.cancelled = True
+            self.session.unsubscribe(self)
+            self.events.put(None)
+
+
+class PendingReply:
+    """The reply to one request, filled in by the receive thread when it arrives."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.reply = None
+
+    def resolve(self, reply):
+        self.reply = reply
+        self.event.set()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the reply.
+        Args:
+            timeout (float): Seconds to wait, or None to wait until it arrives.
+        Returns:
+            dict: The reply, or None if there was none in time.
+        """
+        self.event.wait(timeout)
+        return self.reply
+
+
+class SeestarSession:
     """
-    Shutdown the seestar device
+    A long-lived connection to a SeeStar unit.
+
+    The socket, the stack settings and the receive thread are set up once in
+    connect(), after which observe() can be called for any number of targets
+    without paying the connection cost again.
     """
-    data = {}
-    data["id"] = cmdid
-    cmdid += 1
-    data["method"] = "pi_shutdown"
-    json_message2(data, logger)
-
-
-def set_stack_settings(logger, cmdid):
-    logger.debug("set stack setting to record individual frames")
-    data = {}
-    data["id"] = cmdid
-    cmdid += 1
-    data["method"] = "set_stack_setting"
-    params = {}
-    params["save_discrete_frame"] = True
-    data["params"] = params
-    return json_message2(data, logger)
-
-
-def send_message(data):
-    global s
-    try:
-        if s is None:
-            logger.error("Socket is not connected")
-            time.sleep(3)
+
+    def __init__(
+        self,
+        host=None,
+        port=None,
+        logger=None,
+        is_debug=False,
+        idle_interval=HEARTBEAT_INTERVAL,
+        stall_timeout=STALL_TIMEOUT,
+        timing=None,
+    ):
+        """
+        Args:
+            host (str): The SeeStar IP address, defaults to seestar_varstar_params.ip.
+            port (int): The SeeStar port, defaults to seestar_varstar_params.port.
+            logger (logging.Logger): The logger to write to.
+            is_debug (bool): Log every message sent and received.
+            idle_interval (float): Seconds of quiet before a keepalive is sent.
+            stall_timeout (float): Seconds without any reply before the link
+                counts as stalled.
+            timing (seestar_timing.TimingRecorder): Where the goto, settle and
+                stack spans of each target go, defaults to seestar_timing.jsonl.
+        """
+        self.host = sp.ip if host is None else host
+        self.port = sp.port if port is None else port
+        self.logger = logger if logger is not None else CreateLogger()
+        self.is_debug = is_debug
+        self.s = None
+        self.cmdid = 999
+        self.op_state = None
+        self.equ_coord = None
+        self.equ_coord_event = threading.Event()
+        self.is_watch_events = False
+        self.get_msg_thread = None
+        self.framer = FrameBuffer()
+        self.send_lock = threading.Lock()
+        self.subscriptions = {}
+        self.subscriptions_lock = threading.Lock()
+        self.cancel_event = threading.Event()
+        self.health = seestar_health.LinkHealth(idle_interval, stall_timeout)
+        self.timing = timing if timing is not None else seestar_timing.TimingRecorder()
+        # reconnection: the requests awaiting a reply, the last value of each
+        # setting, and whether the SeeStar should be slewing or stacking
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
+        # the callers of request() waiting for a reply, by request id
+        self.replies = {}
+        self.settings = {}
+        self.last_goto = None
+        self.is_stacking = False
+        self.reconnect_lock = threading.RLock()
+        self.close_event = threading.Event()
+        self.generation = 0
+        self.is_reconnecting = False
+        self.is_link_down = False
+        self.recovery_times = []
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        """Open the socket, apply the stack settings and start the receive thread."""
+        self.health.reset()
+        self.close_event.clear()
+        self.is_link_down = False
+        self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        socket_result = self.s.connect_ex((self.host, self.port))
+        if socket_result == 0:
+            self.logger.debug("Connected to SeeStar")
+        else:
+            self.logger.error("Failed to connect to SeeStar")
+            self.s.close()
+            self.s = None
+            raise RuntimeError("Failed to connect to SeeStar")
+        # the receive thread matches the reply to the stack settings
+        self.is_watch_events = True
+        self.get_msg_thread = threading.Thread(
+            target=self.receieve_message_thread_fn, daemon=True
+        )
+        self.get_msg_thread.start()
+        self.set_stack_settings()
+
+    def close(self):
+        """Stop the receive thread, cancel any waits and close the socket."""
+        self.is_watch_events = False
+        self.close_event.set()
+        self.cancel()
+        if self.s is not None:
+            try:
+                # wake the receive thread from a blocking recv
+                self.s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self.get_msg_thread is not None:
+            self.get_msg_thread.join(timeout=10)
+            self.get_msg_thread = None
+        if self.s is not None:
+            self.s.close()
+            self.s = None
+        with self.in_flight_lock:
+            waiters = list(self.replies.values())
+            self.replies.clear()
+        for waiter in waiters:
+            waiter.resolve(None)
+
+    def subscribe(self, event_name, predicate=None):
+        """
+        Listen for the SeeStar events with the given name.
+        Args:
+            event_name (str): The "Event" field to listen for, e.g. "AutoGoto" or "Stack".
+            predicate (callable): Only deliver the events for which this returns True.
+        Returns:
+            EventSubscription: The subscription to wait on, cancel it when done.
+        """
+        subscription = EventSubscription(self, event_name, predicate)
+        with self.subscriptions_lock:
+            self.subscriptions.setdefault(event_name, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.subscriptions_lock:
+            subscriptions = self.subscriptions.get(subscription.event_name, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+
+    def dispatch_event(self, event):
+        with self.subscriptions_lock:
+            subscriptions = list(self.subscriptions.get(event["Event"], []))
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def cancel(self):
+        """Wake every wait of this session, e.g. to abandon the current target."""
+        self.cancel_event.set()
+        with self.subscriptions_lock:
+            subscriptions = [s for subs in self.subscriptions.values() for s in subs]
+        for subscription in subscriptions:
+            subscription.cancel()
+
+    def next_cmdid(self):
+        cmdid = self.cmdid
+        self.cmdid += 1
+        return cmdid
+
+    def send_message(self, data):
+        """
+        Send a framed message. When the link has dropped, reconnect, after
+        which the request is replayed if its method is safe to repeat.
+        Returns:
+            bool: True if the message was sent on the current connection.
+        """
+        generation = self.generation
+        try:
+            if self.s is None:
+                self.logger.error("Socket is not connected")
+                return False
+            with self.send_lock:
+                self.s.sendall(
+                    data.encode()
+                )  # TODO: would utf-8 or unicode_escaped help here
+            return True
+        except (socket.timeout, OSError) as e:
+            self.logger.error("Socket error: %s" % e)
+            if self.is_watch_events:
+                self.reconnect(generation)
             return False
-        s.sendall(data.encode())  # TODO: would utf-8 or unicode_escaped help here
-        return True
-    except socket.timeout:
-        logger.error("Socket timeout")
-        time.sleep(3)
-        return False
-    except socket.error as e:
-        logger.error("Socket error: %s" % e)
-        time.sleep(3)
-        return False
-    except Exception as e:
-        logger.error("Exception: %s" % e)
-        time.sleep(3)
-        return False
-
-
-def get_socket_msg():
-    global s
-    try:
-        data = s.recv(1024 * 60)  # comet data is >50kb
-    except socket.error as e:
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.connect((HOST, PORT))
-        data = s.recv(1024 * 60)
-    data = data.decode("utf-8")
-    if is_debug:
-        print("Received :", data)
-    return data
-
-
-def receieve_message_thread_fn():
-    global is_watch_events
-    global op_state
-    global s
-    global logger
 
-    msg_remainder = ""
-    while is_watch_events:
-        # print("checking for msg")
-        data = get_socket_msg()
+    def send_request(self, data):
+        """Send a request, keeping it for replay until its reply arrives."""
+        method = data.get("method")
+        if method in SETTINGS_METHODS:
+            self.settings[method] = data.get("params")
+        with self.in_flight_lock:
+            self.in_flight[data["id"]] = data
+        self.health.sent(data["id"], method)
+        return self.send_message(json.dumps(data) + "\r\n")
+
+    def request(self, data, timeout=REPLY_TIMEOUT):
+        """
+        Send a request and wait for the reply with its id. A request replayed
+        after a reconnect is still matched, under its new id.
+        Args:
+            data (dict): The request, with its "id" and "method".
+            timeout (float): Seconds to wait for the reply.
+        Returns:
+            dict: The reply, or None if none came in time.
+        """
+        waiter = PendingReply()
+        with self.in_flight_lock:
+            self.replies[data["id"]] = waiter
+        try:
+            if not self.send_request(data) and (self.s is None or self.is_link_down):
+                return None
+            return waiter.wait(timeout)
+        finally:
+            with self.in_flight_lock:
+                for cmdid in [i for i, w in self.replies.items() if w is waiter]:
+                    del self.replies[cmdid]
+
+    def reconnect(self, generation=None):
+        """
+        Open a new connection after the link dropped, retrying with
+        exponential backoff and jitter, and bring it back to the state of the
+        old one with resync().
+        Args:
+            generation (int): The connection the caller saw fail. If another
+                thread has already replaced it, nothing is done.
+        Returns:
+            bool: True once a new connection is up.
+        """
+        with self.reconnect_lock:
+            if generation is not None and generation != self.generation:
+                return True
+            if self.close_event.is_set():
+                return False
+            self.is_reconnecting = True
+            dropped = time.monotonic()
+            self.logger.warning("Link to the SeeStar dropped, reconnecting")
+            try:
+                for attempt in range(RECONNECT_ATTEMPTS):
+                    delay = min(RECONNECT_BASE * 2**attempt, RECONNECT_MAX)
+                    if self.close_event.wait(random.uniform(delay / 2, delay)):
+                        return False
+                    try:
+                        sock = socket.create_connection(
+                            (self.host, self.port), timeout=10
+                        )
+                        sock.settimeout(None)
+                    except OSError as e:
+                        self.logger.warning(f"Reconnect attempt {attempt + 1}: {e}")
+                        continue
+                    old, self.s = self.s, sock
+                    if old is not None:
+                        try:
+                            # end the old connection at once, the peer may
+                            # already have closed its end
+                            old.shutdown(socket.SHUT_RDWR)
+                        except OSError:
+                            pass
+                        old.close()
+                    self.framer.reset()
+                    self.health.reset()
+                    self.generation += 1
+                    try:
+                        self.resync()
+                    except OSError as e:
+                        self.logger.warning(f"Resync attempt {attempt + 1}: {e}")
+                        continue
+                    recovery = time.monotonic() - dropped
+                    self.recovery_times.append(recovery)
+                    self.logger.info(f"Reconnected to the SeeStar in {recovery:.1f} s")
+                    return True
+                self.logger.error(
+                    f"Could not reconnect to the SeeStar after {RECONNECT_ATTEMPTS} tries"
+                )
+                self.is_link_down = True
+                return False
+            finally:
+                self.is_reconnecting = False
+
+    def resync(self):
+        """
+        Bring a new connection to the state of the one that dropped: the
+        settings are applied again, then the requests that had no reply are
+        replayed if they are safe to repeat.
+
+        iscope_start_stack is never sent again with restart, which would throw
+        away the frames stacked so far. If the SeeStar was stacking, or asked
+        to, it is sent with restart False, which carries on the stack the unit
+        has or starts one if the request never arrived. A goto that was in
+        flight or still slewing is sent again, as slewing to the same target
+        twice is harmless and its AutoGoto end event may have been lost.
+        Anything else, such as pi_shutdown, is logged and dropped.
+        """
+        with self.in_flight_lock:
+            pending = list(self.in_flight.values())
+            self.in_flight.clear()
+        # the id each method had on the old connection, so a caller waiting
+        # in request() gets the reply to the replay
+        pending_ids = {data.get("method"): data["id"] for data in pending}
+        replay = []
+        for method, params in self.settings.items():
+            replay.append(
+                ({"method": method, "params": params}, pending_ids.get(method))
+            )
+        for data in pending:
+            method = data.get("method")
+            if method in SETTINGS_METHODS or method in (
+                "iscope_start_stack",
+                "iscope_start_view",
+            ):
+                continue
+            if method in IDEMPOTENT_METHODS:
+                replay.append((data, data["id"]))
+            else:
+                self.logger.warning(f"Not replaying {method} after the reconnect")
+                with self.in_flight_lock:
+                    waiter = self.replies.pop(data["id"], None)
+                if waiter is not None:
+                    waiter.resolve(None)
+        if self.last_goto is not None and (
+            self.op_state == "working" or "iscope_start_view" in pending_ids
+        ):
+            replay.append((self.last_goto, pending_ids.get("iscope_start_view")))
+        if self.is_stacking:
+            replay.append(
+                (
+                    {"method": "iscope_start_stack", "params": {"restart": False}},
+                    pending_ids.get("iscope_start_stack"),
+                )
+            )
+        for data, old_id in replay:
+            data = dict(data, id=self.next_cmdid())
+            if data.get("params") is None:
+                data.pop("params", None)
+            self.logger.debug(f"Replaying {data['method']}")
+            with self.in_flight_lock:
+                self.in_flight[data["id"]] = data
+                waiter = self.replies.pop(old_id, None)
+                if waiter is not None:
+                    self.replies[data["id"]] = waiter
+            self.health.sent(data["id"], data["method"])
+            with self.send_lock:
+                self.s.sendall((json.dumps(data) + "\r\n").encode())
+
+    def get_socket_msg(self):
+        """
+        Read from the socket into the frame buffer.
+        Returns:
+            int: The number of bytes read, 0 if the connection dropped.
+        """
+        try:
+            return self.framer.recv_into(self.s)
+        except (OSError, AttributeError):
+            return 0
+
+    def receieve_message_thread_fn(self):
+        while self.is_watch_events:
+            # print("checking for msg")
+            generation = self.generation
+            if not self.get_socket_msg():
+                if not self.is_watch_events:
+                    break
+                # the connection dropped
+                if not self.reconnect(generation):
+                    break
+                continue
+            for first_msg in self.framer.frames():
+                if self.is_debug:
+                    print("Received :", first_msg)
+                try:
+                    parsed_data = json.loads(first_msg)
+                except ValueError:
+                    self.logger.error(f"Unable to parse message: {first_msg[:200]}")
+                    continue
+                self.health.received(parsed_data)
+                if "id" in parsed_data:
+                    with self.in_flight_lock:
+                        self.in_flight.pop(parsed_data["id"], None)
+                        waiter = self.replies.pop(parsed_data["id"], None)
+                    if waiter is not None:
+                        waiter.resolve(parsed_data)
+
+                if "Event" in parsed_data:
+                    if parsed_data["Event"] == "AutoGoto":
+                        self.logger.debug(
+                            "AutoGoto state: %s" % parsed_data.get("state")
+                        )
+                    self.dispatch_event(parsed_data)
+
+                if parsed_data.get("method") == "scope_get_equ_coord":
+                    self.equ_coord = parsed_data.get("result")
+                    self.equ_coord_event.set()
+
+                if self.is_debug:
+                    self.logger.debug(parsed_data)
+
+    def json_message(self, instruction):
+        data = {"id": self.next_cmdid(), "method": instruction}
+        if self.is_debug:
+            self.logger.debug("Sending %s" % json.dumps(data))
+        return self.send_request(data)
+
+    def json_message2(self, data, timeout=REPLY_TIMEOUT):
+        """
+        Send a request and check the reply with its id.
+        Args:
+            data (dict): The request, with its "id" and "method".
+            timeout (float): Seconds to wait for the reply.
+        Returns:
+            bool: True if the SeeStar accepted the request, False if it
+                replied with an error or not at all.
+        """
         if data:
-            msg_remainder += data
-            first_index = msg_remainder.find("\r\n")
-
-            while first_index >= 0:
-                first_msg = msg_remainder[0:first_index]
-                msg_remainder = msg_remainder[first_index + 2 :]
-                parsed_data = json.loads(first_msg)
-
-                if "Event" in parsed_data and parsed_data["Event"] == "AutoGoto":
-                    state = parsed_data["state"]
-                    logger.debug("AutoGoto state: %s" % state)
-                    if state == "complete" or state == "fail":
-                        op_state = state
-
-                if is_debug:
-                    logger.debug(parsed_data)
-
-                first_index = msg_remainder.find("\r\n")
-        time.sleep(1)
-
+            json_data = json.dumps(data)
+            self.logger.debug("Sending2 %s" % json_data)
+            resp = self.request(data, timeout)
+            self.logger.debug("Response2: %s" % resp)
+            if resp is None:
+                self.logger.error(f"No reply to {data['method']}")
+                return False
+            if "error" in resp or resp.get("code", 0) != 0:
+                self.logger.error(
+                    f"{data['method']} failed: {resp.get('error')} "
+                    f"(code {resp.get('code')})"
+                )
+                return False
+            return True
+        else:
+            return None
+
+    def heartbeat(self):
+        """Send a test_connection keepalive now, whatever the traffic."""
+        return self.json_message("test_connection")
+
+    def check_link(self):
+        """
+        Send a keepalive if the link has been idle for the idle interval.
+        Raises:
+            seestar_health.LinkStalled: Nothing has been received for longer
+                than the stall timeout while a request was waiting for a reply,
+                or the link dropped and could not be reconnected.
+        """
+        if self.is_link_down:
+            raise seestar_health.LinkStalled("Could not reconnect to the SeeStar")
+        if self.is_reconnecting:
+            # the stall deadline does not apply while the link is being rebuilt
+            return
+        self.health.expire()
+        with self.in_flight_lock:
+            for cmdid in [i for i in self.in_flight if i not in self.health.pending]:
+                del self.in_flight[cmdid]
+        if self.health.stalled():
+            self.logger.error(f"Link stalled. {self.health.summary()}")
+            raise seestar_health.LinkStalled(
+                f"Nothing received from the SeeStar for {self.health.stall_timeout} s"
+            )
+        if self.health.keepalive_due():
+            self.heartbeat()
+
+    def get_equ_coord(self, timeout=10):
+        """
+        Ask the SeeStar where it is pointing.
+        Returns:
+            tuple: The right ascension and declination, or None if there was no reply.
+        """
+        self.equ_coord_event.clear()
+        self.json_message("scope_get_equ_coord")
+        if not self.equ_coord_event.wait(timeout):
+            self.logger.error("No reply to scope_get_equ_coord")
+            return None
+        return float(self.equ_coord["ra"]), float(self.equ_coord["dec"])
+
+    def shutdown_seestar(self):
+        """
+        Shutdown the seestar device
+        """
+        data = {}
+        data["id"] = self.next_cmdid()
+        data["method"] = "pi_shutdown"
+        self.json_message2(data)
+
+    def set_stack_settings(self):
+        self.logger.debug("set stack setting to record individual frames")
+        data = {}
+        data["id"] = self.next_cmdid()
+        data["method"] = "set_stack_setting"
+        params = {}
+        params["save_discrete_frame"] = True
+        data["params"] = params
+        return self.json_message2(data)
+
+    def goto_target(self, ra, dec, target_name, exp_time=10, exp_cont=60):
+        """Send a message to the SeeStar to go to a target.
+        Args:
+            ra (float): The right ascension of the target.
+            dec (float): The declination of the target.
+            target_name (str): The name of the target.
+            exp_time (int): The exposure time in seconds.
+        Returns:
+            bool: True if the SeeStar accepted the exposure settings and the goto.
+        """
+        # first we set the integration time of the sub exposures
+        data = {}
+        data["id"] = self.next_cmdid()
+        data["method"] = "set_setting"
+        params = {}
+        params["exp_ms"] = {}  #### this is not been set on the seestar
+        params["exp_ms"]["stack_l"] = int(exp_time) * 1000
+        params["exp_ms"]["continuous"] = int(exp_cont) * 1000
+        data["params"] = params
+        self.logger.debug(f"Exposure Settings: {data}")
+        if not self.json_message2(data):
+            self.logger.error("Exposure settings not applied, not going to target")
+            return False
 
-def json_message(instruction, cmdid):
-    global logger
-    data = {"id": cmdid, "method": instruction}
-    cmdid += 1
-    json_data = json.dumps(data)
-    if is_debug:
-        logger.debug("Sending %s" % json_data)
-    send_message(json_data + "\r\n")
-
-
-def goto_target(ra, dec, target_name, exp_time=10, exp_cont=60):
-    """Send a message to the SeeStar to go to a target.
-    Args:
-        ra (float): The right ascension of the target.
-        dec (float): The declination of the target.
-        target_name (str): The name of the target.
-        exp_time (int): The exposure time in seconds.
-    """
-    global cmdid
-    global logger
-    # first we set the integration time of the sub exposures
-    data = {}
-    data["id"] = cmdid
-    cmdid += 1
-    data["method"] = "set_setting"
-    params = {}
-    params["exp_ms"] = {}  #### this is not been set on the seestar
-    params["exp_ms"]["stack_l"] = int(exp_time) * 1000
-    params["exp_ms"]["continuous"] = int(exp_cont) * 1000
-    data["params"] = params
-    logger.debug(f"Exposure Settings: {data}")
-    json_message2(data, logger)
-
-    logger.debug("going to target...")
-    data = {}
-    data["id"] = cmdid
-    cmdid += 1
-    data["method"] = "iscope_start_view"
-    params = {}
-    params["mode"] = "star"
-    ra_dec = [ra, dec]
-    params["target_ra_dec"] = ra_dec
-    params["target_name"] = target_name
-    params["lp_filter"] = False
-    data["params"] = params
-    json_message2(data, logger)
-
-
-def start_stack():
-    global cmdid
-    global logger
-    logger.debug("starting to stack...")
-    data = {}
-    data["id"] = cmdid
-    cmdid += 1
-    data["method"] = "iscope_start_stack"
-    params = {}
-    params["restart"] = True
-    data["params"] = params
-    json_message2(data, logger)
-
-
-def stop_stack():
-    global cmdid
-    global logger
-    logger.debug("stop stacking...")
-    data = {}
-    data["id"] = cmdid
-    cmdid += 1
-    data["method"] = "iscope_stop_view"
-    params = {}
-    params["stage"] = "Stack"
-    data["params"] = params
-    json_message2(data, logger)
-
-
-def wait_end_op():
-    global op_state
-    op_state = "working"
-    heartbeat_timer = 0
-    while op_state == "working":
-        heartbeat_timer += 1
-        if heartbeat_timer > 5:
-            heartbeat_timer = 0
-            json_message("test_connection", 413)
-        time.sleep(1)
-
-
-def sleep_with_heartbeat():
-    stacking_timer = 0
-    while stacking_timer < session_time:  # stacking time per segment
-        stacking_timer += 1
-        if stacking_timer % 5 == 0:
-            json_message("test_connection", 413)
-        time.sleep(1)
+        self.logger.debug("going to target...")
+        data = {}
+        data["id"] = self.next_cmdid()
+        data["method"] = "iscope_start_view"
+        params = {}
+        params["mode"] = "star"
+        ra_dec = [ra, dec]
+        params["target_ra_dec"] = ra_dec
+        params["target_name"] = target_name
+        params["lp_filter"] = False
+        data["params"] = params
+        self.last_goto = data
+        return self.json_message2(data)
+
+    def start_stack(self):
+        self.logger.debug("starting to stack...")
+        data = {}
+        data["id"] = self.next_cmdid()
+        data["method"] = "iscope_start_stack"
+        params = {}
+        params["restart"] = True
+        data["params"] = params
+        self.is_stacking = True
+        self.json_message2(data)
+
+    def stop_stack(self):
+        self.logger.debug("stop stacking...")
+        data = {}
+        data["id"] = self.next_cmdid()
+        data["method"] = "iscope_stop_view"
+        params = {}
+        params["stage"] = "Stack"
+        data["params"] = params
+        self.is_stacking = False
+        self.json_message2(data)
+
+    def wait_end_op(self, subscription=None, timeout=None):
+        """
+        Wait for the running AutoGoto to complete or fail, sending a keepalive
+        whenever the link has been idle for the idle interval.
+        Args:
+            subscription (EventSubscription): An AutoGoto subscription made before
+                the goto was sent, so an early event is not missed.
+            timeout (float): Give up after this many seconds, None to wait forever.
+        Returns:
+            str: The final state, "complete", "fail" or "timeout".
+        """
+        own_subscription = subscription is None
+        if own_subscription:
+            subscription = self.subscribe("AutoGoto", is_end_of_op)
+        self.op_state = "working"
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            while self.op_state == "working":
+                wait_time = self.health.check_interval
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.op_state = "timeout"
+                        break
+                    wait_time = min(wait_time, remaining)
+                event = subscription.wait(wait_time)
+                if event is None:
+                    self.check_link()
+                else:
+                    self.op_state = event["state"]
+        finally:
+            if own_subscription:
+                subscription.cancel()
+        return self.op_state
+
+    def sleep_with_heartbeat(self, session_time):
+        """
+        Wait out the stacking time, sending a keepalive whenever the link has
+        been idle for the idle interval.
+        Raises:
+            EventWaitCancelled: The session was cancelled during the wait.
+            seestar_health.LinkStalled: The link stalled during the wait.
+        """
+        deadline = time.monotonic() + session_time
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if self.cancel_event.wait(min(self.health.check_interval, remaining)):
+                raise EventWaitCancelled("Stacking wait cancelled")
+            self.check_link()
+
+    def observe(self, target_name, ra, dec, exp_time, session_time, ra_unit="hours"):
+        """Go to a target and stack on it for the session time.
+        Args:
+            target_name (str): The name of the target.
+            ra (float): The right ascension of the target.
+            dec (float): The declination of the target.
+            exp_time (float): The exposure time of the subs in seconds.
+            session_time (float): The stacking time in seconds.
+            ra_unit (str): "hours" or "degrees", the unit of ra.
+        """
+        self.logger.info(f"Goto {target_name} ({ra}, {dec})")
+        self.cancel_event.clear()
+        with self.timing.span("target", target=target_name) as target_span:
+            # the coordinates let seestar_slew fit slew times to the gotos,
+            # the RA is recorded in degrees whatever unit it came in
+            span_ra = ra * 15 if ra_unit == "hours" else ra
+            with self.timing.span(
+                "goto", target=target_name, ra=span_ra, dec=dec
+            ) as goto_span:
+                with self.subscribe("AutoGoto", is_end_of_op) as goto_events:
+                    if self.goto_target(ra, dec, target_name, exp_time):
+                        self.wait_end_op(goto_events, GOTO_TIMEOUT)
+                    else:
+                        self.op_state = "fail"
+                if self.op_state != "complete":
+                    goto_span["status"] = self.op_state
+            if self.op_state == "timeout":
+                self.logger.error(f"Goto did not finish within {GOTO_TIMEOUT} s")
+            self.logger.info("Goto operation finished")
+
+            with self.timing.span("settle", target=target_name):
+                time.sleep(SETTLE_TIME)
+
+            if self.op_state == "complete":
+                with self.timing.span(
+                    "stack", target=target_name, requested=session_time
+                ):
+                    self.start_stack()
+                    self.sleep_with_heartbeat(session_time)
+                    self.stop_stack()
+                self.logger.info("Stacking operation finished " + target_name)
+                self.logger.info(self.health.summary())
+            else:
+                self.logger.error("Goto failed.")
+                target_span["status"] = "goto_failed"
+                raise RuntimeError("Goto failed.")
+
+
+def is_end_of_op(event):
+    """True for the AutoGoto events that end the operation."""
+    return event.get("state") in ("complete", "fail")
 
 
 def parse_ra_to_float(ra_string):
@@ -272,19 +934,7 @@ def parse_dec_to_float(dec_string):
     return dec_decimal
 
 
-is_watch_events = True
-
-
 def main():
-    global HOST
-    global PORT
-    global session_time
-    global s
-    global cmdid
-    global is_watch_events
-    global is_debug
-    global op_state
-    global exp_time
     global logger
 
     logger = CreateLogger()
@@ -293,12 +943,12 @@ def main():
 
     parser = setup_argparse()
     args = parser.parse_args()
-    HOST = sp.ip
     target_name = args.title
     center_RA = args.ra
     center_Dec = args.dec
     session_time = args.session_time
     exp_time = args.exp_time
+    ra_unit = args.ra_unit
 
     try:
         center_RA = float(center_RA)
@@ -312,66 +962,32 @@ def main():
 
     is_debug = args.is_debug
 
-    PORT = sp.port
-    cmdid = 999
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    socket_result = s.connect_ex((HOST, PORT))
-    if socket_result == 0:
-        logger.debug("Connected to SeeStar")
-    else:
-        logger.error("Failed to connect to SeeStar")
-        raise RuntimeError("Failed to connect to SeeStar")
-    set_stack_settings(logger, cmdid)
-    with s:
-        # flush the socket input stream for garbage
-        get_socket_msg()
-
+    with SeestarSession(logger=logger, is_debug=is_debug) as session:
         if center_RA < 0:
-            json_message("scope_get_equ_coord", 413)
-            data = get_socket_msg()
-            parsed_data = json.loads(data)
-            if parsed_data["method"] == "scope_get_equ_coord":
-                data_result = parsed_data["result"]
-                center_RA = float(data_result["ra"])
-                center_Dec = float(data_result["dec"])
-                logger.debug(center_RA, center_Dec)
+            equ_coord = session.get_equ_coord()
+            if equ_coord is not None:
+                # the SeeStar reports its RA in hours
+                center_RA, center_Dec = equ_coord
+                ra_unit = "hours"
+                logger.debug(f"{center_RA} {center_Dec}")
 
         # print input requests
         logger.info("received parameters:")
-        logger.debug("  ip address    : " + HOST)
-        logger.info("  target        : " + target_name)
-        logger.debug("  RA            : "+ center_RA)
-        logger.debug("  Dec           : "+ center_Dec)
-        logger.debug("  session time  : "+ session_time)
-        logger.debug("  exp_time      : "+ exp_time)
-
-        get_msg_thread = threading.Thread(target=receieve_message_thread_fn)
-        get_msg_thread.start()
-
-        mosaic_index = 0
-        logger.info("Goto ", (center_RA, center_Dec))
-        goto_target(center_RA, center_Dec, target_name)
-        wait_end_op()
-        logger.info("Goto operation finished")
-
-        time.sleep(3)
-
-        if op_state == "complete":
-            start_stack()
-            sleep_with_heartbeat()
-            stop_stack()
-            logger.info("Stacking operation finished" + target_name)
-        else:
-            logger.error("Goto failed.")
-            raise RuntimeError("Goto failed.")
+        logger.debug(f"  ip address    : {session.host}")
+        logger.info(f"  target        : {target_name}")
+        logger.debug(f"  RA            : {center_RA} {ra_unit}")
+        logger.debug(f"  Dec           : {center_Dec}")
+        logger.debug(f"  session time  : {session_time}")
+        logger.debug(f"  exp_time      : {exp_time}")
+
+        session.observe(
+            target_name, center_RA, center_Dec, exp_time, session_time, ra_unit
+        )
 
     print("Finished seestar_run")
-    is_watch_events = False
-    get_msg_thread.join(timeout=10)
-    s.close()
     if not is_debug:
         logger.info("Finished seestar_run")
-        # shutdown_seestar(logger,cmdid)
+        # session.shutdown_seestar()
 
 
 def setup_argparse():
@@ -392,8 +1008,24 @@ def setup_argparse():
         nargs="?",
         help="Print debug logs while running.",
     )
+    parser.add_argument(
+        "--ra-unit",
+        type=str,
+        choices=("hours", "degrees"),
+        default="hours",
+        help="The unit of a decimal RA, e.g. degrees from SIMBAD",
+    )
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="Report the import and initialization time of each module and exit",
+    )
     return parser
 
 
 if __name__ == "__main__":
+    # only loaded here, so the per-target subprocess does not pay for it
+    import seestar_startup
+
+    seestar_startup.profile_requested("seestar_run")
     main()
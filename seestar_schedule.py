@@ -1,318 +1,407 @@
-import json
+import argparse
 import datetime
-import pandas as pd
 import numpy as np
 import os
 import sys
-import uuid
-import astropy.units as u
-from astropy.coordinates import SkyCoord
-from astroquery.simbad import Simbad
-import ephem
 import pytz
-from colorama import Fore, Back, Style
+from colorama import Fore, Style
+import seestar_ephemeris
+import seestar_manifest
+import seestar_planner
+import seestar_resolver
+import seestar_schedule_table
+import seestar_slew
+import seestar_startup
+import seestar_timing
+import seestar_visibility
 
 
-def local_twilight(obs_params):
+def local_twilight(obs_params, night=None):
     """
     Calculate the local twilight times
     :param obs_params: the observatory parameters
+    :param night: the local date of the evening, tonight if None
     :return: the local twilight times
     """
-    # get the current date
-    now = datetime.datetime.now(tz=pytz.utc)
-    # get the current date
-    today = now.date()
-    # use pyephem to calculate the local twilight times
-    obs = ephem.Observer()
-    # set the observatory parameters from the obs_params
-    # print (obs_params)
-    obs.lat = obs_params["Latitude"]
-    obs.long = obs_params["Longitude"]
-    obs.elevation = float(obs_params["Elevation"])
-    obs.date = today
-    # calculate the next nautical twilight
-    # nautical twilight is when the sun is 12 degrees below the horizon
-    # determine when the sun is 12 degrees below the horizon
-    obs.horizon = "-12"
-    nautical_twilight = obs.next_setting(ephem.Sun(), use_center=True).datetime()
+    # the sun events of each night are computed once and kept in a table
+    table = seestar_ephemeris.EphemerisTable(
+        obs_params["Latitude"], obs_params["Longitude"], obs_params["Elevation"]
+    )
+    if night is None:
+        night = seestar_ephemeris.night_of(
+            datetime.datetime.now(tz=pytz.utc), table.longitude
+        )
     local_tz = pytz.timezone(obs_params["Timezone"])
-    # calculate the next morning nautical twilight
-    morning_nautical_twilight = obs.next_rising(ephem.Sun(), use_center=True).datetime()
-    ntlocal = nautical_twilight.replace(tzinfo=pytz.utc).astimezone(local_tz)
-    mntlocal = morning_nautical_twilight.replace(tzinfo=pytz.utc).astimezone(local_tz)
+    # nautical twilight is when the sun is 12 degrees below the horizon
+    ntlocal, mntlocal = table.twilight(night, "nautical", local_tz)
+    table.close()
     return ntlocal, mntlocal
 
 
-def create_schedule(file, obs_params, config_settings):
+def create_schedule(
+    manifest,
+    resolver=None,
+    solver=seestar_planner.DEFAULT_SOLVER,
+    night=None,
+    compact=False,
+    slew_model=None,
+):
     """
     Create a schedule from a target list
-    :param file: the target list file
-    :param obs_params: the observatory parameters
-    :param config_settings: the config settings
-    :return: None
+    :param manifest: the Manifest, or the name of the target list file
+    :param resolver: the SimbadResolver used to look up target coordinates
+    :param solver: the name of the scheduling engine in seestar_planner.SOLVERS
+    :param night: the local date of the evening to plan, tonight if None
+    :param compact: write schedule.json without indentation
+    :param slew_model: the seestar_slew.SlewModel of the gotos, fitted to
+        seestar_timing.jsonl if None
+    :return: the ScheduleTable of the schedule
+    """
+    if not isinstance(manifest, seestar_manifest.Manifest):
+        manifest = seestar_manifest.read_manifest(manifest)
+    targets = read_targets(manifest, resolver)
+    nautical_twilight, morning_nautical_twilight = local_twilight(manifest.site, night)
+    schedule, _ = plan_night(
+        targets,
+        manifest.site,
+        manifest.config,
+        nautical_twilight,
+        morning_nautical_twilight,
+        solver,
+        slew_model,
+    )
+    # write the schedule to a json file
+    with open("schedule.json", "w") as f:
+        schedule.write_json(f, compact=compact)
+    return schedule
+
+
+def plan_night(
+    targets,
+    obs_params,
+    config_settings,
+    nautical_twilight,
+    morning_nautical_twilight,
+    solver=seestar_planner.DEFAULT_SOLVER,
+    slew_model=None,
+    verbose=True,
+):
     """
-    gain = 80
-    targets = read_targets(file)
-    # generate the json schedule using the json format above
-    schedule = {}
-    schedule["version"] = 1.0
-    schedule["Event"] = "Scheduler"
-    # generate a unique schedule id using uuid
-    schedule["schedule_id"] = str(uuid.uuid1())
-    schedule["list"] = []
-    nautical_twilight, morning_nautical_twilight = local_twilight(obs_params)
-    if config_settings["Wait_For_Twilight"] == "True":
+    Plan one night of resolved targets
+    :param targets: the target columns, as returned by read_targets
+    :param obs_params: the Observatory section of the manifest
+    :param config_settings: the Config section of the manifest
+    :param nautical_twilight: the evening nautical twilight, timezone aware
+    :param morning_nautical_twilight: the morning nautical twilight
+    :param solver: the name of the scheduling engine in seestar_planner.SOLVERS
+    :param slew_model: the seestar_slew.SlewModel of the gotos, fitted to
+        seestar_timing.jsonl if None
+    :param verbose: print the plan to the terminal
+    :return: the ScheduleTable and the (target index, start unix time) plan
+    """
+    echo = print if verbose else lambda *args: None
+    # the items are rows of a compact table, written out as json at the end
+    schedule = seestar_schedule_table.ScheduleTable(
+        targets["Name"],
+        targets["ra"],
+        targets["dec"],
+        targets["ExpTime"],
+        targets["TotalExp"],
+        targets["Pause"],
+        pytz.timezone(obs_params["Timezone"]),
+        capacity=3 * len(targets["Name"]) + 2,
+    )
+    # the altitude and azimuth of every target over the whole night, computed
+    # once and looked up below
+    visibility = seestar_visibility.VisibilityGrid(
+        targets["ra_deg"],
+        targets["dec_deg"],
+        obs_params["Latitude"],
+        obs_params["Longitude"],
+        nautical_twilight,
+        morning_nautical_twilight,
+    )
+    start = nautical_twilight.timestamp()
+    if config_settings.get("Wait_For_Twilight", False):
         # add a wait_until item to the schedule to wait until nautical twilight
-        wait_until_item = {}
-        wait_until_item["action"] = "wait_until"
-        wait_until_item["params"] = {}
-        wait_until_item["params"]["local_time"] = nautical_twilight.strftime("%H:%M")
-        wait_until_item["schedule_item_id"] = str(uuid.uuid1())
-        schedule["list"].append(wait_until_item)
-    if config_settings["Start_Up_Sequence"] == "True":
-        # add a start_up_sequence item to the schedule
-        start_up_sequence = {}
-        start_up_sequence["action"] = "start_up_sequence"
-        start_up_sequence["params"] = {}
-        start_up_sequence["params"]["auto_focus"] = True
-        start_up_sequence["params"]["dark_frames"] = True
-        start_up_sequence["params"]["3ppa"] = True
-        start_up_sequence["params"]["raise_arm"] = True
-        start_up_sequence["schedule_item_id"] = str(uuid.uuid1())
-        schedule["list"].append(start_up_sequence)
+        schedule.append("wait_until", start=start)
+    if config_settings.get("Start_Up_Sequence", False):
+        schedule.append("start_up_sequence", start=start)
 
-    elapsed_time = 0
+    # plan the night with the chosen scheduling engine
+    exposures = targets["TotalExp"].astype(float)
+    pauses = targets["Pause"].astype(float)
+    priorities = targets["Priority"].astype(float) if "Priority" in targets else None
     # if the schedule flag Repeat_Target is set to True, then repeat the target list
-    irepeat = True
-    while irepeat:
-        ixgt2 = 0
-        # for each target in the target list, create a schedule item
-        for i in range(len(targets)):
-            target_name = targets["Name"][i]
-            exptime = targets["ExpTime"][i]
-            totalexp = targets["TotalExp"][i]
-            ra = targets["ra"][i]
-            dec = targets["dec"][i]
-            # check the altitude of the target
-            obs = ephem.Observer()
-            obs.lat = obs_params["Latitude"]
-            obs.long = obs_params["Longitude"]
-            obs.elevation = float(obs_params["Elevation"])
-            # calulate the time of the observation as the nautical twilight time plus the elapsed time
-            # convert nautical_twilight to UTC
-            date = nautical_twilight.astimezone(pytz.utc) + datetime.timedelta(
-                seconds=int(elapsed_time)
-            )
-            # convert to a pyephem date
-            obs.date = date
-            target = ephem.FixedBody()
-            target._ra = ra
-            target._dec = dec
-            target.compute(obs)
-            alt = target.alt
-            az = target.az
-            # use module to print to the terminal in color
-            print(
-                Fore.BLUE
-                + f"Target {target_name} has altitude {alt} and azimuth {az}"
-                + Style.RESET_ALL
-            )
-            # check if the target has set below 30 degrees altitude and is in the west
-            if float(alt) < 30 / 180 * ephem.pi and az > 180 / 180 * ephem.pi:
-                print(
-                    Fore.RED
-                    + f"{target_name} below 30 degrees altitude and is in the west"
-                    + Style.RESET_ALL
-                )
-                ixgt2 += 1
-                continue
-            # check if the observation would take us past morning twilight
-            if (
-                nautical_twilight
-                + datetime.timedelta(seconds=int(elapsed_time))
-                + datetime.timedelta(seconds=int(totalexp))
-                > morning_nautical_twilight
-            ):
-                irepeat = False
-                break
-            pause = targets["Pause"][i]
-            # we set the exposure time for each target
-            set_exposure_time = {}
-            set_exposure_time["action"] = "action_set_exposure"
-            set_exposure_time["params"] = {}
-            set_exposure_time["params"]["exp"] = exptime * 1000  # convert to ms
-            set_exposure_time["schedule_item_id"] = str(uuid.uuid1())
-            schedule["list"].append(set_exposure_time)
-
-            # Initialize a new schedule_item for each target
-            schedule_item = {}
-            schedule_item["action"] = "start_mosaic"
-            schedule_item["params"] = {}
-            schedule_item["params"]["target_name"] = target_name
-            schedule_item["params"]["is_j2000"] = True
-            schedule_item["params"]["ra"] = ra
-            schedule_item["params"]["dec"] = dec
-            schedule_item["params"]["is_use_lp_filter"] = False
-            schedule_item["params"]["panel_time_sec"] = totalexp
-            schedule_item["params"]["ra_num"] = 1
-            schedule_item["params"]["dec_num"] = 1
-            schedule_item["params"]["panel_overlap_percent"] = 100
-            schedule_item["params"]["selected_panels"] = ""
-            schedule_item["params"]["gain"] = gain
-            schedule_item["params"]["is_use_autofocus"] = False
-            schedule_item["params"]["num_tries"] = 3
-            schedule_item["params"]["retry_wait_s"] = 10
-            schedule_item["schedule_item_id"] = str(uuid.uuid1())
-            schedule["list"].append(schedule_item)
-            elapsed_time += totalexp
-            # add a wait_for item to the schedule between each target
-            if pause > 0:
-                wait_item = {}
-                wait_item["action"] = "wait_for"
-                wait_item["params"] = {}
-                wait_item["params"]["timer_sec"] = pause
-                wait_item["schedule_item_id"] = str(uuid.uuid1())
-                schedule["list"].append(wait_item)
-                elapsed_time += pause
-        # if the Repeat_Targets flag is set to False, then we are done
-        if config_settings["Repeat_Targets"] == "False":
-            irepeat = False
-        # if all the targets are above 2 airmasses, then we are done
-        if ixgt2 == len(targets):
-            print(
+    repeat = config_settings.get("Repeat_Targets", False)
+    if slew_model is None:
+        slew_model = seestar_slew.load_model()
+    options = {"model": slew_model} if solver == "slew" else {}
+    if solver == "cadence" and "Cadence" in targets:
+        # the revisit interval of each target, in minutes in the manifest
+        options["cadences"] = seestar_planner.cadence_seconds(targets["Cadence"])
+    plan = seestar_planner.SOLVERS[solver](
+        visibility, exposures, pauses, priorities, repeat, **options
+    )
+    slews = seestar_slew.plan_slews(
+        plan, targets["ra_deg"], targets["dec_deg"], slew_model
+    )
+    elapsed_time = 0
+    for (i, target_start), slew in zip(plan, slews):
+        if solver == "slew":
+            # the slew solver starts each target once the slew to it is done
+            elapsed_time += slew
+        date = nautical_twilight + datetime.timedelta(seconds=target_start - start)
+        if target_start - start > elapsed_time + 60:
+            # nothing could be observed until now, wait for it
+            schedule.append("wait_until", start=target_start)
+        elapsed_time = target_start - start
+        alt, az = visibility.altaz(i, target_start)
+        # use module to print to the terminal in color
+        echo(
+            Fore.BLUE
+            + f"{date.strftime('%H:%M')} {targets['Name'][i]} has altitude {alt:.1f} and azimuth {az:.1f}"
+            + Style.RESET_ALL
+        )
+        # set the exposure time, stack the target and pause after it
+        schedule.add_target(i, target_start)
+        elapsed_time += exposures[i] + max(pauses[i], 0)
+    # report the targets the plan could not fit in
+    planned = {i for i, _ in plan}
+    for i in range(len(targets["Name"])):
+        if i not in planned:
+            echo(
                 Fore.RED
-                + "All targets are above 2 airmasses - exiting"
+                + f"{targets['Name'][i]} could not be scheduled tonight"
                 + Style.RESET_ALL
             )
-            irepeat = False
-
-    # add the final state of the schedule
-    schedule["state"] = "stopped"
-    schedule["is_stacking_paused"] = False
-    schedule["is_stacking"] = False
-    schedule["is_skip_requested"] = False
-    schedule["current_item_id"] = ""
-    schedule["item_number"] = 0
+    echo(
+        f"Open shutter time: {seestar_planner.science_time(plan, exposures) / 3600:.2f} h"
+    )
+    if solver == "cadence":
+        times = [[] for _ in targets["Name"]]
+        for i, target_start in plan:
+            times[i].append(target_start)
+        cadences = options.get("cadences")
+        if cadences is None or not repeat:
+            cadences = np.full(len(times), seestar_planner.NIGHTLY)
+        for line in seestar_planner.format_cadence_report(
+            seestar_planner.cadence_report(targets["Name"], times, cadences)
+        ):
+            echo(line)
+    # the slewing of the plan against the same observations in manifest order
+    slew_time = slews.sum()
+    manifest_slew_time = seestar_slew.plan_slew_time(
+        seestar_slew.manifest_order(plan),
+        targets["ra_deg"],
+        targets["dec_deg"],
+        slew_model,
+    )
+    echo(
+        f"Predicted slew time: {slew_time / 60:.1f} min, "
+        f"{(manifest_slew_time - slew_time) / 60:.1f} min less than in manifest order"
+    )
 
     # determine the local time that the schedule will finish
     # add the elapsed time to the nautical twilight time in the local timezone
-    print("The schedule will start at: ", nautical_twilight)
+    echo("The schedule will start at: ", nautical_twilight)
     finish_time = nautical_twilight + datetime.timedelta(seconds=int(elapsed_time))
-    print("The schedule will finish at: ", finish_time)
+    echo("The schedule will finish at: ", finish_time)
     # determine if the schedule will finish before morning nautical twilight
     if finish_time > morning_nautical_twilight:
-        print("The schedule will finish after morning nautical twilight")
+        echo("The schedule will finish after morning nautical twilight")
     else:
-        print("The schedule will finish before morning nautical twilight")
+        echo("The schedule will finish before morning nautical twilight")
         # determine the time from the finish of the schedule and morning nautical twilight
         time_to_morning_nautical_twilight = morning_nautical_twilight - finish_time
         # print this in a red color
-        print(
+        echo(
             "The time to morning nautical twilight is: ",
             time_to_morning_nautical_twilight,
         )
 
-    # write the schedule to a json file
-    with open("schedule.json", "w") as f:
-        f.write(
-            json.dumps(
-                schedule,
-                indent=4,
-                default=lambda x: (
-                    int(x) if isinstance(x, (np.integer, np.int64)) else x
-                ),
-            )
-        )
-    # print the schedule to the console
+    return schedule, plan
 
 
-#    print(json.dumps(schedule, indent=4, default=lambda x: int(x) if isinstance(x, (np.integer, np.int64)) else x))
-
-
-def read_targets(file):
-    # read in the targets from the target file
-    # first we read the target file in until we find the start of the target list
-    with open(file, "r") as f:
-        lines = f.readlines()
-    # find the start of the target list
-    # the target list starts with the line 'Name,ExpTime,TotalExp,Pause'
-    for i in range(len(lines)):
-        if lines[i].startswith("Name"):
-            target_start = i
-            break
-    # create a dataframe from the target list
-    # set the column names to the first row of the target list
-    targets = pd.read_csv(file, skiprows=target_start)
-    targets.columns = lines[target_start].replace(" ", "").strip().split(",")
-    # read in the target list
-    # resolve their coordinates using astroquery call to Simbad
-    # and add them to the df
-    coords = []
-    for i in range(len(targets)):
-        target = targets["Name"][i]
-        result_table = Simbad.query_object(target)
-        if result_table is not None:
-            ra = result_table["ra"][0] / 15
-            dec = result_table["dec"][0]
-            # convert the float ra to a string with the format hh:mm:ss
-            rah = int(ra)
-            ramin = int((ra - rah) * 60)
-            rasec = (ra - rah - ramin / 60) * 3600
-            ra = f"{rah:02}:{ramin:02}:{rasec:04.1f}"
-            # convert the float dec to a string with the format dd:mm:ss
-            decd = int(dec)
-            decmin = int((dec - decd) * 60)
-            decsec = (dec - decd - decmin / 60) * 3600
-            # construct the dec string with padding of 0s to 2 digits
-            dec = f"{decd:+03}:{abs(decmin):02}:{abs(decsec):04.1f}"
-            coords.append((ra, dec))
-    # add the coordinates to the dataframe
-    coords = pd.DataFrame(coords, columns=["ra", "dec"])
-    targets = pd.concat([targets, coords], axis=1)
-    # print(targets)
+def read_targets(manifest, resolver=None):
+    """
+    Resolve the coordinates of the targets of a manifest
+    :param manifest: the Manifest, or the name of the target list file
+    :param resolver: the SimbadResolver used to look up target coordinates
+    :return: the target columns of the resolved targets, with their ra and
+        dec as strings and ra_deg and dec_deg in degrees
+    """
+    if not isinstance(manifest, seestar_manifest.Manifest):
+        manifest = seestar_manifest.read_manifest(manifest)
+    names = manifest.targets["Name"]
+    # resolve their coordinates through the local SIMBAD cache, asking
+    # SIMBAD once for any names that are not cached
+    if resolver is None:
+        resolver = seestar_resolver.SimbadResolver()
+    ras, decs = resolver.resolve(list(names))
+    resolved = ~np.isnan(ras)
+    for target in names[~resolved]:
+        print(Fore.RED + f"{target} could not be resolved" + Style.RESET_ALL)
+    targets = manifest.select(resolved).targets
+    ra_strings = []
+    dec_strings = []
+    for ra, dec in zip(ras[resolved] / 15, decs[resolved]):
+        # convert the float ra to a string with the format hh:mm:ss
+        rah = int(ra)
+        ramin = int((ra - rah) * 60)
+        rasec = (ra - rah - ramin / 60) * 3600
+        ra_strings.append(f"{rah:02}:{ramin:02}:{rasec:04.1f}")
+        # convert the float dec to a string with the format dd:mm:ss
+        decd = int(dec)
+        decmin = int((dec - decd) * 60)
+        decsec = (dec - decd - decmin / 60) * 3600
+        # construct the dec string with padding of 0s to 2 digits
+        dec_strings.append(f"{decd:+03}:{abs(decmin):02}:{abs(decsec):04.1f}")
+    # add the coordinates to the target columns
+    targets["ra"] = np.array(ra_strings, dtype=object)
+    targets["dec"] = np.array(dec_strings, dtype=object)
+    targets["ra_deg"] = ras[resolved]
+    targets["dec_deg"] = decs[resolved]
     return targets
 
 
 if __name__ == "__main__":
+    seestar_startup.profile_requested("seestar_schedule")
     # read in the target list name as an argument
-    target_file = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Seestar Schedule")
+    parser.add_argument("target_file", type=str, help="The target list file")
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Resolve targets from the local SIMBAD cache only",
+    )
+    parser.add_argument(
+        "--solver",
+        type=str,
+        choices=sorted(seestar_planner.SOLVERS),
+        default=seestar_planner.DEFAULT_SOLVER,
+        help="The scheduling engine",
+    )
+    parser.add_argument(
+        "--slew-spans",
+        type=str,
+        default=seestar_timing.TIMING_FILE,
+        help="Fit the slew model to the gotos in this timing file",
+    )
+    parser.add_argument(
+        "--nights",
+        type=int,
+        help="Plan this many nights, one schedule file each, in a process pool",
+    )
+    parser.add_argument(
+        "--start",
+        type=datetime.date.fromisoformat,
+        help="The local date of the first evening, YYYY-MM-DD, tonight if not given",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="The processes planning the nights, one per CPU if not given",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default="schedules",
+        help="Where the schedules of --nights are written",
+    )
+    parser.add_argument(
+        "--catalog",
+        type=str,
+        help="Choose the comparison stars of each target from this catalogue folder",
+    )
+    parser.add_argument(
+        "--exposures",
+        action="store_true",
+        help="Set the sub exposure and total time of each target from its magnitude",
+    )
+    parser.add_argument(
+        "--snr",
+        type=float,
+        default=100.0,
+        help="The SNR each visit aims for with --exposures",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write schedule.json without indentation",
+    )
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="Report the import and initialization time of each module and exit",
+    )
+    args = parser.parse_args()
+    target_file = args.target_file
     if target_file == "":
         print("Please provide a target name")
         sys.exit()
     if target_file not in os.listdir():
         print("The target file does not exist")
         sys.exit()
-    # read in the observatory parameters from the target_file
-    with open(target_file, "r") as f:
-        lines = f.readlines()
-    for i in range(len(lines)):
-        if lines[i].startswith("Observatory"):
-            obs_line = i
-            break
-    # read the lines forward from the Observatory line to get the observatory parameters
-    obs_params = {}
-    for i in range(obs_line + 1, len(lines)):
-        if lines[i].startswith("Config") or lines[i].strip() == "":
-            break
-        key, value = lines[i].split(":", 1)
-        value = value.strip()
-        obs_params[key.strip()] = (
-            value.strip()
-        )  # Strip whitespace and newline characters
-        # read in the config settings form the target file
-    for i in range(len(lines)):
-        if lines[i].startswith("Config"):
-            config_line = i
-            break
-    # read the lines forward from the Config line to get the config settings
-    config_settings = {}
-    for i in range(config_line + 1, len(lines)):
-        if lines[i].startswith("Targets") or lines[i].strip() == "":
-            break
-        key, value = lines[i].split(":")
-        config_settings[key] = value
+    # the site, config and targets are read from the file in one pass
+    manifest = seestar_manifest.read_manifest(target_file)
+    resolver = seestar_resolver.SimbadResolver(offline=args.offline)
+    slew_model = seestar_slew.load_model(args.slew_spans)
+    catalog = None
+    if args.catalog:
+        # scipy is only loaded when the catalogue is used
+        import seestar_catalog
 
-    create_schedule(target_file, obs_params, config_settings)
+        catalog = seestar_catalog.StarCatalog(args.catalog)
+    if args.exposures:
+        import seestar_exposure
+
+        manifest, exposures = seestar_exposure.plan_manifest(
+            manifest, resolver, catalog, goal_snr=args.snr
+        )
+        seestar_exposure.print_plan(manifest.targets["Name"], exposures)
+    if catalog is not None:
+        found = seestar_catalog.manifest_comparisons(
+            manifest, catalog, "comparisons.csv", resolver
+        )
+        for name, count in found.items():
+            if count == 0:
+                print(Fore.RED + f"{name} has no comparison stars" + Style.RESET_ALL)
+        print("The comparison stars have been written to comparisons.csv")
+    if args.nights:
+        # only loaded here, as the campaign imports this module
+        import seestar_campaign
+
+        start = args.start
+        if start is None:
+            start = seestar_ephemeris.night_of(
+                datetime.datetime.now(tz=pytz.utc),
+                seestar_visibility.parse_sexagesimal(manifest.site["Longitude"]),
+            )
+        summary = seestar_campaign.plan_campaign(
+            manifest,
+            start,
+            args.nights,
+            resolver,
+            args.solver,
+            args.output_dir,
+            args.workers,
+            args.compact,
+            slew_model,
+        )
+        seestar_campaign.print_summary(summary)
+        print(Fore.GREEN + f"{args.nights} schedules created" + Style.RESET_ALL)
+        print(
+            "The schedules and the coverage summary have been written to "
+            + args.output_dir
+        )
+        sys.exit()
+    create_schedule(
+        manifest,
+        resolver,
+        args.solver,
+        compact=args.compact,
+        slew_model=slew_model,
+    )
     print(Fore.GREEN + "Schedule created" + Style.RESET_ALL)
     print("The schedule has been written to schedule.json")
@@ -0,0 +1,188 @@
+"""A compact columnar schedule, written out as schedule.json only on export.
+
+The schedule items are rows of one NumPy structured array (action, target
+index, start) and the targets are kept once as column arrays, instead of a
+nested dict and a uuid per item. Everything else an item writes, such as
+its exposure and stacking time, comes from the columns of its target. write_json streams
+the schedule.json text item by item, byte for byte the same as
+json.dumps(schedule, indent=4) of the equivalent dict, or compact with no
+indentation.
+
+Usage:
+    table = ScheduleTable(names, ras, decs, exptimes, totalexps, pauses, tz)
+    table.add_target(3, start=t)
+    with open("schedule.json", "w") as f:
+        table.write_json(f)
+"""
+
+import datetime
+import json
+import uuid
+
+import numpy as np
+
+ACTIONS = (
+    "wait_until",
+    "start_up_sequence",
+    "action_set_exposure",
+    "start_mosaic",
+    "wait_for",
+)
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+ITEM_DTYPE = np.dtype(
+    [
+        ("action", np.uint8),
+        ("target", np.int32),  # -1 for items without a target
+        ("start", np.float64),  # unix time
+    ]
+)
+GAIN = 80
+
+
+class ScheduleTable:
+    """The items of a schedule as rows of a structured array."""
+
+    def __init__(self, names, ras, decs, exptimes, totalexps, pauses, tz, capacity=64):
+        """
+        Args:
+            names (array): The target names.
+            ras (array): The target right ascensions as written, e.g. "05:35:17.3".
+            decs (array): The target declinations as written.
+            exptimes (array): The sub exposure of each target in seconds.
+            totalexps (array): The stacking time of each target in seconds.
+            pauses (array): The wait after each target in seconds.
+            tz (datetime.tzinfo): The local timezone of wait_until items.
+            capacity (int): The rows to allocate at first, grown as needed.
+        """
+        self.names = np.asarray(names)
+        self.ras = np.asarray(ras)
+        self.decs = np.asarray(decs)
+        self.exptimes = np.asarray(exptimes)
+        self.totalexps = np.asarray(totalexps)
+        self.pauses = np.asarray(pauses)
+        self.tz = tz
+        self.rows = np.zeros(capacity, dtype=ITEM_DTYPE)
+        self.count = 0
+        self.columns = None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def items(self):
+        """The filled rows."""
+        return self.rows[: self.count]
+
+    def append(self, action, target=-1, start=np.nan):
+        if self.count == len(self.rows):
+            self.rows = np.resize(self.rows, max(2 * len(self.rows), 16))
+        self.rows[self.count] = (ACTION_CODES[action], target, start)
+        self.count += 1
+
+    def export_columns(self):
+        """The target columns as lists of the ints, floats and strings json writes."""
+        if self.columns is None:
+            self.columns = {
+                "names": self.names.tolist(),
+                "ras": self.ras.tolist(),
+                "decs": self.decs.tolist(),
+                "exptimes": self.exptimes.tolist(),
+                "totalexps": self.totalexps.tolist(),
+                "pauses": self.pauses.tolist(),
+            }
+        return self.columns
+
+    def add_target(self, target, start):
+        """Add the set exposure, mosaic and pause items of a target."""
+        self.append("action_set_exposure", target, start)
+        self.append("start_mosaic", target, start)
+        if self.pauses[target] > 0:
+            self.append("wait_for", target, start + float(self.totalexps[target]))
+
+    def item_dict(self, row, item_id):
+        """
+        The schedule.json item of a row.
+        Args:
+            row: A row of items, or the same row as a tuple from items.tolist().
+            item_id (str): The schedule_item_id of the item.
+        """
+        action = ACTIONS[row[0]]
+        target = row[1]
+        columns = self.export_columns()
+        item = {"action": action, "params": {}}
+        params = item["params"]
+        if action == "wait_until":
+            start = datetime.datetime.fromtimestamp(row[2], self.tz)
+            params["local_time"] = start.strftime("%H:%M")
+        elif action == "start_up_sequence":
+            params["auto_focus"] = True
+            params["dark_frames"] = True
+            params["3ppa"] = True
+            params["raise_arm"] = True
+        elif action == "action_set_exposure":
+            params["exp"] = columns["exptimes"][target] * 1000  # ms
+        elif action == "start_mosaic":
+            params["target_name"] = columns["names"][target]
+            params["is_j2000"] = True
+            params["ra"] = columns["ras"][target]
+            params["dec"] = columns["decs"][target]
+            params["is_use_lp_filter"] = False
+            params["panel_time_sec"] = columns["totalexps"][target]
+            params["ra_num"] = 1
+            params["dec_num"] = 1
+            params["panel_overlap_percent"] = 100
+            params["selected_panels"] = ""
+            params["gain"] = GAIN
+            params["is_use_autofocus"] = False
+            params["num_tries"] = 3
+            params["retry_wait_s"] = 10
+        elif action == "wait_for":
+            params["timer_sec"] = columns["pauses"][target]
+        item["schedule_item_id"] = item_id
+        return item
+
+    def write_json(self, f, compact=False, schedule_id=None, item_ids=None):
+        """
+        Stream the schedule as schedule.json text.
+        Args:
+            f: The text file to write to.
+            compact (bool): Leave out the indentation and spaces.
+            schedule_id (str): The schedule id, a new uuid1 if None.
+            item_ids (iterable): The id of each item, a new uuid1 each if None.
+        """
+        if schedule_id is None:
+            schedule_id = str(uuid.uuid1())
+        if item_ids is None:
+            item_ids = (str(uuid.uuid1()) for _ in range(self.count))
+        if compact:
+            dumps = json.JSONEncoder(separators=(",", ":")).encode
+            newline, indent, colon = "", "", ":"
+        else:
+            dumps = json.JSONEncoder(indent=4).encode
+            newline, indent, colon = "\n", "    ", ": "
+
+        def field(key, value, last=False):
+            f.write(f"{newline}{indent}{json.dumps(key)}{colon}{dumps(value)}")
+            f.write("" if last else ",")
+
+        f.write("{")
+        field("version", 1.0)
+        field("Event", "Scheduler")
+        field("schedule_id", schedule_id)
+        f.write(f"{newline}{indent}{json.dumps('list')}{colon}[")
+        item_indent = newline + indent * 2
+        for i, (row, item_id) in enumerate(zip(self.items.tolist(), item_ids)):
+            text = dumps(self.item_dict(row, item_id))
+            f.write(item_indent + text.replace("\n", item_indent))
+            if i < self.count - 1:
+                f.write(",")
+        if self.count:
+            f.write(f"{newline}{indent}")
+        f.write("],")
+        field("state", "stopped")
+        field("is_stacking_paused", False)
+        field("is_stacking", False)
+        field("is_skip_requested", False)
+        field("current_item_id", "")
+        field("item_number", 0, last=True)
+        f.write(newline + "}")
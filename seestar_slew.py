@@ -0,0 +1,272 @@
+"""Slew times between targets and target orders that keep them short.
+
+The S50 moves both axes at once, so a goto takes a fixed overhead (start,
+plate solve and centring) plus a time that grows with the angle between the
+two targets. SlewModel holds that line, by default a rough one for the S50,
+or fitted to the goto spans seestar_run writes to seestar_timing.jsonl.
+
+order_targets() orders a target list by nearest neighbour on the sphere and
+then improves the order with 2-opt, reversing any stretch of the path that
+makes it shorter. Angles come from the dot products of unit vectors, so a
+whole row of separations is one NumPy step.
+
+Usage:
+    model = load_model()                   # fitted if there are enough gotos
+    order = order_targets(ra_deg, dec_deg)
+    model(separation(ra1, dec1, ra2, dec2))
+"""
+
+import os
+
+import numpy as np
+
+import seestar_timing
+
+GOTO_OVERHEAD = 20.0  # seconds of every goto, however short
+SLEW_RATE = 3.0  # degrees per second
+MIN_SAMPLES = 5  # gotos needed before the model is fitted
+
+
+def unit_vectors(ra, dec, dtype=np.float64):
+    """
+    Args:
+        ra (array): Right ascensions in degrees.
+        dec (array): Declinations in degrees.
+    Returns:
+        numpy.ndarray: An (n, 3) array of the unit vectors of the positions.
+    """
+    ra = np.radians(np.asarray(ra, dtype=float))
+    dec = np.radians(np.asarray(dec, dtype=float))
+    return np.stack(
+        [np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)], axis=-1
+    ).astype(dtype)
+
+
+def separation(ra1, dec1, ra2, dec2):
+    """The angles between positions in degrees, broadcasting like NumPy."""
+    a = unit_vectors(ra1, dec1)
+    b = unit_vectors(ra2, dec2)
+    # atan2 of the cross and dot products stays accurate for small angles
+    cross = np.linalg.norm(np.cross(a, b), axis=-1)
+    dot = np.sum(a * b, axis=-1)
+    return np.degrees(np.arctan2(cross, dot))
+
+
+def separation_matrix(ra, dec):
+    """
+    The angle between every pair of targets, in float32 to halve the memory
+    of large lists (100 MB for 5000 targets).
+    Returns:
+        numpy.ndarray: An (n, n) array in degrees.
+    """
+    v = unit_vectors(ra, dec, np.float32)
+    return np.degrees(np.arccos(np.clip(v @ v.T, -1, 1)))
+
+
+class SlewModel:
+    """The time of a goto as an overhead plus the angle over a slew rate."""
+
+    def __init__(self, overhead=GOTO_OVERHEAD, rate=SLEW_RATE):
+        """
+        Args:
+            overhead (float): The seconds of every goto.
+            rate (float): The degrees slewed per second.
+        """
+        self.overhead = overhead
+        self.rate = rate
+
+    def __call__(self, angle):
+        """The seconds to slew through an angle in degrees, or an array of them."""
+        return self.overhead + np.asarray(angle, dtype=float) / self.rate
+
+    def __repr__(self):
+        return f"SlewModel(overhead={self.overhead:.1f}, rate={self.rate:.2f})"
+
+    @classmethod
+    def fit(cls, angles, durations):
+        """
+        Fit the model to measured gotos by least squares.
+        Args:
+            angles (array): The angle of each goto in degrees.
+            durations (array): The seconds each goto took.
+        Raises:
+            ValueError: Fewer than two different angles to fit a line through.
+        """
+        angles = np.asarray(angles, dtype=float)
+        durations = np.asarray(durations, dtype=float)
+        if len(np.unique(angles)) < 2:
+            raise ValueError("At least two different slew angles are needed")
+        slope, intercept = np.polyfit(angles, durations, 1)
+        # a flat or falling line means the angle did not matter
+        rate = 1 / slope if slope > 0 else np.inf
+        return cls(max(float(intercept), 0.0), float(rate))
+
+
+def goto_samples(spans):
+    """
+    The angle and duration of each successful goto that followed another on
+    the same unit, from timing spans.
+    Args:
+        spans (list): The spans, as written by seestar_timing.TimingRecorder,
+            with the RA and Dec of each goto in degrees.
+    Returns:
+        tuple: Arrays of the angles in degrees and the durations in seconds.
+    """
+    gotos = sorted(
+        (span for span in spans if span["span"] == "goto" and "ra" in span),
+        key=lambda span: span["start"],
+    )
+    last = {}
+    angles = []
+    durations = []
+    for span in gotos:
+        unit = span.get("unit")
+        if span["status"] != "ok":
+            # the mount may have stopped anywhere, start over from the next goto
+            last.pop(unit, None)
+            continue
+        position = (span["ra"], span["dec"])
+        if unit in last:
+            angles.append(float(separation(*last[unit], *position)))
+            durations.append(span["duration"])
+        last[unit] = position
+    return np.array(angles), np.array(durations)
+
+
+def load_model(path=seestar_timing.TIMING_FILE, min_samples=MIN_SAMPLES):
+    """
+    The slew model fitted to the gotos of a timing file, or the default one
+    when the file is missing or holds too few gotos to fit.
+    """
+    if path is None or not os.path.exists(path):
+        return SlewModel()
+    angles, durations = goto_samples(seestar_timing.read_spans(path))
+    if len(angles) < min_samples:
+        return SlewModel()
+    try:
+        return SlewModel.fit(angles, durations)
+    except ValueError:
+        return SlewModel()
+
+
+def path_length(order, cost):
+    """The total cost of visiting the targets in order, e.g. the degrees slewed."""
+    order = np.asarray(order)
+    return float(cost[order[:-1], order[1:]].sum())
+
+
+def nearest_neighbour(cost, start=0):
+    """
+    Args:
+        cost (numpy.ndarray): The (n, n) cost of going from each target to each other.
+        start (int): The first target.
+    Returns:
+        numpy.ndarray: The order that always goes to the nearest target not yet visited.
+    """
+    count = len(cost)
+    visited = np.zeros(count, dtype=bool)
+    order = np.empty(count, dtype=int)
+    current = start
+    for k in range(count):
+        order[k] = current
+        visited[current] = True
+        if k + 1 < count:
+            row = np.where(visited, np.inf, cost[current])
+            current = int(np.argmin(row))
+    return order
+
+
+def two_opt(order, cost, max_passes=50):
+    """
+    Shorten an open path by reversing stretches of it, keeping the first
+    target first. For each edge the best reversal is found in one NumPy step.
+    Args:
+        order (array): The path to improve.
+        cost (numpy.ndarray): The (n, n) symmetric cost between targets.
+        max_passes (int): Passes over the path before giving up on converging.
+    Returns:
+        numpy.ndarray: The improved path.
+    """
+    order = np.array(order, dtype=int)
+    count = len(order)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(count - 2):
+            # replace the edges (a, b) and (c, d) with (a, c) and (b, d),
+            # where d is past the end of the path for the last c
+            a, b = order[i], order[i + 1]
+            c = order[i + 2 :]
+            d = order[i + 3 :]
+            old = cost[a, b] + np.append(cost[c[:-1], d], 0)
+            new = cost[a, c] + np.append(cost[b, d], 0)
+            gain = old - new
+            j = int(np.argmax(gain))
+            if gain[j] > 1e-6:
+                order[i + 1 : i + 3 + j] = order[i + 1 : i + 3 + j][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+def order_targets(ra, dec, start=0, max_passes=50):
+    """
+    A short slewing order of a target list, ignoring when the targets are up.
+    Args:
+        ra (array): The right ascensions in degrees.
+        dec (array): The declinations in degrees.
+        start (int): The target to start from.
+        max_passes (int): The most 2-opt passes.
+    Returns:
+        numpy.ndarray: The target indices in observing order.
+    """
+    if len(ra) < 3:
+        return np.arange(len(ra))
+    # the overhead of every goto is the same whatever the order, so the
+    # shortest path in degrees is also the quickest
+    angles = separation_matrix(ra, dec)
+    return two_opt(nearest_neighbour(angles, start), angles, max_passes)
+
+
+def plan_slews(plan, ra, dec, model=None):
+    """
+    The predicted slew before each observation of a plan, none before the first.
+    Args:
+        plan (list): The (target index, start unix time) of each observation.
+        ra (array): The right ascensions of the targets in degrees.
+        dec (array): The declinations of the targets in degrees.
+        model (SlewModel): The slew model, the default one if None.
+    Returns:
+        numpy.ndarray: The seconds of each slew.
+    """
+    model = SlewModel() if model is None else model
+    targets = np.array([target for target, _ in plan], dtype=int)
+    slews = np.zeros(len(targets))
+    if len(targets) < 2:
+        return slews
+    ra = np.asarray(ra, dtype=float)
+    dec = np.asarray(dec, dtype=float)
+    angles = separation(
+        ra[targets[:-1]], dec[targets[:-1]], ra[targets[1:]], dec[targets[1:]]
+    )
+    slews[1:] = model(angles)
+    return slews
+
+
+def plan_slew_time(plan, ra, dec, model=None):
+    """The predicted seconds spent slewing between the observations of a plan."""
+    return float(plan_slews(plan, ra, dec, model).sum())
+
+
+def manifest_order(plan):
+    """
+    The observations of a plan taken in manifest order instead: every
+    target's first visit in file order, then every second visit and so on.
+    """
+    visits = {}
+    keys = []
+    for target, start in plan:
+        visit = visits.get(target, 0)
+        visits[target] = visit + 1
+        keys.append((visit, target, start))
+    return [(target, start) for _, target, start in sorted(keys)]
@@ -0,0 +1,158 @@
+"""Cold-start time of the entry points and where it goes.
+
+Each measurement runs a fresh interpreter, as the Docker container, a Pi or
+a per-target seestar_run.py subprocess would, so nothing is cached between
+runs except what the operating system keeps.
+
+Usage:
+    python seestar_schedule.py --startup-profile
+    python seestar_startup.py --record     # write startup_budget.json
+    python seestar_startup.py              # exit 1 if an entry point is over budget,
+                                           # skipped if no budget has been recorded
+
+The budget file holds the cold start of each entry point measured on this
+machine times a margin, so it is recorded where the tools run rather than
+shipped with them.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = ("seestar_run", "seestar_schedule", "seestar_varstar")
+BUDGET_FILE = "startup_budget.json"
+BUDGET_MARGIN = 1.5
+# the entry points are imported from here, wherever the tools are run from
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def cold_start(module, runs=5):
+    """
+    The best wall time of starting a fresh interpreter and importing a module.
+    Args:
+        module (str): The module name, e.g. "seestar_schedule".
+        runs (int): The interpreters to start.
+    Returns:
+        float: The seconds of the fastest run.
+    """
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"import {module}"], cwd=HERE, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def import_times(module):
+    """
+    The import and initialization time of every module a cold import loads.
+    Args:
+        module (str): The module name.
+    Returns:
+        list: (name, self seconds, cumulative seconds) per module, in load order.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        times.append((name.strip(), int(own) / 1e6, int(cumulative) / 1e6))
+    return times
+
+
+def report(module, top=15):
+    """
+    Print the cold-start time of an entry point and its slowest imports.
+    Args:
+        module (str): The module name.
+        top (int): The number of modules to list.
+    """
+    interpreter = cold_start("sys")
+    total = cold_start(module)
+    times = import_times(module)
+    print(f"Startup profile of {module}")
+    print(f"  cold start        {total * 1000:8.1f} ms")
+    print(f"  interpreter       {interpreter * 1000:8.1f} ms")
+    print(f"  imports and init  {(total - interpreter) * 1000:8.1f} ms")
+    print(f"  {'module':40s} {'self ms':>9s} {'total ms':>9s}")
+    for name, own, cumulative in sorted(times, key=lambda t: -t[2])[:top]:
+        print(f"  {name:40s} {own * 1000:9.1f} {cumulative * 1000:9.1f}")
+
+
+def profile_requested(module):
+    """
+    Report the startup profile and exit if --startup-profile was given, before
+    the entry point parses the rest of its arguments.
+    """
+    if "--startup-profile" in sys.argv[1:]:
+        report(module)
+        sys.exit(0)
+
+
+def record_budget(path=BUDGET_FILE, modules=ENTRY_POINTS, margin=BUDGET_MARGIN):
+    """Measure the entry points and write their budgets."""
+    budget = {module: cold_start(module) * margin for module in modules}
+    with open(path, "w") as f:
+        json.dump(budget, f, indent=4)
+    return budget
+
+
+def check_budget(path=BUDGET_FILE):
+    """
+    Compare the cold start of each entry point with its recorded budget.
+    Returns:
+        list: The entry points over budget.
+    """
+    with open(path) as f:
+        budget = json.load(f)
+    over = []
+    for module, limit in budget.items():
+        elapsed = cold_start(module)
+        state = "ok"
+        if elapsed > limit:
+            over.append(module)
+            state = "OVER BUDGET"
+        print(
+            f"  {module:20s} {elapsed * 1000:8.1f} ms, budget {limit * 1000:8.1f} ms {state}"
+        )
+    return over
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seestar Startup Budget")
+    parser.add_argument(
+        "--budget", type=str, default=BUDGET_FILE, help="The budget file"
+    )
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help=f"Record the budgets as {BUDGET_MARGIN} times the current cold starts",
+    )
+    parser.add_argument(
+        "--profile", type=str, choices=ENTRY_POINTS, help="Profile one entry point"
+    )
+    args = parser.parse_args()
+    if args.profile:
+        report(args.profile)
+    elif args.record:
+        for module, limit in record_budget(args.budget).items():
+            print(f"  {module:20s} budget {limit * 1000:8.1f} ms")
+        print(f"Budgets written to {args.budget}")
+    elif not os.path.exists(args.budget):
+        # budgets are per machine, so a fresh checkout has none to check yet
+        print(
+            f"No budget recorded in {args.budget}, skipping the check. "
+            "Run make startup-record (python seestar_startup.py --record) first."
+        )
+    elif check_budget(args.budget):
+        sys.exit(1)
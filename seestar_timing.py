@@ -0,0 +1,250 @@
+"""Timing spans of each observing phase, written as JSON lines.
+
+Every phase of a target (goto, settle, stack) and of a session (run_target,
+waits) is timed as a span and appended to seestar_timing.jsonl as one JSON
+object per line:
+
+    {"span": "goto", "target": "M42", "start": 1781234567.1, "end": ...,
+     "duration": 41.2, "status": "ok"}
+
+A stack span also carries the requested session_time. night_summary() turns
+the spans of a night into goto, settle, stack, wait and overhead totals and the
+open-shutter efficiency: stacking time over the wall time from the first to
+the last span, times the number of units when a fleet wrote them. The summary can also be written as a Prometheus text file
+for a node exporter textfile collector.
+
+Usage:
+    timing = TimingRecorder()
+    with timing.span("goto", target="M42"):
+        ...
+    python seestar_timing.py seestar_timing.jsonl --prometheus seestar.prom
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+
+TIMING_FILE = "seestar_timing.jsonl"
+# waiting for a target to rise is not counted as overhead
+PHASES = ("goto", "settle", "stack", "wait")
+
+
+class TimingRecorder:
+    """Time spans and append them to a JSON lines file."""
+
+    def __init__(self, path=TIMING_FILE, **fields):
+        """
+        Args:
+            path (str): The JSON lines file, None to keep the spans in memory only.
+            fields: Added to every span, e.g. unit="S50-1".
+        """
+        self.path = path
+        self.fields = fields
+        self.lock = threading.Lock()
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, name, **fields):
+        """
+        Time the body of a with statement as a span.
+        Args:
+            name (str): The phase, e.g. "goto".
+            fields: Extra fields of the span, e.g. target="M42".
+        Yields:
+            dict: The span, to add fields to before it is written. A status
+                set on it is kept, even when the body raises.
+        """
+        span = {"span": name, **self.fields, **fields, "start": time.time()}
+        t0 = time.perf_counter()
+        try:
+            yield span
+            span.setdefault("status", "ok")
+        except BaseException as e:
+            span.setdefault("status", "error")
+            span["error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            span["duration"] = time.perf_counter() - t0
+            span["end"] = span["start"] + span["duration"]
+            self.write(span)
+
+    def write(self, span):
+        with self.lock:
+            self.spans.append(span)
+            if self.path is not None:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(span) + "\n")
+
+
+def read_spans(path=TIMING_FILE):
+    """The spans of a JSON lines file, skipping any torn last line."""
+    spans = []
+    with open(path) as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue
+    return spans
+
+
+def night_of_span(span):
+    """The local date of the evening a span belongs to, nights run noon to noon."""
+    return datetime.date.fromtimestamp(span["start"] - 12 * 3600)
+
+
+def night_summary(spans):
+    """
+    Sum up the spans of one night.
+    Args:
+        spans (list): The spans, as written by TimingRecorder.
+    Returns:
+        dict: The wall time of the night, the units that observed, the
+            seconds in each phase and in the overhead between them, the
+            requested and actual stacking time, the targets observed and
+            failed, and the open-shutter efficiency.
+    """
+    if not spans:
+        return {}
+    start = min(span["start"] for span in spans)
+    end = max(span["end"] for span in spans)
+    # the units of a fleet run their phases at the same time
+    units = len({span["unit"] for span in spans if "unit" in span}) or 1
+    phases = {phase: 0.0 for phase in PHASES}
+    requested = 0.0
+    for span in spans:
+        if span["span"] in phases:
+            phases[span["span"]] += span["duration"]
+        if span["span"] == "stack":
+            requested += span.get("requested", 0.0)
+    targets = [span for span in spans if span["span"] == "target"]
+    observed = sum(span["status"] == "ok" for span in targets)
+    wall = end - start
+    unit_wall = units * wall
+    return {
+        "start": start,
+        "end": end,
+        "wall_s": wall,
+        "units": units,
+        **{f"{phase}_s": seconds for phase, seconds in phases.items()},
+        "overhead_s": unit_wall - sum(phases.values()),
+        "requested_stack_s": requested,
+        "targets_observed": observed,
+        "targets_failed": len(targets) - observed,
+        "efficiency": phases["stack"] / unit_wall if wall > 0 else 0.0,
+    }
+
+
+def format_summary(night, summary):
+    """The summary of a night as log lines."""
+    units = summary.get("units", 1)
+    lines = [
+        f"Night of {night}: {summary['targets_observed']} targets observed, "
+        f"{summary['targets_failed']} failed, {summary['wall_s'] / 3600:.2f} h"
+        + (f" on {units} units" if units > 1 else ""),
+    ]
+    unit_wall = units * summary["wall_s"]
+    for phase in PHASES + ("overhead",):
+        seconds = summary[f"{phase}_s"]
+        share = seconds / unit_wall if unit_wall > 0 else 0.0
+        lines.append(f"  {phase:9s} {seconds / 60:8.1f} min {share:6.1%}")
+    lines.append(
+        f"  stacked {summary['stack_s'] / 60:.1f} min of "
+        f"{summary['requested_stack_s'] / 60:.1f} min requested, "
+        f"open-shutter efficiency {summary['efficiency']:.1%}"
+    )
+    return "\n".join(lines)
+
+
+def write_prometheus(summary, path, night=None):
+    """
+    Write a night summary in the Prometheus text format, replacing the file
+    in one step so a collector never reads half of it.
+    """
+    labels = f'{{night="{night}"}}' if night is not None else ""
+    lines = []
+    for name, help_text, value in (
+        ("seestar_night_seconds", "Wall time of the night", summary["wall_s"]),
+        (
+            "seestar_open_shutter_seconds",
+            "Time spent stacking",
+            summary["stack_s"],
+        ),
+        (
+            "seestar_requested_stack_seconds",
+            "Stacking time requested",
+            summary["requested_stack_s"],
+        ),
+        (
+            "seestar_open_shutter_efficiency",
+            "Stacking time over wall time of every unit",
+            summary["efficiency"],
+        ),
+        (
+            "seestar_targets_observed",
+            "Targets observed",
+            summary["targets_observed"],
+        ),
+        ("seestar_targets_failed", "Targets failed", summary["targets_failed"]),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name}{labels} {value}")
+    lines.append("# HELP seestar_phase_seconds Time spent in each phase")
+    lines.append("# TYPE seestar_phase_seconds gauge")
+    for phase in PHASES + ("overhead",):
+        phase_labels = f'phase="{phase}"'
+        if night is not None:
+            phase_labels = f'night="{night}",{phase_labels}'
+        lines.append(f"seestar_phase_seconds{{{phase_labels}}} {summary[phase + '_s']}")
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(temp_path, path)
+
+
+def summarize_file(path=TIMING_FILE, night=None, prometheus=None):
+    """
+    Print the summary of each night in a timing file, or of one night.
+    Args:
+        path (str): The JSON lines file.
+        night (datetime.date): Only this night, the last one if prometheus is set.
+        prometheus (str): Also write the summary of the night to this file.
+    Returns:
+        dict: The summary of each night, by date.
+    """
+    nights = {}
+    for span in read_spans(path):
+        nights.setdefault(night_of_span(span), []).append(span)
+    if night is None and prometheus is not None and nights:
+        night = max(nights)
+    summaries = {}
+    for date in sorted(nights):
+        if night is not None and date != night:
+            continue
+        summaries[date] = night_summary(nights[date])
+        print(format_summary(date, summaries[date]))
+    if prometheus is not None and night in summaries:
+        write_prometheus(summaries[night], prometheus, night)
+    return summaries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seestar Timing Summary")
+    parser.add_argument(
+        "timing_file", type=str, nargs="?", default=TIMING_FILE, help="The spans"
+    )
+    parser.add_argument(
+        "--night",
+        type=datetime.date.fromisoformat,
+        help="The local date of the evening, YYYY-MM-DD",
+    )
+    parser.add_argument(
+        "--prometheus", type=str, help="Write the night as a Prometheus text file"
+    )
+    args = parser.parse_args()
+    summarize_file(args.timing_file, args.night, args.prometheus)
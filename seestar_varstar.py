@@ -1,24 +1,48 @@
 import os
 import subprocess
 import numpy as np
-import pandas as pd
 import seestar_varstar_params as sp
 import logging
 import argparse
-from astropy.coordinates import SkyCoord
-from astropy import units as u
-from astroquery.simbad import Simbad
+import functools
 import datetime
 from datetime import timezone
-import ephem
 import time
 import pytz
-import requests
+import seestar_run
+import seestar_ephemeris
+import seestar_fleet
+import seestar_frames
+import seestar_manifest
+import seestar_planner
+import seestar_resolver
+import seestar_slew
+import seestar_startup
+import seestar_timing
+import seestar_visibility
 
 global logger
 global test
 global testvarstar
 
+# the long-lived SeeStar session shared by all targets of a run
+session = None
+use_subprocess = False
+# run the targets on all the units of seestar_varstar_params.fleet
+use_fleet = False
+# only use the local SIMBAD cache, e.g. at a dark site without a network
+offline = False
+# the engine that plans the rest of the night before each target
+solver = "greedy"
+# the goto, settle, stack and wait spans of the run, and the Prometheus text
+# file the night summary is written to if --metrics was given
+timing = seestar_timing.TimingRecorder()
+metrics = None
+# copies the subs of each target in the background while the next is observed
+retriever = None
+# measures the copied subs and extends the light curve of each target
+photometry = None
+
 
 def logger():
     # Create a logger
@@ -51,29 +75,16 @@ def determine_twilight():
     """
     # Get the current time using utc tz
     now = datetime.datetime.now(tz=pytz.utc)
-    # Get the astronomical twilight start and end times
-    # use pyEphem to calculate the astronomical twilight times
-    # for the current date and location
-    # Get the astronomical twilight start and end times
-    obs = ephem.Observer()
-    latitude = sp.Latitude
-    longitude = sp.Longitude
-    obs.lat = str(latitude)
-    obs.lon = str(longitude)
-    obs.elev = sp.Elevation
-    # specify the date as today in utc
-    obs.date = now.strftime("%Y-%m-%d")
-    # use the sun object to calculate the twilight times
-    sun = ephem.Sun()
-    obs.horizon = "-18"
-    start = obs.next_rising(sun, use_center=True).datetime()
-    end = obs.next_setting(sun, use_center=True).datetime()
-    logger.debug(f"Current UTC: {now}")
+    # look up tonight's astronomical twilight in the site ephemeris table,
+    # which computes it with pyEphem the first time only
+    table = seestar_ephemeris.EphemerisTable(sp.Latitude, sp.Longitude, sp.Elevation)
+    night = seestar_ephemeris.night_of(now, table.longitude)
     local_tz = pytz.timezone(sp.tz)
-    sunrise_local = start.replace(tzinfo=pytz.utc).astimezone(local_tz)
-    sunset_local = end.replace(tzinfo=pytz.utc).astimezone(local_tz)
-    sunrise_utc = start.replace(tzinfo=pytz.utc).astimezone(pytz.utc)
-    sunset_utc = end.replace(tzinfo=pytz.utc).astimezone(pytz.utc)
+    sunset_local, sunrise_local = table.twilight(night, "astronomical", local_tz)
+    table.close()
+    logger.debug(f"Current UTC: {now}")
+    sunrise_utc = sunrise_local.astimezone(pytz.utc)
+    sunset_utc = sunset_local.astimezone(pytz.utc)
     logger.debug(f'Sunrise UTC: {sunrise_utc.strftime("%Y-%m-%d %H:%M:%S %Z")}')
     logger.debug(f'Sunset UTC: {sunset_utc.strftime("%Y-%m-%d %H:%M:%S %Z")}')
     logger.debug(f'Sunset: {sunset_local.strftime("%Y-%m-%d %H:%M:%S %Z")}')
@@ -81,18 +92,12 @@ def determine_twilight():
     return sunrise_local, sunset_local
 
 
-def seestar_run_runner(targetName, coords, exptime, totaltime):
-    global test
-    global testvarstar
-    # Get the path to the seestar_run.py script
-    if test and not testvarstar:
-        seestar_run_path = os.path.join(os.path.dirname(__file__), "seestar_emul.py")
-    else:
-        seestar_run_path = os.path.join(os.path.dirname(__file__), "seestar_run.py")
-    # Check if the seestar_run.py script exists
-    if not os.path.exists(seestar_run_path):
-        logger.error("seestar_run.py does not exist")
-        return 1
+def check_run_args(targetName, coords, exptime, totaltime):
+    """
+    Check the arguments of a target run.
+    Returns:
+        int: 0 if the arguments are valid, 1 if the arguments are invalid
+    """
     # Check if the targetName is a string
     if not isinstance(targetName, str):
         logger.error("targetName is not a string")
@@ -121,6 +126,23 @@ def seestar_run_runner(targetName, coords, exptime, totaltime):
     if not isinstance(totaltime, (int, float, np.float64)):
         logger.error(f"totaltime is not a number:  {totaltime}")
         return 1
+    return 0
+
+
+def seestar_run_runner(targetName, coords, exptime, totaltime):
+    global test
+    global testvarstar
+    # Get the path to the seestar_run.py script
+    if test and not testvarstar:
+        seestar_run_path = os.path.join(os.path.dirname(__file__), "seestar_emul.py")
+    else:
+        seestar_run_path = os.path.join(os.path.dirname(__file__), "seestar_run.py")
+    # Check if the seestar_run.py script exists
+    if not os.path.exists(seestar_run_path):
+        logger.error("seestar_run.py does not exist")
+        return 1
+    if check_run_args(targetName, coords, exptime, totaltime) != 0:
+        return 1
     # write to log file
     logger.info(f"Run {targetName} {coords} {exptime} {totaltime}")
     # Run the seestar_run.py script
@@ -133,6 +155,9 @@ def seestar_run_runner(targetName, coords, exptime, totaltime):
             str(coords[1]),
             str(exptime),
             str(totaltime),
+            # the SIMBAD coordinates are in degrees
+            "--ra-unit",
+            "degrees",
         ],
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
@@ -150,29 +175,300 @@ def seestar_run_runner(targetName, coords, exptime, totaltime):
     return 0
 
 
-def get_coord_object(target_names):
+def seestar_session_runner(targetName, coords, exptime, totaltime):
+    """
+    Run a target over the long-lived SeeStar session, opening it on first use.
+    Args:
+        targetName (str): The name of the target.
+        coords (list): The coordinates of the target.
+        exptime (int or float): The exposure time in seconds.
+        totaltime (int or float): The stacking time in seconds.
+    Returns:
+        int: 0 if the target was observed, 1 otherwise
+    """
+    global session
+    if check_run_args(targetName, coords, exptime, totaltime) != 0:
+        return 1
+    logger.info(f"Run {targetName} {coords} {exptime} {totaltime}")
+    try:
+        if test and not testvarstar:
+            import seestar_emul
+
+            seestar_emul.seestar_run_runner(
+                targetName, [float(c) for c in coords], exptime, totaltime
+            )
+            return 0
+        if session is None:
+            session = seestar_run.SeestarSession(timing=timing)
+            session.connect()
+        session.observe(
+            targetName,
+            float(coords[0]),
+            float(coords[1]),
+            exptime,
+            totaltime,
+            ra_unit="degrees",
+        )
+    except Exception as e:
+        logger.error(f"seestar session failed - {e}")
+        if isinstance(e, ConnectionError):
+            # the link stalled, start afresh on the next target
+            close_session()
+        if session is not None and session.s is None:
+            # the connection could not be made, try again on the next target
+            session = None
+        return 1
+    return 0
+
+
+def run_target(targetName, coords, exptime, totaltime):
+    """
+    Run a target with the in-process session, or with a seestar_run.py
+    subprocess when --subprocess was requested. The run_target span takes in
+    the subprocess start as well as the target span seestar_run.py writes.
+    """
+    with timing.span(
+        "run_target", target=str(targetName), subprocess=use_subprocess
+    ) as span:
+        if use_subprocess:
+            exit_status = seestar_run_runner(targetName, coords, exptime, totaltime)
+        else:
+            exit_status = seestar_session_runner(targetName, coords, exptime, totaltime)
+        if exit_status != 0:
+            span["status"] = "failed"
+    if exit_status == 0 and retriever is not None:
+        retriever.retrieve(str(targetName))
+    return exit_status
+
+
+def close_retriever():
+    """Wait for the last frames to be copied and log how the copying went."""
+    global retriever
+    if retriever is not None:
+        logger.info("Waiting for the last frames to be copied")
+        retriever.close()
+        logger.info(retriever.summary())
+        retriever = None
+    close_photometry()
+
+
+def close_photometry():
+    """Wait for the last subs to be measured."""
+    global photometry
+    if photometry is not None:
+        photometry.close()
+        logger.info(photometry.summary())
+        photometry = None
+
+
+def report_timing(since):
+    """
+    Log the timing summary of the spans written since the session started,
+    by this process and any seestar_run.py subprocess, and write it to the
+    --metrics file.
+    Args:
+        since (float): The start of the session, as a Unix time.
+    """
+    try:
+        spans = seestar_timing.read_spans(timing.path)
+    except OSError as e:
+        logger.warning(f"Unable to read the timing spans - {e}")
+        return
+    spans = [span for span in spans if span["start"] >= since]
+    if not spans:
+        return
+    summary = seestar_timing.night_summary(spans)
+    night = seestar_timing.night_of_span(spans[0])
+    for line in seestar_timing.format_summary(night, summary).splitlines():
+        logger.info(line)
+    if metrics is not None:
+        seestar_timing.write_prometheus(summary, metrics, night)
+
+
+def close_session():
+    """Close the long-lived SeeStar session if one was opened."""
+    global session
+    if session is not None:
+        session.close()
+        session = None
+
+
+def get_coord_object(target_names, resolver=None):
     """
-    Get the coordinates of the target names from the Simbad database.
+    Get the coordinates of the target names from the local SIMBAD cache,
+    asking the Simbad database once for any names that are not cached.
     Args:
         target_names (list): A list of target names.
+        resolver (SimbadResolver): The resolver to use, a default one if None.
     Returns:
         tuple: A tuple of two numpy arrays containing the right ascension and declination of the target names.
     """
     try:
-        result_table = Simbad.query_objects(target_names)
-        object_ra = result_table["RA"].data  # Right Ascension
-        object_dec = result_table["DEC"].data  # Declination
-        coord = SkyCoord(object_ra, object_dec, unit=(u.deg))
-    except:
-        logger.debug("Unable to get coordinates from Simbad with caps")
-        try:
-            object_ra = result_table["ra"].data  # Right Ascension
-            object_dec = result_table["dec"].data  # Declination
-            coord = SkyCoord(object_ra, object_dec, unit=(u.deg))
-        except Exception as e:
-            logger.error(f"Unable to get coordinates from Simbad - {e}")
-            raise RuntimeError("Unable to get coordinates from Simbad")
-    return coord.ra.deg, coord.dec.deg
+        if resolver is None:
+            resolver = seestar_resolver.SimbadResolver(offline=offline, logger=logger)
+        object_ra, object_dec = resolver.resolve(list(target_names))
+    except Exception as e:
+        logger.error(f"Unable to get coordinates from Simbad - {e}")
+        raise RuntimeError("Unable to get coordinates from Simbad")
+    unresolved = [name for name, ra in zip(target_names, object_ra) if np.isnan(ra)]
+    if unresolved:
+        logger.error(f"Unable to get coordinates from Simbad for {unresolved}")
+        raise RuntimeError("Unable to get coordinates from Simbad")
+    return object_ra, object_dec
+
+
+def fleet_session(sunrise):
+    """
+    Run the targets on every unit of the fleet at once, each target going to
+    whichever unit is free.
+    --test runs the list once whatever the time, as on a single unit; any
+    other run stops at sunrise and only hands out targets that are up.
+    Args:
+        sunrise (datetime.datetime): No target is started after this time.
+    """
+    grid = None
+    if not (test or testvarstar):
+        now = datetime.datetime.now(pytz.timezone(sp.tz))
+        grid = seestar_visibility.VisibilityGrid(
+            ras, decs, sp.Latitude, sp.Longitude, now, sunrise
+        )
+    dispatcher = seestar_fleet.FleetDispatcher(
+        seestar_fleet.fleet_units(sp),
+        logger,
+        deadline=None if test else sunrise,
+        repeat=repeat and not test,
+        grid=grid,
+    )
+    dispatcher.run(target_names, ras, decs, target_exptimes, target_stack_times)
+    dispatcher.write_results("seestar_fleet_results.jsonl")
+    logger.info("Session complete")
+    return 0
+
+
+def pause_after(i):
+    """Wait out the manifest Pause of a target after observing it."""
+    if target_pauses[i] > 0:
+        logger.info(f"Pausing {target_pauses[i]:.0f} s after {target_names[i]}")
+        with timing.span("wait", target=str(target_names[i])):
+            time.sleep(target_pauses[i])
+
+
+def replanned_session(sunrise):
+    """
+    Run the targets in the order of a plan that is made again before every
+    target, from the current time and the targets observed or failed so far,
+    so that targets that have set or no longer fit before sunrise are dropped.
+    Args:
+        sunrise (datetime.datetime): The end of the night.
+    """
+    now = datetime.datetime.now(pytz.timezone(sp.tz))
+    # the visibility of every target over the rest of the night, computed once
+    grid = seestar_visibility.VisibilityGrid(
+        ras, decs, sp.Latitude, sp.Longitude, now, sunrise
+    )
+    # the slew times fitted to the gotos of earlier nights, when there are enough
+    slew_model = seestar_slew.load_model(timing.path)
+    planner = solver
+    if solver == "slew":
+        logger.debug(f"Slew model: {slew_model}")
+        planner = functools.partial(seestar_planner.slew_plan, model=slew_model)
+    replanner = seestar_planner.Replanner(
+        grid, target_stack_times, target_pauses, repeat=repeat, solver=planner
+    )
+    observed = []
+    while True:
+        t0 = time.perf_counter()
+        plan = replanner.replan(time.time())
+        logger.debug(
+            f"Replanned {len(plan)} observations in {time.perf_counter() - t0:.3f} s"
+        )
+        if not plan:
+            break
+        i, start = plan[0]
+        wait = start - time.time()
+        if wait > 0:
+            logger.info(
+                f"Waiting {wait / 60:.0f} min for {target_names[i]} to rise high enough"
+            )
+            with timing.span("wait", target=str(target_names[i])):
+                time.sleep(min(wait, 300))
+            continue
+        exit_status = run_target(
+            target_names[i],
+            [ras[i], decs[i]],
+            target_exptimes[i],
+            target_stack_times[i],
+        )
+        logger.debug(f"Exit status for target {target_names[i]}: {exit_status}")
+        if exit_status != 0:
+            logger.error(f"Error running target {target_names[i]}")
+            replanner.failed(i)
+        else:
+            replanner.completed(i)
+            observed.append((i, time.time()))
+            pause_after(i)
+    slew_time = seestar_slew.plan_slew_time(observed, ras, decs, slew_model)
+    manifest_slew_time = seestar_slew.plan_slew_time(
+        seestar_slew.manifest_order(observed), ras, decs, slew_model
+    )
+    logger.info(
+        f"Predicted slew time {slew_time / 60:.1f} min, "
+        f"{(manifest_slew_time - slew_time) / 60:.1f} min less than in manifest order"
+    )
+    skipped = [str(target_names[i]) for i in np.flatnonzero(replanner.visits == 0)]
+    if skipped:
+        logger.warning(f"Targets not observed tonight: {skipped}")
+    logger.info("Session complete")
+    return 0
+
+
+def cadence_session(sunrise):
+    """
+    Run the targets in the order the cadence dispatcher picks them, each one
+    coming back once its revisit interval has passed and followed by its
+    pause, and log the achieved cadence of every target at the end.
+    Args:
+        sunrise (datetime.datetime): The end of the night.
+    """
+    now = datetime.datetime.now(pytz.timezone(sp.tz))
+    grid = seestar_visibility.VisibilityGrid(
+        ras, decs, sp.Latitude, sp.Longitude, now, sunrise
+    )
+    dispatcher = seestar_planner.CadenceDispatcher(
+        grid,
+        target_stack_times,
+        target_cadences if repeat else None,
+        target_priorities,
+        start=time.time(),
+    )
+    while True:
+        step = dispatcher.next(time.time())
+        if step is None:
+            break
+        i, start = step
+        if i is None:
+            wait = max(start - time.time(), 0)
+            logger.info(f"No target is up, waiting {wait / 60:.0f} min")
+            with timing.span("wait"):
+                time.sleep(wait)
+            continue
+        exit_status = run_target(
+            target_names[i],
+            [ras[i], decs[i]],
+            target_exptimes[i],
+            target_stack_times[i],
+        )
+        logger.debug(f"Exit status for target {target_names[i]}: {exit_status}")
+        if exit_status != 0:
+            logger.error(f"Error running target {target_names[i]}")
+            dispatcher.failed(i)
+        else:
+            dispatcher.completed(i, start)
+            pause_after(i)
+    for line in seestar_planner.format_cadence_report(dispatcher.report(target_names)):
+        logger.info(line)
+    logger.info("Session complete")
+    return 0
 
 
 def target_session():
@@ -211,28 +507,28 @@ def target_session():
             iamearly = False
     logger.info("Starting observations")
 
-    # Loop through the targets
-    for i in range(len(ras)):
-        # check the current time and see if it is in the twilight zone
-        now = datetime.datetime.now(pytz.timezone(sp.tz))
-        if now > sunrise and not test:
-            logger.error("Current time is too late to observe")
-            return 1
-        if repeat:
-            # Loop through the targets
-            for i in range(len(ras)):
-                exit_status = seestar_run_runner(
-                    target_names[i],
-                    [ras[i], decs[i]],
-                    target_exptimes[i],
-                    target_stack_times[i],
-                )
-                logger.debug(f"Exit status for target {target_names[i]}: {exit_status}")
-                if exit_status != 0:
-                    logger.error(f"Error running target {target_names[i]}")
-                    # raise RuntimeError('Error running target')
-        else:
-            exit_status = seestar_run_runner(
+    if use_fleet:
+        return fleet_session(sunrise)
+    if not (test or testvarstar):
+        if solver == "cadence":
+            return cadence_session(sunrise)
+        return replanned_session(sunrise)
+
+    # without a night to fill, --test runs the list once; --testvarstar
+    # cycles through it in repeat mode until sunrise
+    cycle = 0
+    while True:
+        for i in range(len(ras)):
+            # check the current time and see if it is in the twilight zone
+            now = datetime.datetime.now(pytz.timezone(sp.tz))
+            if now > sunrise and not test:
+                if cycle > 0:
+                    logger.info(f"Sunrise reached after {cycle} cycles")
+                    logger.info("Session complete")
+                    return 0
+                logger.error("Current time is too late to observe")
+                return 1
+            exit_status = run_target(
                 target_names[i],
                 [ras[i], decs[i]],
                 target_exptimes[i],
@@ -242,11 +538,15 @@ def target_session():
             if exit_status != 0:
                 logger.error(f"Error running target {target_names[i]}")
                 # raise RuntimeError('Error running target')
+        cycle += 1
+        if not repeat or test:
+            break
     logger.info("Session complete")
     return 0
 
 
 if __name__ == "__main__":
+    seestar_startup.profile_requested("seestar_varstar")
     logger = logger()
     # parse arguments from the command line with our own parser
     parser = argparse.ArgumentParser(description="Seestar Varstar")
@@ -262,23 +562,107 @@ if __name__ == "__main__":
     parser.add_argument(
         "--testvarstar", action="store_true", help="Run in test mode with the seestar"
     )
+    # fall back to one seestar_run.py subprocess per target
+    parser.add_argument(
+        "--subprocess",
+        action="store_true",
+        help="Run each target in its own seestar_run.py process",
+    )
+    parser.add_argument(
+        "--fleet",
+        action="store_true",
+        help="Share the targets between the units of the fleet configuration",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Resolve targets from the local SIMBAD cache only",
+    )
+    parser.add_argument(
+        "--solver",
+        type=str,
+        choices=sorted(seestar_planner.SOLVERS),
+        default=solver,
+        help="The engine that replans the rest of the night before each target",
+    )
+    parser.add_argument(
+        "--frames-source",
+        type=str,
+        default=getattr(sp, "frames_source", None),
+        help="Copy the subs of each target from this folder or URL while the next is observed",
+    )
+    parser.add_argument(
+        "--comparisons",
+        type=str,
+        default=getattr(sp, "comparisons_file", None),
+        help="Measure the copied subs against the comparison stars in this file",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        help="Write the timing summary of the night to this Prometheus text file",
+    )
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="Report the import and initialization time of each module and exit",
+    )
     args = parser.parse_args()
     targetList = args.schedule_file
     mode = args.mode
     test = args.test
     testvarstar = args.testvarstar
-    logger.info(f"Arguments: {targetList, mode, test, testvarstar}")
+    use_subprocess = args.subprocess
+    use_fleet = args.fleet
+    offline = args.offline
+    solver = args.solver
+    metrics = args.metrics
+    if args.frames_source and use_fleet:
+        logger.warning(
+            f"Not copying the subs from {args.frames_source}: the frames "
+            "retriever and photometry do not run with --fleet"
+        )
+    elif args.frames_source:
+        retriever = seestar_frames.FrameRetriever(
+            seestar_frames.make_source(args.frames_source),
+            getattr(sp, "frames_dir", "frames"),
+            bandwidth=getattr(sp, "frames_bandwidth", seestar_frames.DEFAULT_BANDWIDTH),
+            logger=logger,
+        )
+        if args.comparisons:
+            # astropy is only loaded when the subs are measured
+            import seestar_photometry
+
+            photometry = seestar_photometry.PhotometryPipeline(
+                seestar_photometry.read_comparisons(args.comparisons),
+                getattr(sp, "photometry_dir", seestar_photometry.LIGHTCURVE_DIR),
+                logger=logger,
+            )
+            retriever.on_frame = photometry.submit
+    logger.info(f"Arguments: {targetList, mode, test, testvarstar, use_subprocess}")
     # Get the schedule of targets
     try:
-        target_df = pd.read_csv(targetList)
-        target_df["TotalExp"] = target_df["TotalExp"].astype(float)
-        target_df["ExpTime"] = target_df["ExpTime"].astype(float)
+        manifest = seestar_manifest.read_manifest(targetList)
+        target_names = manifest.targets["Name"]
+        target_stack_times = manifest.targets["TotalExp"].astype(float)
+        target_exptimes = manifest.targets["ExpTime"].astype(float)
+        # the wait after each target, none when the list has no Pause column
+        target_pauses = np.zeros(len(target_names))
+        if "Pause" in manifest.targets:
+            target_pauses = np.maximum(manifest.targets["Pause"].astype(float), 0)
+        # the revisit interval in minutes and the priority of each target,
+        # for the cadence solver
+        target_cadences = None
+        if "Cadence" in manifest.targets:
+            target_cadences = seestar_planner.cadence_seconds(
+                manifest.targets["Cadence"]
+            )
+        target_priorities = None
+        if "Priority" in manifest.targets:
+            target_priorities = manifest.targets["Priority"].astype(float)
     except Exception as e:
         logger.error(f"Unable to load schedule - {e}")
         raise RuntimeError("Unable to load schedule")
-    target_names = target_df["Name"].values
-    target_stack_times = target_df["TotalExp"].values
-    target_exptimes = target_df["ExpTime"].values
 
     ras, decs = get_coord_object(target_names)
     # get the number of targets and change a str targets to equal 'target' if one target
@@ -300,7 +684,13 @@ if __name__ == "__main__":
         logger.info(f"{targetstr} ({len(ras)}) will be observed in order - mode {mode}")
         repeat = False
     # check the return value of the target_session function
-    exit_status = target_session()
+    session_start = time.time()
+    try:
+        exit_status = target_session()
+    finally:
+        close_session()
+        close_retriever()
+        report_timing(session_start)
     if exit_status != 0:
         logger.error("Error running target session")
         raise RuntimeError("Error running target session")
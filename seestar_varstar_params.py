@@ -5,3 +5,18 @@ Latitude = "-35:17:00.6"  # Your Seestar Latitude
 Longitude = "149:07:41.2"  # Your Seestar Longitude E is +ve
 Elevation = 500
 tz = "Australia/Sydney"  # Your ptz timezone
+# The units run side by side by seestar_varstar.py --fleet, one dict per unit
+fleet = [
+    {"name": "S50-1", "ip": ip, "port": port},
+    # {"name": "S50-2", "ip": "192.168.1.36", "port": 4700},
+]
+# Where seestar_varstar.py copies the subs of each target from while the next
+# one is observed, e.g. the unit's MyWorks share mounted at /mnt/seestar/MyWorks
+# or a seestar_frames.py server URL, None to leave them on the unit
+frames_source = None
+frames_dir = "frames"  # the local folder the <target>_sub folders go in
+frames_bandwidth = 1_000_000  # bytes per second, so the commands still get through
+# The comparison stars of each target, see seestar_photometry.py; the subs
+# copied from frames_source are then measured as they arrive
+comparisons_file = None
+photometry_dir = "photometry"  # the folder the <target>.csv light curves go in
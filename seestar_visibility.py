@@ -0,0 +1,144 @@
+"""Whole-night visibility of every target on a time grid.
+
+The altitude and azimuth of all targets are computed for every grid time
+between evening and morning twilight in one vectorised NumPy step, so the
+scheduler looks visibility up instead of building a pyephem observer per
+target per pass. Positions are J2000 without precession or refraction,
+which is well inside the grid step for horizon and 30 degree checks.
+
+Usage:
+    grid = VisibilityGrid(ra_deg, dec_deg, "-35:36:00", "149:01:45", dusk, dawn)
+    alt, az = grid.altaz(0, when)
+"""
+
+import copy
+import datetime
+
+import numpy as np
+
+DEFAULT_STEP = 300  # seconds between grid times
+
+
+def parse_sexagesimal(value):
+    """
+    Convert "dd:mm:ss" (or a plain number) to decimal degrees.
+    Args:
+        value (str or float): The angle, e.g. "-35:36:00.6".
+    Returns:
+        float: The angle in degrees.
+    """
+    if isinstance(value, (int, float, np.floating)):
+        return float(value)
+    value = str(value).strip()
+    sign = -1 if value.startswith("-") else 1
+    parts = [float(part) for part in value.lstrip("+-").split(":")]
+    degrees = sum(part / 60**i for i, part in enumerate(parts))
+    return sign * degrees
+
+
+def local_sidereal_time(unix_times, longitude):
+    """
+    Args:
+        unix_times (numpy.ndarray): UTC times in seconds since the epoch.
+        longitude (float): The site longitude in degrees, east positive.
+    Returns:
+        numpy.ndarray: The local sidereal time in degrees.
+    """
+    days = unix_times / 86400.0 + 2440587.5 - 2451545.0
+    gmst = 280.46061837 + 360.98564736629 * days
+    return np.mod(gmst + longitude, 360.0)
+
+
+def airmass(alt):
+    """The airmass at altitudes in degrees, inf below the horizon."""
+    alt = np.asarray(alt, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Pickering (2002), good down to the horizon
+        x = 1.0 / np.sin(np.radians(alt + 244.0 / (165.0 + 47.0 * alt**1.1)))
+    return np.where(alt > 0, x, np.inf)
+
+
+class VisibilityGrid:
+    """The altitude and azimuth of each target at each grid time of a night."""
+
+    def __init__(self, ra, dec, latitude, longitude, start, end, step=DEFAULT_STEP):
+        """
+        Args:
+            ra (array): The target right ascensions in degrees.
+            dec (array): The target declinations in degrees.
+            latitude (str or float): The site latitude.
+            longitude (str or float): The site longitude, east positive.
+            start (datetime.datetime): The first grid time, timezone aware.
+            end (datetime.datetime): The end of the night, timezone aware. The
+                last grid time is the first step at or after it.
+            step (float): The seconds between grid times.
+        """
+        self.start = start
+        self.end = end
+        # the grid runs up to a step past the end, nothing may finish after it
+        self.end_time = end.timestamp()
+        self.step = step
+        self.latitude = parse_sexagesimal(latitude)
+        self.longitude = parse_sexagesimal(longitude)
+        self.ra = np.asarray(ra, dtype=float)
+        self.dec = np.asarray(dec, dtype=float)
+        t0 = start.timestamp()
+        count = int(np.ceil((end.timestamp() - t0) / step)) + 1
+        self.times = t0 + step * np.arange(count)
+
+        ra = np.radians(np.asarray(ra, dtype=float))[:, None]
+        dec = np.radians(np.asarray(dec, dtype=float))[:, None]
+        lat = np.radians(self.latitude)
+        lst = np.radians(local_sidereal_time(self.times, self.longitude))[None, :]
+        hour_angle = lst - ra
+        sin_alt = np.sin(lat) * np.sin(dec) + np.cos(lat) * np.cos(dec) * np.cos(
+            hour_angle
+        )
+        # azimuth from north through east, as pyephem
+        az = np.arctan2(
+            -np.cos(dec) * np.sin(hour_angle),
+            np.sin(dec) * np.cos(lat) - np.cos(dec) * np.sin(lat) * np.cos(hour_angle),
+        )
+        self.alt = np.degrees(np.arcsin(np.clip(sin_alt, -1, 1))).astype(np.float32)
+        self.az = np.mod(np.degrees(az), 360).astype(np.float32)
+
+    @property
+    def airmass(self):
+        """The airmass of each target at each grid time."""
+        return airmass(self.alt)
+
+    def subset(self, targets):
+        """
+        The grid of some of the targets, sharing the times of this one.
+        Args:
+            targets (array): The indices of the targets to keep, in order.
+        """
+        grid = copy.copy(self)
+        grid.ra = self.ra[targets]
+        grid.dec = self.dec[targets]
+        grid.alt = self.alt[targets]
+        grid.az = self.az[targets]
+        return grid
+
+    def index(self, when):
+        """
+        The grid index nearest a time, clipped to the night.
+        Args:
+            when (datetime.datetime or float): An aware datetime or a unix time.
+        """
+        if isinstance(when, datetime.datetime):
+            when = when.timestamp()
+        i = int(round((when - self.times[0]) / self.step))
+        return min(max(i, 0), len(self.times) - 1)
+
+    def altaz(self, target, when):
+        """
+        Look up the altitude and azimuth of a target.
+        Args:
+            target (int): The target index.
+            when (datetime.datetime or float): An aware datetime or a unix time.
+        Returns:
+            tuple: The altitude and azimuth in degrees.
+        """
+        i = self.index(when)
+        return float(self.alt[target, i]), float(self.az[target, i])
@@ -0,0 +1,11 @@
+import pytest
+
+import seestar_run
+
+
+@pytest.fixture
+def fast_session(monkeypatch, tmp_path):
+    """No settle time and a fast reconnect backoff, writing into tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(seestar_run, "SETTLE_TIME", 0)
+    monkeypatch.setattr(seestar_run, "RECONNECT_BASE", 0.05)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import seestar_catalog
+
+RA, DEC = 325.68, 43.59
+ARCSEC = 1 / 3600
+# the name, offsets north and east in degrees, and magnitude of each star
+STARS = [
+    ("near_target", 10 * ARCSEC, 0, 11.0),
+    ("comp_1", 0.05, 0, 11.5),
+    ("too_bright", 0.06, 0, 8.0),
+    ("crowded", 0.07, 0, 11.0),
+    ("crowding", 0.07, 10 * ARCSEC, 12.0),
+    ("comp_2", -0.1, 0, 10.0),
+    ("faint_neighbour", -0.1, 10 * ARCSEC, 13.0),
+    ("too_faint", 0.12, 0, 14.0),
+    ("check", 0, 0.2, 12.5),
+    ("comp_3", 0, -0.25, 12.0),
+    ("outside", 0.5, 0, 11.0),
+]
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    source = tmp_path / "stars.csv"
+    lines = ["Name,RAJ2000,DEJ2000,Vmag,e_Vmag"]
+    for name, north, east, mag in STARS:
+        ra = RA + east / np.cos(np.radians(DEC))
+        lines.append(f"{name},{ra:.7f},{DEC + north:.7f},{mag},0.02")
+    # a star without a magnitude is left out
+    lines.append("no_mag,325.7,43.6,,")
+    source.write_text("\n".join(lines) + "\n")
+    directory = str(tmp_path / "catalog")
+    assert seestar_catalog.ingest(str(source), directory) == len(STARS)
+    return seestar_catalog.StarCatalog(directory)
+
+
+def test_cone_nearest_first(catalog):
+    names = catalog.names(catalog.cone(RA, DEC, radius=0.3))
+    assert names[:3] == ["near_target", "comp_1", "too_bright"]
+    assert "outside" not in names and len(names) == len(STARS) - 1
+    (cone,) = catalog.cones([RA], [DEC], radius=0.3)
+    assert sorted(catalog.names(cone)) == sorted(names)
+
+
+def test_select_comparisons(catalog):
+    comps, check = seestar_catalog.select_comparisons(catalog, RA, DEC, count=2)
+    assert catalog.names(comps) == ["comp_1", "comp_2"]
+    assert catalog.names([check]) == ["check"]
+    comps, check = seestar_catalog.select_comparisons(catalog, RA, DEC, count=5)
+    # too near the target, outside the magnitude range or with a bright
+    # neighbour, none of the others are used
+    assert catalog.names(comps) == ["comp_1", "comp_2", "check", "comp_3"]
+    assert check is None
+
+
+def test_sexagesimal_and_missing_columns(tmp_path):
+    source = tmp_path / "stars.csv"
+    source.write_text("star,ra,dec,mag\nA,21:42:42.8,+43:35:09.9,11.0\n")
+    directory = str(tmp_path / "catalog")
+    seestar_catalog.ingest(str(source), directory)
+    catalog = seestar_catalog.StarCatalog(directory)
+    assert catalog.ra[0] == pytest.approx(325.678, abs=0.001)
+    assert np.isnan(catalog.mag_err[0])
+    source.write_text("star,ra,dec\nA,1,2\n")
+    with pytest.raises(ValueError):
+        seestar_catalog.ingest(str(source), directory)
@@ -0,0 +1,84 @@
+import datetime
+
+import ephem
+import pytest
+
+import seestar_ephemeris
+import seestar_visibility
+
+LATITUDE = "-35:36:00"
+LONGITUDE = "149:01:45"
+NIGHT = datetime.date(2026, 6, 1)
+
+
+@pytest.fixture
+def table_file(tmp_path):
+    return str(tmp_path / "ephemeris.db")
+
+
+def test_twilight_matches_pyephem(table_file):
+    table = seestar_ephemeris.EphemerisTable(
+        LATITUDE, LONGITUDE, table_file=table_file, prefetch=3
+    )
+    dusk, dawn = table.twilight(NIGHT, "nautical")
+    table.close()
+    obs = ephem.Observer()
+    obs.lat = LATITUDE
+    obs.lon = LONGITUDE
+    obs.date = datetime.datetime(2026, 6, 1, 4, 0)  # local noon
+    obs.horizon = "-12"
+    expected_dusk = obs.next_setting(ephem.Sun(), use_center=True).datetime()
+    expected_dawn = obs.next_rising(ephem.Sun(), use_center=True).datetime()
+    utc = datetime.timezone.utc
+    assert abs(dusk - expected_dusk.replace(tzinfo=utc)).total_seconds() < 1
+    assert abs(dawn - expected_dawn.replace(tzinfo=utc)).total_seconds() < 1
+    assert dusk.date() == datetime.date(2026, 6, 1) and dusk < dawn
+
+
+def test_stored_nights_are_not_recomputed(table_file, monkeypatch):
+    table = seestar_ephemeris.EphemerisTable(
+        LATITUDE, LONGITUDE, table_file=table_file, prefetch=3
+    )
+    expected = [table.night(NIGHT + datetime.timedelta(days=i)) for i in range(3)]
+    table.close()
+
+    def compute_night(self, night):
+        raise AssertionError(f"{night} recomputed")
+
+    monkeypatch.setattr(
+        seestar_ephemeris.EphemerisTable, "compute_night", compute_night
+    )
+    table = seestar_ephemeris.EphemerisTable(
+        LATITUDE, LONGITUDE, table_file=table_file, prefetch=3
+    )
+    assert [table.night(NIGHT + datetime.timedelta(days=i)) for i in range(3)] == (
+        expected
+    )
+    table.close()
+    # another site shares the file but not the nights
+    other = seestar_ephemeris.EphemerisTable(
+        "51:28:38", "0:00:00", table_file=table_file, prefetch=1
+    )
+    with pytest.raises(AssertionError):
+        other.night(NIGHT)
+    other.close()
+
+
+def test_no_twilight_raises(table_file):
+    # no nautical twilight in the arctic midsummer
+    table = seestar_ephemeris.EphemerisTable(
+        "78:13:00", "15:38:00", table_file=table_file, prefetch=1
+    )
+    assert table.night(NIGHT)["nautical_dusk"] is None
+    with pytest.raises(RuntimeError):
+        table.twilight(NIGHT, "nautical")
+    table.close()
+
+
+def test_night_changes_over_at_local_noon():
+    longitude = seestar_visibility.parse_sexagesimal(LONGITUDE)
+    # local mean noon is about 02:04 UTC
+    before = datetime.datetime(2026, 6, 2, 1, 50, tzinfo=datetime.timezone.utc)
+    after = datetime.datetime(2026, 6, 2, 2, 20, tzinfo=datetime.timezone.utc)
+    assert seestar_ephemeris.night_of(before, longitude) == NIGHT
+    assert seestar_ephemeris.night_of(after, longitude) == datetime.date(2026, 6, 2)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+import seestar_exposure
+
+
+def test_saturation_boundary():
+    # a 10 s sub saturates at 8.5 mag, a 20 s sub 2.5 log10(2) mag fainter
+    plan = seestar_exposure.plan_exposures([8.5, 8.55, 9.25, 9.3], margin=0)
+    assert list(plan["status"]) == ["saturated", "ok", "ok", "ok"]
+    assert list(plan["exptime"]) == [10.0, 10.0, 10.0, 20.0]
+    # the margin keeps a target that may brighten out of saturation
+    plan = seestar_exposure.plan_exposures([9.0, 9.05])
+    assert list(plan["status"]) == ["saturated", "ok"]
+    assert list(plan["exptime"]) == [10.0, 10.0]
+
+
+def test_totals_from_snr_goal():
+    mags = [11.0, 15.0, 17.5, np.nan]
+    plan = seestar_exposure.plan_exposures(mags, max_total=[3600, 3600, 600, 600])
+    assert list(plan["status"]) == ["ok", "ok", "faint", "unknown"]
+    assert list(plan["exptime"][:3]) == [60.0, 60.0, 60.0]
+    # a bright target still gets the fewest subs, a faint one the most time
+    assert plan["subs"][0] == seestar_exposure.MIN_SUBS
+    assert plan["total"][2] == 600.0
+    assert plan["snr"][1] >= seestar_exposure.GOAL_SNR
+    one_fewer = seestar_exposure.sub_snr(15.0, 60.0) * np.sqrt(plan["subs"][1] - 1)
+    assert one_fewer < seestar_exposure.GOAL_SNR
+    assert plan["total"][1] == plan["subs"][1] * 60.0
+
+
+def test_table_is_computed_once():
+    snr, saturated = seestar_exposure.exposure_table()
+    assert seestar_exposure.exposure_table()[0] is snr
+    assert (
+        snr.shape
+        == saturated.shape
+        == (
+            len(seestar_exposure.MAG_GRID),
+            len(seestar_exposure.EXPOSURES),
+        )
+    )
+    # brighter stars and longer subs have more signal
+    assert np.all(np.diff(snr, axis=0) < 0) and np.all(np.diff(snr, axis=1) > 0)
+    with pytest.raises(ValueError):
+        snr[0, 0] = 0
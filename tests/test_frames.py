@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+import seestar_frames
+
+
+class GrowingSource(seestar_frames.DirectorySource):
+    """A folder whose first sub is still being written when it is listed."""
+
+    def __init__(self, root, tail):
+        super().__init__(root)
+        self.tail = tail
+
+    def list(self, folder):
+        frames = super().list(folder)
+        if self.tail:
+            with open(os.path.join(self.root, folder, frames[0]["name"]), "ab") as f:
+                f.write(self.tail)
+            self.tail = None
+        return frames
+
+
+@pytest.fixture
+def unit(tmp_path):
+    folder = tmp_path / "unit" / "T_sub"
+    folder.mkdir(parents=True)
+    for i in range(2):
+        (folder / f"Light_{i}.fit").write_bytes(bytes([i]) * 1000)
+    return folder
+
+
+def retriever(source, tmp_path, handed):
+    return seestar_frames.FrameRetriever(
+        source,
+        str(tmp_path / "frames"),
+        bandwidth=None,
+        on_frame=lambda target, path: handed.append(path),
+    )
+
+
+def test_sub_still_being_written_is_copied_whole(unit, tmp_path):
+    handed = []
+    source = GrowingSource(str(unit.parent), b"\1" * 500)
+    with retriever(source, tmp_path, handed) as frames:
+        frames.retrieve("T")
+    for sub in unit.iterdir():
+        copy = tmp_path / "frames" / "T_sub" / sub.name
+        assert copy.read_bytes() == sub.read_bytes()
+    assert frames.stats()["failed"] == 0
+    assert len(handed) == 2
+
+
+def test_subs_written_after_the_listing_are_copied(unit, tmp_path):
+    handed = []
+    source = seestar_frames.DirectorySource(str(unit.parent))
+    with retriever(source, tmp_path, handed) as frames:
+        frames.retrieve("T")
+        frames.wait()
+        (unit / "Light_2.fit").write_bytes(b"\2" * 1000)
+    assert (tmp_path / "frames" / "T_sub" / "Light_2.fit").exists()
+    assert len(handed) == 3
+
+
+def test_frames_are_handed_off_once(unit, tmp_path):
+    handed = []
+    source = seestar_frames.DirectorySource(str(unit.parent))
+    with retriever(source, tmp_path, handed) as frames:
+        frames.retrieve("T")
+        frames.wait()
+        frames.retrieve("T")
+    assert sorted(handed) == sorted(set(handed))
+    assert len(handed) == 2
+    # a new retriever, e.g. after a restart, hands the local frames off again
+    with retriever(source, tmp_path, handed) as frames:
+        frames.retrieve("T")
+    assert len(handed) == 4
+    assert frames.stats()["skipped"] == 2
@@ -0,0 +1,41 @@
+import json
+
+import seestar_run
+
+
+def test_frames_split_across_reads():
+    frames = seestar_run.FrameBuffer(size=16, min_read=4)
+    stream = (json.dumps({"Event": "PiStatus", "temp": "35°"}) + "\r\n") * 3
+    data = stream.encode()
+    received = []
+    # one byte at a time splits the CRLF and the two byte degree sign
+    for i in range(len(data)):
+        frames.feed(data[i : i + 1])
+        received.extend(frames.frames())
+    assert [json.loads(frame) for frame in received] == [
+        {"Event": "PiStatus", "temp": "35°"}
+    ] * 3
+    assert frames.dropped == 0
+
+
+def test_partial_frame_kept_until_complete():
+    frames = seestar_run.FrameBuffer()
+    frames.feed(b'{"id": 1}\r\n{"id"')
+    assert list(frames.frames()) == ['{"id": 1}']
+    frames.feed(b": 2}\r")
+    assert list(frames.frames()) == []
+    frames.feed(b"\n")
+    assert list(frames.frames()) == ['{"id": 2}']
+    frames.feed(b'{"id": 3')
+    frames.reset()
+    frames.feed(b'{"id": 4}\r\n')
+    assert list(frames.frames()) == ['{"id": 4}']
+
+
+def test_long_frame_dropped():
+    frames = seestar_run.FrameBuffer(size=16, max_frame=32, min_read=4)
+    frames.feed(b"x" * 100)
+    assert list(frames.frames()) == []
+    frames.feed(b"x" * 100 + b'\r\n{"id": 5}\r\n')
+    assert list(frames.frames()) == ['{"id": 5}']
+    assert frames.dropped == 1
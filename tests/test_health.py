@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import seestar_health
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_round_trip_times(clock):
+    health = seestar_health.LinkHealth(clock=clock)
+    for cmdid, rtt in zip(range(1, 6), [0.1, 0.3, 0.2, 0.5, 0.4]):
+        health.sent(cmdid, "test_connection")
+        clock.now += rtt
+        assert health.received({"id": cmdid, "result": 0}) == pytest.approx(rtt)
+    # an event and an unknown reply are not round trips
+    assert health.received({"Event": "PiStatus"}) is None
+    assert health.received({"id": 99}) is None
+    stats = health.stats()
+    assert stats["count"] == stats["replies"] == 5
+    assert stats["p50"] == pytest.approx(0.3)
+    assert stats["p99"] == pytest.approx(np.percentile([0.1, 0.3, 0.2, 0.5, 0.4], 99))
+    assert stats["jitter"] == pytest.approx((0.2 + 0.1 + 0.3 + 0.1) / 4)
+    assert "rtt p50 300.0 ms" in health.summary()
+
+
+def test_keepalive_only_when_idle(clock):
+    health = seestar_health.LinkHealth(idle_interval=5, clock=clock)
+    clock.now += 4
+    assert not health.keepalive_due()
+    health.received({"Event": "PiStatus"})
+    clock.now += 4
+    assert not health.keepalive_due()
+    clock.now += 1
+    assert health.keepalive_due()
+
+
+def test_stall_needs_silence_and_a_waiting_request(clock):
+    health = seestar_health.LinkHealth(stall_timeout=15, clock=clock)
+    clock.now += 60
+    assert not health.stalled()  # quiet, but nothing is waiting
+    health.sent(1, "scope_goto")
+    clock.now += 10
+    health.received({"Event": "PiStatus"})
+    clock.now += 10
+    assert not health.stalled()  # events still arriving
+    clock.now += 10
+    assert health.stalled() and health.stalled()
+    assert health.stats()["stalls"] == 1
+    health.received({"id": 1})
+    assert not health.stalled()
+
+
+def test_expire_and_reset_count_lost_requests(clock):
+    health = seestar_health.LinkHealth(stall_timeout=15, clock=clock)
+    health.sent(1, "scope_goto")
+    clock.now += 30
+    health.sent(2, "get_device_state")
+    clock.now += 31
+    health.expire()
+    assert health.stats()["pending"] == 1 and health.stats()["lost"] == 1
+    health.reset()
+    stats = health.stats()
+    assert stats["pending"] == 0 and stats["lost"] == 2
+    assert health.received({"id": 2}) is None
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import seestar_manifest
+
+DEMO = os.path.join(os.path.dirname(__file__), os.pardir, "demo_targets.dat")
+
+
+def read_three_pass(file):
+    """The sections of a manifest as seestar_schedule used to read them."""
+    with open(file, "r") as f:
+        lines = f.readlines()
+    start = next(i for i, line in enumerate(lines) if line.startswith("Name"))
+    targets = pd.read_csv(file, skiprows=start)
+    targets.columns = lines[start].replace(" ", "").strip().split(",")
+    sections = {}
+    for section in ("Observatory", "Config"):
+        first = next(i for i, line in enumerate(lines) if line.startswith(section))
+        values = {}
+        for line in lines[first + 1 :]:
+            if line.startswith(("Config", "Targets")) or line.strip() == "":
+                break
+            key, value = line.split(":", 1)
+            values[key.strip()] = value.strip()
+        sections[section] = values
+    return sections["Observatory"], sections["Config"], targets
+
+
+def test_demo_matches_three_pass_reader():
+    manifest = seestar_manifest.read_manifest(DEMO)
+    site, config, targets = read_three_pass(DEMO)
+    assert manifest.site == site
+    assert {key: str(value) for key, value in manifest.config.items()} == config
+    assert manifest.config["Repeat_Targets"] is True
+    assert list(manifest.targets) == list(targets.columns)
+    assert len(manifest) == len(targets)
+    for name in targets.columns:
+        column = manifest.targets[name]
+        if name == "Name":
+            assert list(column) == [value.strip() for value in targets[name]]
+        else:
+            assert column.dtype == np.int64
+            np.testing.assert_array_equal(column, targets[name])
+
+
+def test_plain_csv_target_list(tmp_path):
+    path = tmp_path / "targets.csv"
+    path.write_text('Name,ExpTime,TotalExp\n"R Car, 2", 10, 600\n1234, 2.5, 300\n\n')
+    manifest = seestar_manifest.read_manifest(str(path))
+    assert manifest.site == {} and manifest.config == {}
+    assert list(manifest.targets["Name"]) == ["R Car, 2", "1234"]
+    assert manifest.targets["ExpTime"].dtype == np.float64
+    selected = manifest.select(manifest.targets["TotalExp"] > 400)
+    assert list(selected.targets["Name"]) == ["R Car, 2"]
+
+
+def test_bad_rows_rejected(tmp_path):
+    path = tmp_path / "targets.dat"
+    path.write_text("Config\nRepeat_Targets True\n")
+    with pytest.raises(ValueError, match=":2:"):
+        seestar_manifest.read_manifest(str(path))
+    path.write_text("Targets\nName, ExpTime\nM42, 20, 30\n")
+    with pytest.raises(ValueError, match="row 1"):
+        seestar_manifest.read_manifest(str(path))
@@ -0,0 +1,96 @@
+import csv
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+import seestar_photometry
+
+SIGMA = 1.5
+SKY = 100.0
+# the role, x, y, total flux in ADU and catalogue magnitude of each star, in
+# the order of a StarSet
+STARS = [
+    ("target", 50, 50, 10000.0, np.nan),
+    ("check", 150, 150, 10000.0, np.nan),
+    ("comp", 120, 60, 40000.0, 10.0),
+    ("comp", 70, 140, 20000.0, 10.0 + 2.5 * np.log10(2)),
+    # bright enough to saturate, with a magnitude that would spoil the zero point
+    ("comp", 30, 160, 1.5e6, 5.0),
+]
+TARGET_MAG = 10.0 + 2.5 * np.log10(4)
+
+
+@pytest.fixture
+def frame(tmp_path):
+    yy, xx = np.mgrid[0:200, 0:200]
+    data = np.full((200, 200), SKY)
+    for _, x, y, flux, _ in STARS:
+        r2 = (xx - x) ** 2 + (yy - y) ** 2
+        data += flux / (2 * np.pi * SIGMA**2) * np.exp(-r2 / (2 * SIGMA**2))
+    header = fits.Header()
+    header["EXPTIME"] = 10.0
+    header["DATE-OBS"] = "2026-06-01T10:00:00"
+    path = tmp_path / "Light_SS_Cyg_0001.fit"
+    fits.PrimaryHDU(data.astype(np.float32), header).writeto(path)
+    return str(path)
+
+
+@pytest.fixture
+def stars():
+    role, x, y, _, mag = zip(*STARS)
+    # nudge the given positions off the star centres, centring finds them
+    x = np.array(x) + 1.3
+    y = np.array(y) - 0.8
+    return seestar_photometry.StarSet(
+        np.zeros(len(role)), np.zeros(len(role)), mag, role, None, x, y
+    )
+
+
+def test_differential_magnitudes(stars, frame, tmp_path):
+    with seestar_photometry.PhotometryPipeline(
+        {"SS Cyg": stars}, directory=str(tmp_path / "photometry")
+    ) as pipeline:
+        row = pipeline.submit("SS Cyg", frame).result()
+        assert pipeline.process("SS Cyg", frame) is None
+    assert float(row["mag"]) == pytest.approx(TARGET_MAG, abs=0.005)
+    assert float(row["check_mag"]) == pytest.approx(TARGET_MAG, abs=0.005)
+    assert row["comps"] == 2 and row["flags"] == ""
+    assert row["time"].startswith("2026-06-01T10:00:05")
+    assert np.allclose(
+        pipeline.positions["SS Cyg"][0][:4], [50, 150, 120, 70], atol=0.05
+    )
+    with open(pipeline.lightcurve_file("SS Cyg"), newline="") as f:
+        assert [r["file"] for r in csv.DictReader(f)] == ["Light_SS_Cyg_0001.fit"]
+    assert pipeline.measured == 1 and pipeline.skipped == 1
+
+
+def test_no_usable_comparisons(stars):
+    photometry = {
+        "flux": np.array([1e4, 1e4, 4e4, 2e4, 1e6]),
+        "flux_err": np.full(5, 100.0),
+        "peak": np.array([1e3, 1e3, 7e4, 7e4, 7e4]),
+        "edge": np.array([False, False, False, False, False]),
+    }
+    result = seestar_photometry.differential(stars, photometry, 10.0)
+    assert np.isnan(result["mag"]) and result["flags"] == ["no_comps"]
+    photometry["peak"][3] = 1e3
+    photometry["edge"][0] = True
+    result = seestar_photometry.differential(stars, photometry, 10.0)
+    assert result["comps"] == 1 and result["flags"] == ["edge"]
+
+
+def test_read_comparisons(tmp_path):
+    path = tmp_path / "comps.csv"
+    path.write_text(
+        "Target,Star,RA,Dec,Mag,Role,X,Y\n"
+        "SS Cyg,000-BCP-306,325.59,43.53,10.45,comp,,\n"
+        "SS Cyg,SS Cyg,21:42:42.8,+43:35:10,,target,,\n"
+    )
+    stars = seestar_photometry.read_comparisons(str(path))["SS Cyg"]
+    assert list(stars.role) == ["target", "comp"]
+    assert stars.ra[0] == pytest.approx(325.678, abs=0.001)
+    assert stars.dec[0] == pytest.approx(43.586, abs=0.001)
+    path.write_text("Target,Star,RA,Dec,Mag,Role\nSS Cyg,x,1,2,3,comp\n")
+    with pytest.raises(ValueError):
+        seestar_photometry.read_comparisons(str(path))
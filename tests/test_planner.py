@@ -0,0 +1,75 @@
+import datetime
+import time
+
+import numpy as np
+import pytest
+
+import seestar_planner
+import seestar_visibility
+
+LATITUDE = "-35:36:00"
+LONGITUDE = "149:01:45"
+DUSK = datetime.datetime(2026, 6, 1, 8, 0, tzinfo=datetime.timezone.utc)
+# not a whole number of grid steps, so the last grid time is after dawn
+DAWN = DUSK + datetime.timedelta(hours=10, seconds=100)
+NIGHT = (DAWN - DUSK).total_seconds()
+
+
+def circumpolar_grid():
+    # up all night from the site
+    return seestar_visibility.VisibilityGrid(
+        [0.0], [-89.0], LATITUDE, LONGITUDE, DUSK, DAWN
+    )
+
+
+@pytest.mark.parametrize("solver", sorted(seestar_planner.SOLVERS))
+def test_solvers_finish_by_dawn(solver):
+    grid = circumpolar_grid()
+    assert grid.times[-1] > DAWN.timestamp()
+    plan = seestar_planner.SOLVERS[solver]
+    assert plan(grid, [NIGHT + 100], [0]) == []
+    assert [target for target, _ in plan(grid, [NIGHT], [0])] == [0]
+
+
+@pytest.fixture(scope="module")
+def sky_grid():
+    rng = np.random.default_rng(1)
+    count = 500
+    ra = rng.uniform(0, 360, count)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, count)))
+    grid = seestar_visibility.VisibilityGrid(ra, dec, LATITUDE, LONGITUDE, DUSK, DAWN)
+    exposures = rng.choice([300, 600, 1200, 1800, 3600], count).astype(float)
+    return grid, exposures, np.full(count, 30.0)
+
+
+@pytest.mark.parametrize("solver", sorted(seestar_planner.SOLVERS))
+def test_replan_500_targets_within_a_second(sky_grid, solver):
+    grid, exposures, pauses = sky_grid
+    replanner = seestar_planner.Replanner(
+        grid, exposures, pauses, repeat=True, solver=solver
+    )
+    plan = seestar_planner.SOLVERS[solver](grid, exposures, pauses, repeat=True)
+    for target, _ in plan[: len(plan) // 2]:
+        replanner.completed(target)
+    t0 = time.perf_counter()
+    replanner.replan(grid.times[len(grid.times) // 2])
+    assert time.perf_counter() - t0 < 1.0
+
+
+@pytest.mark.parametrize("solver", sorted(seestar_planner.SOLVERS))
+def test_replan_skips_dropped_targets_and_starts_from_now(sky_grid, solver):
+    grid, exposures, pauses = sky_grid
+    replanner = seestar_planner.Replanner(grid, exposures, pauses, solver=solver)
+    now = grid.times[0]
+    plan = replanner.replan(now)
+    observed, dropped = plan[0][0], plan[1][0]
+    replanner.completed(observed)
+    for _ in range(replanner.max_attempts):
+        replanner.failed(dropped)
+    # the first observation overran by an hour
+    now += exposures[observed] + 3600
+    replan = replanner.replan(now)
+    assert replan
+    targets = [target for target, _ in replan]
+    assert observed not in targets and dropped not in targets
+    assert min(start for _, start in replan) >= now
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import time
+
+
+import seestar_run
+import seestar_timing
+from seestar_bench import emulated_seestar
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("condition not met")
+        time.sleep(0.01)
+
+
+def drop_connections(emulator):
+    """Close every client connection of the emulator from its event loop."""
+    loop = emulator.server.get_loop()
+
+    async def close_all():
+        for connection in list(emulator.connections):
+            connection.close()
+
+    asyncio.run_coroutine_threadsafe(close_all(), loop).result()
+
+
+def test_goto_replayed_after_drop(fast_session):
+    # each reply takes a while, so the goto is still waiting for its own
+    # when the link drops
+    with emulated_seestar(slew_time=0.2, settle_time=0.1, reply_delay=0.3) as emulator:
+        session = seestar_run.SeestarSession(
+            "127.0.0.1",
+            emulator.port,
+            idle_interval=0.5,
+            stall_timeout=10,
+            timing=seestar_timing.TimingRecorder(None),
+        )
+        session.connect()
+        errors = []
+
+        def observe():
+            try:
+                session.observe("DROP", 10.0, -20.0, 1, 0)
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=observe)
+        try:
+            thread.start()
+
+            def goto_in_flight():
+                with session.in_flight_lock:
+                    methods = [d["method"] for d in session.in_flight.values()]
+                return "iscope_start_view" in methods
+
+            wait_for(goto_in_flight)
+            drop_connections(emulator)
+            thread.join(timeout=20)
+        finally:
+            session.close()
+        assert not thread.is_alive()
+        assert errors == []
+        assert len(session.recovery_times) == 1
+        # the first retry waits at most RECONNECT_BASE, then resync is one round trip
+        assert max(session.recovery_times) < 1.0
+        # the goto was sent again on the new connection and answered there,
+        # observe() only waits for the slew once the goto has its reply
+        assert emulator.gotos == 1
+        assert session.op_state == "complete"
+        goto = [s for s in session.timing.spans if s["span"] == "goto"]
+        assert goto[0]["status"] == "ok"
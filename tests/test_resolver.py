@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+import pytest
+
+import seestar_resolver
+
+
+@pytest.fixture
+def resolver(tmp_path, monkeypatch):
+    queries = []
+
+    def query_simbad(names):
+        queries.append(list(names))
+        return {name: (83.82, -5.39) for name in names if name == "M42"}
+
+    monkeypatch.setattr(seestar_resolver, "query_simbad", query_simbad)
+    resolver = seestar_resolver.SimbadResolver(str(tmp_path / "cache.db"))
+    resolver.queries = queries
+    yield resolver
+    resolver.close()
+
+
+def test_cache_hit_does_not_query(resolver):
+    resolver.store({"eta Car": (161.27, -59.68)})
+    ra, dec = resolver.resolve(["ETA  car", "eta Car"])
+    assert resolver.queries == []
+    np.testing.assert_allclose(ra, [161.27, 161.27])
+    np.testing.assert_allclose(dec, [-59.68, -59.68])
+
+
+def test_misses_queried_once_and_cached(resolver):
+    resolver.store({"eta Car": (161.27, -59.68)})
+    ra, dec = resolver.resolve(["M42", "eta Car", "m42", "nonsense"])
+    assert resolver.queries == [["M42", "nonsense"]]
+    np.testing.assert_allclose(ra[:3], [83.82, 161.27, 83.82])
+    assert np.isnan(ra[3]) and np.isnan(dec[3])
+    resolver.resolve(["M42"])
+    assert len(resolver.queries) == 1
+    # a new resolver on the same file still has it
+    cached = seestar_resolver.SimbadResolver(resolver.cache_file, offline=True)
+    assert cached.lookup(["m 42", "M42"]) == {"m42": (83.82, -5.39)}
+    cached.close()
+
+
+def test_stale_entries_used_only_offline(resolver, monkeypatch):
+    resolver.store({"M42": (83.82, -5.39)})
+    later = time.time() + resolver.ttl + 1
+    monkeypatch.setattr(seestar_resolver.time, "time", lambda: later)
+    resolver.resolve(["M42"])
+    assert resolver.queries == [["M42"]]
+    offline = seestar_resolver.SimbadResolver(resolver.cache_file, offline=True)
+    ra, _ = offline.resolve(["M42", "nonsense"])
+    assert ra[0] == pytest.approx(83.82) and np.isnan(ra[1])
+    assert len(resolver.queries) == 1
+    offline.close()
@@ -0,0 +1,143 @@
+import datetime
+import io
+import json
+
+import numpy as np
+import pytest
+import pytz
+
+import seestar_schedule_table
+
+TZ = pytz.timezone("America/New_York")
+START = datetime.datetime(2026, 6, 1, 1, 30, tzinfo=datetime.timezone.utc)
+TARGETS = {
+    "Name": np.array(["SS Cyg", "T CrB", "RS Oph"], dtype=object),
+    "ra": np.array(["21:42:42.8", "15:59:30.2", "17:50:13.2"], dtype=object),
+    "dec": np.array(["+43:35:09.9", "+25:55:12.6", "-06:42:28.5"], dtype=object),
+    "ExpTime": np.array([10, 20, 10]),
+    "TotalExp": np.array([600, 1200, 300]),
+    "Pause": np.array([30, 0, 60]),
+}
+
+
+def make_table():
+    table = seestar_schedule_table.ScheduleTable(
+        TARGETS["Name"],
+        TARGETS["ra"],
+        TARGETS["dec"],
+        TARGETS["ExpTime"],
+        TARGETS["TotalExp"],
+        TARGETS["Pause"],
+        TZ,
+    )
+    start = START.timestamp()
+    table.append("wait_until", start=start)
+    table.append("start_up_sequence", start=start)
+    for i in range(len(TARGETS["Name"])):
+        table.add_target(i, start)
+        start += TARGETS["TotalExp"][i] + TARGETS["Pause"][i]
+    return table
+
+
+def old_schedule(item_ids):
+    """The schedule as create_schedule built it before ScheduleTable."""
+    ids = iter(item_ids)
+    schedule = {}
+    schedule["version"] = 1.0
+    schedule["Event"] = "Scheduler"
+    schedule["schedule_id"] = "schedule"
+    schedule["list"] = []
+    wait_until_item = {}
+    wait_until_item["action"] = "wait_until"
+    wait_until_item["params"] = {}
+    wait_until_item["params"]["local_time"] = START.astimezone(TZ).strftime("%H:%M")
+    wait_until_item["schedule_item_id"] = next(ids)
+    schedule["list"].append(wait_until_item)
+    start_up_sequence = {}
+    start_up_sequence["action"] = "start_up_sequence"
+    start_up_sequence["params"] = {}
+    start_up_sequence["params"]["auto_focus"] = True
+    start_up_sequence["params"]["dark_frames"] = True
+    start_up_sequence["params"]["3ppa"] = True
+    start_up_sequence["params"]["raise_arm"] = True
+    start_up_sequence["schedule_item_id"] = next(ids)
+    schedule["list"].append(start_up_sequence)
+    for i in range(len(TARGETS["Name"])):
+        set_exposure_time = {}
+        set_exposure_time["action"] = "action_set_exposure"
+        set_exposure_time["params"] = {}
+        set_exposure_time["params"]["exp"] = TARGETS["ExpTime"][i] * 1000
+        set_exposure_time["schedule_item_id"] = next(ids)
+        schedule["list"].append(set_exposure_time)
+        schedule_item = {}
+        schedule_item["action"] = "start_mosaic"
+        schedule_item["params"] = {}
+        schedule_item["params"]["target_name"] = TARGETS["Name"][i]
+        schedule_item["params"]["is_j2000"] = True
+        schedule_item["params"]["ra"] = TARGETS["ra"][i]
+        schedule_item["params"]["dec"] = TARGETS["dec"][i]
+        schedule_item["params"]["is_use_lp_filter"] = False
+        schedule_item["params"]["panel_time_sec"] = TARGETS["TotalExp"][i]
+        schedule_item["params"]["ra_num"] = 1
+        schedule_item["params"]["dec_num"] = 1
+        schedule_item["params"]["panel_overlap_percent"] = 100
+        schedule_item["params"]["selected_panels"] = ""
+        schedule_item["params"]["gain"] = 80
+        schedule_item["params"]["is_use_autofocus"] = False
+        schedule_item["params"]["num_tries"] = 3
+        schedule_item["params"]["retry_wait_s"] = 10
+        schedule_item["schedule_item_id"] = next(ids)
+        schedule["list"].append(schedule_item)
+        if TARGETS["Pause"][i] > 0:
+            wait_item = {}
+            wait_item["action"] = "wait_for"
+            wait_item["params"] = {}
+            wait_item["params"]["timer_sec"] = TARGETS["Pause"][i]
+            wait_item["schedule_item_id"] = next(ids)
+            schedule["list"].append(wait_item)
+    schedule["state"] = "stopped"
+    schedule["is_stacking_paused"] = False
+    schedule["is_stacking"] = False
+    schedule["is_skip_requested"] = False
+    schedule["current_item_id"] = ""
+    schedule["item_number"] = 0
+    return schedule
+
+
+def numpy_default(x):
+    return int(x) if isinstance(x, (np.integer, np.int64)) else x
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_write_json_matches_old_dump(compact):
+    table = make_table()
+    ids = [f"item-{i}" for i in range(len(table))]
+    f = io.StringIO()
+    table.write_json(f, compact, "schedule", iter(ids))
+    expected = io.StringIO()
+    if compact:
+        json.dump(
+            old_schedule(ids), expected, separators=(",", ":"), default=numpy_default
+        )
+    else:
+        json.dump(old_schedule(ids), expected, indent=4, default=numpy_default)
+    assert f.getvalue() == expected.getvalue()
+
+
+def test_write_json_empty_schedule():
+    table = seestar_schedule_table.ScheduleTable([], [], [], [], [], [], TZ)
+    f = io.StringIO()
+    table.write_json(f, schedule_id="schedule")
+    schedule = {
+        "version": 1.0,
+        "Event": "Scheduler",
+        "schedule_id": "schedule",
+        "list": [],
+        "state": "stopped",
+        "is_stacking_paused": False,
+        "is_stacking": False,
+        "is_skip_requested": False,
+        "current_item_id": "",
+        "item_number": 0,
+    }
+    assert f.getvalue() == json.dumps(schedule, indent=4)
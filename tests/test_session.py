@@ -0,0 +1,19 @@
+import pytest
+
+import seestar_run
+import seestar_timing
+from seestar_bench import emulated_seestar
+
+
+def test_goto_timeout_fails_target(fast_session, monkeypatch):
+    monkeypatch.setattr(seestar_run, "GOTO_TIMEOUT", 0.2)
+    with emulated_seestar(slew_time=5, settle_time=0) as emulator:
+        timing = seestar_timing.TimingRecorder(None)
+        with seestar_run.SeestarSession(
+            "127.0.0.1", emulator.port, timing=timing
+        ) as session:
+            with pytest.raises(RuntimeError):
+                session.observe("SLOW", 10.0, -20.0, 1, 0)
+            assert session.op_state == "timeout"
+    status = {s["span"]: s["status"] for s in timing.spans}
+    assert status == {"goto": "timeout", "settle": "ok", "target": "goto_failed"}
@@ -0,0 +1,45 @@
+import logging
+
+import seestar_fleet
+import seestar_timing
+
+
+def span(name, start, end, **fields):
+    return {
+        "span": name,
+        "start": start,
+        "end": end,
+        "duration": end - start,
+        "status": "ok",
+        **fields,
+    }
+
+
+def test_fleet_efficiency_counts_every_unit():
+    spans = []
+    for unit in ("S50-1", "S50-2"):
+        spans.append(span("goto", 0, 100, unit=unit))
+        spans.append(span("stack", 100, 1000, unit=unit, requested=900))
+        spans.append(span("target", 0, 1000, unit=unit))
+    summary = seestar_timing.night_summary(spans)
+    assert summary["units"] == 2
+    assert summary["efficiency"] == 0.9
+    assert summary["overhead_s"] == 0
+    assert summary["targets_observed"] == 2
+
+
+def test_single_unit_efficiency():
+    spans = [span("goto", 0, 100), span("stack", 100, 500), span("target", 0, 1000)]
+    summary = seestar_timing.night_summary(spans)
+    assert summary["units"] == 1
+    assert summary["efficiency"] == 0.4
+
+
+def test_unit_sessions_log_through_the_dispatcher_logger():
+    logger = logging.getLogger("seestar_varstar")
+    dispatcher = seestar_fleet.FleetDispatcher(
+        [{"name": "S50-1", "ip": "127.0.0.1", "port": 4700}], logger
+    )
+    session = dispatcher.make_session(dispatcher.units[0])
+    assert session.logger.name == "seestar_varstar.S50-1"
+    assert session.logger.parent is logger
@@ -0,0 +1,60 @@
+import datetime
+
+import ephem
+import numpy as np
+import pytest
+
+import seestar_visibility
+
+LATITUDE = "-35:36:00"
+LONGITUDE = "149:01:45"
+DUSK = datetime.datetime(2026, 6, 1, 8, 0, tzinfo=datetime.timezone.utc)
+DAWN = DUSK + datetime.timedelta(hours=10)
+# SS Cyg, eta Car, M8, NGC 5128 and a star near the south pole
+RA = [325.68, 161.27, 270.90, 201.37, 0.0]
+DEC = [43.59, -59.68, -24.38, -43.02, -89.0]
+
+
+def ephem_altaz(ra, dec, when):
+    """The altitude and azimuth from pyephem, as create_schedule computed them."""
+    obs = ephem.Observer()
+    obs.lat = LATITUDE
+    obs.lon = LONGITUDE
+    obs.pressure = 0  # no refraction
+    obs.date = when
+    target = ephem.FixedBody()
+    target._ra = np.radians(ra)
+    target._dec = np.radians(dec)
+    target.compute(obs)
+    return np.degrees(target.alt), np.degrees(target.az)
+
+
+def separation(alt1, az1, alt2, az2):
+    """The angle in degrees between two altitude and azimuth positions."""
+    alt1, az1, alt2, az2 = np.radians([alt1, az1, alt2, az2])
+    cos = np.sin(alt1) * np.sin(alt2) + np.cos(alt1) * np.cos(alt2) * np.cos(az1 - az2)
+    return np.degrees(np.arccos(np.clip(cos, -1, 1)))
+
+
+def test_grid_matches_pyephem():
+    grid = seestar_visibility.VisibilityGrid(RA, DEC, LATITUDE, LONGITUDE, DUSK, DAWN)
+    assert len(grid.times) == 121
+    for target in range(len(RA)):
+        for i in range(0, len(grid.times), 10):
+            when = datetime.datetime.fromtimestamp(grid.times[i], datetime.timezone.utc)
+            alt, az = ephem_altaz(RA[target], DEC[target], when)
+            # J2000 without precession is within a few tenths of a degree
+            assert grid.alt[target, i] == pytest.approx(alt, abs=0.5)
+            assert separation(grid.alt[target, i], grid.az[target, i], alt, az) < 0.5
+
+
+def test_subset_and_lookup():
+    grid = seestar_visibility.VisibilityGrid(RA, DEC, LATITUDE, LONGITUDE, DUSK, DAWN)
+    subset = grid.subset([3, 1])
+    np.testing.assert_array_equal(subset.alt, grid.alt[[3, 1]])
+    assert subset.times is grid.times
+    # a lookup rounds to the nearest grid time and clips to the night
+    when = DUSK + datetime.timedelta(seconds=grid.step * 3 + 100)
+    assert grid.altaz(1, when) == (float(grid.alt[1, 3]), float(grid.az[1, 3]))
+    assert grid.index(DAWN + datetime.timedelta(hours=2)) == len(grid.times) - 1
+    assert grid.index(DUSK.timestamp() - 3600) == 0